@@ -6,12 +6,16 @@ import json
 import os.path
 import pathlib
 import sys
+import time
 import unittest
 from io import StringIO
 from typing import NoReturn
 
 
 import Unittest as Tests
+from EntranceShuffle import EntranceShuffleError
+from Fill import ShuffleError
+from Main import resolve_settings, build_world_graphs, place_items
 from SettingsList import SettingInfos, logic_tricks, validate_settings
 from Utils import data_path
 
@@ -40,6 +44,36 @@ def run_unit_tests() -> None:
         error('Unit Tests had an error, see output above.', False)
 
 
+def benchmark_fill(seeds: int = 3) -> None:
+    # Time the fill of every test settings file with each fill engine, over the same worlds.
+    # Seeds whose entrances fail to shuffle never reach the fill, so they are left out for both engines.
+    engines = ('search', 'incremental')
+    totals = dict.fromkeys(engines, 0.0)
+    for filename in sorted(os.listdir(Tests.test_dir)):
+        if not filename.endswith('.sav'):
+            continue
+        times = dict.fromkeys(engines, 0.0)
+        for seed in range(seeds):
+            for engine in engines:
+                settings = Tests.load_settings(filename, seed=f'BENCHMARK{seed}')
+                settings.fill_engine = engine
+                resolve_settings(settings)
+                try:
+                    worlds = build_world_graphs(settings)
+                except EntranceShuffleError:
+                    break
+                start = time.perf_counter()
+                try:
+                    place_items(worlds)
+                except ShuffleError:
+                    pass
+                times[engine] += time.perf_counter() - start
+        print(f'{filename:28}' + ''.join(f'{engine} {times[engine]:7.2f}s  ' for engine in engines))
+        for engine in engines:
+            totals[engine] += times[engine]
+    print(f'{"Total":28}' + ''.join(f'{engine} {totals[engine]:7.2f}s  ' for engine in engines))
+
+
 def check_presets_formatting(fix_errors: bool = False) -> None:
     # Check the code style of presets_default.json
     with open(data_path('presets_default.json'), encoding='utf-8') as f:
@@ -176,8 +210,13 @@ def run_ci_checks() -> NoReturn:
     parser.add_argument('--no_unit_tests', help="Skip unit tests", action='store_true')
     parser.add_argument('--only_unit_tests', help="Only run unit tests", action='store_true')
     parser.add_argument('--fix', help='Automatically apply fixes where possible', action='store_true')
+    parser.add_argument('--benchmark_fill', help='Only time the fill with each fill engine', action='store_true')
     args = parser.parse_args()
 
+    if args.benchmark_fill:
+        benchmark_fill()
+        sys.exit(0)
+
     if not args.no_unit_tests:
         run_unit_tests()
 
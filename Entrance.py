@@ -45,6 +45,8 @@ class Entrance:
         return new_entrance
 
     def add_rule(self, lambda_rule: AccessRule) -> None:
+        if self.world is not None:
+            self.world.rule_changed()
         if self.always:
             self.set_rule(lambda_rule)
             self.always = False
@@ -52,15 +54,25 @@ class Entrance:
         if self.never:
             return
         self.access_rules.append(lambda_rule)
-        self.access_rule = lambda state, **kwargs: all(rule(state, **kwargs) for rule in self.access_rules)
+        self.access_rule = self._run_rules
+
+    def _run_rules(self, state, **kwargs):
+        for rule in self.access_rules:
+            if not rule(state, **kwargs):
+                return False
+        return True
 
     def set_rule(self, lambda_rule: AccessRule) -> None:
         self.access_rule = lambda_rule
         self.access_rules = [lambda_rule]
+        if self.world is not None:
+            self.world.rule_changed()
 
     def connect(self, region: Region) -> None:
         self.connected_region = region
         region.entrances.append(self)
+        if self.world is not None:
+            self.world.connection_changed()
 
     def disconnect(self) -> Optional[Region]:
         if self.connected_region is None:
@@ -71,6 +83,8 @@ class Entrance:
             raise e
         previously_connected = self.connected_region
         self.connected_region = None
+        if self.world is not None:
+            self.world.connection_changed()
         return previously_connected
 
     def bind_two_way(self, other_entrance: Entrance) -> None:
@@ -9,7 +9,7 @@ from ItemPool import remove_junk_items
 from Location import Location, DisableType
 from LocationList import location_groups
 from Rules import set_shop_rules
-from Search import Search
+from Search import Search, IncrementalSearch
 from State import State
 
 if TYPE_CHECKING:
@@ -380,6 +380,74 @@ def fill_ownworld_restrictive(worlds: list[World], search: Search, locations: li
             raise FillError(f'Unable to place {description} items in world {world.id + 1}')
 
 
+# Answers Location.can_fill for the placements of one fill_restrictive call.
+# Items with the same name and world pass the same item rules, so which locations
+# each of them can go to (can_fill_fast, which walks the hint areas for restricted
+# dungeon items) is worked out once per fill and looked up afterwards.
+# Reachability is cached for the current max_search. When that is the incremental
+# engine's search, which keeps every fill location visited exactly while it is
+# reachable, reachability is read from it instead of running the access rule.
+class FillCandidates:
+    def __init__(self) -> None:
+        self.fillable: dict[tuple[str, int], dict[Location, bool]] = {}
+        self.reachable: dict[Location, bool] = {}
+        self.search: Optional[Search] = None
+
+    # Starts answering for a new or updated max_search.
+    def update(self, search: Search) -> None:
+        self.search = search
+        self.reachable.clear()
+
+    def can_fill_fast(self, location: Location, item: Item) -> bool:
+        key = (item.name, item.world.id)
+        fillable = self.fillable.get(key)
+        if fillable is None:
+            fillable = self.fillable[key] = {}
+        result = fillable.get(location)
+        if result is None:
+            result = fillable[location] = location.can_fill_fast(item)
+        return result
+
+    def is_reachable(self, location: Location) -> bool:
+        result = self.reachable.get(location)
+        if result is None:
+            if isinstance(self.search, IncrementalSearch) and location in self.search.item_locations:
+                result = self.search.visited(location)
+            else:
+                result = self.search.spot_access(location, 'either')
+            self.reachable[location] = result
+        return result
+
+    # Same as location.can_fill(state, item, check_access), for any state of the current max_search.
+    def can_fill(self, location: Location, item: Item, check_access: bool = True) -> bool:
+        if location.minor_only and item.majoritem:
+            return False
+        return (
+            not location.is_disabled and
+            self.can_fill_fast(location, item) and
+            (not check_access or self.is_reachable(location))
+        )
+
+
+# An item placed by fill_restrictive, with what it changed on the location and the
+# item so it can be taken back.
+class Placement:
+    def __init__(self, location: Location, item: Item, disabled: DisableType) -> None:
+        self.location: Location = location
+        self.item: Item = item
+        self.disabled: DisableType = disabled
+        self.location_price: Optional[int] = location.price
+        self.item_price: Optional[int] = item.price
+        self.item_location: Optional[Location] = item.location
+
+    def undo(self) -> None:
+        self.location.item = None
+        self.location.price = self.location_price
+        self.location.disabled = self.disabled
+        self.item.location = self.item_location
+        self.item.price = self.item_price
+
+
 # Places items in the itempool into locations.
 # worlds is a list of worlds and is redundant of the worlds in the base_state_list
 # base_state_list is a list of world states prior to placing items in the item pool
@@ -396,12 +464,29 @@ def fill_ownworld_restrictive(worlds: list[World], search: Search, locations: li
 # This function will modify the location and itempool arguments. placed items and
 # filled locations will be removed. If this returns an error, then the state of
 # those two lists cannot be guaranteed.
-def fill_restrictive(worlds: list[World], base_search: Search, locations: list[Location], itempool: list[Item], count: int = -1) -> None:
+#
+# When every item has to be placed and one of them has nowhere left to go, the most
+# recent placement is taken back and the stuck item is placed before it, up to
+# backtracks times in total. The search after taking a placement back is the one it
+# was placed with, so every placement is still made with all remaining items assumed.
+# Only when the placements or the backtracks run out is a FillError raised, and the
+# whole seed retried by the caller.
+def fill_restrictive(worlds: list[World], base_search: Search, locations: list[Location], itempool: list[Item], count: int = -1,
+                     backtracks: int = 20) -> None:
     unplaced_items = []
-
-    # don't run over this search, just keep it as an item collection
-    items_search = base_search.copy()
+    placements: list[Placement] = []
+
+    # The incremental engine keeps a single fully explored search over every unvisited location,
+    # which only re-explores what depends on each item taken out of it and on each placement.
+    incremental = worlds[0].settings.fill_engine == 'incremental'
+    if incremental:
+        item_locations = [location for location in base_search.progression_locations() if not base_search.visited(location)]
+        items_search = IncrementalSearch(base_search.state_list, item_locations + locations)
+    else:
+        # don't run over this search, just keep it as an item collection
+        items_search = base_search.copy()
     items_search.collect_all(itempool)
+    candidates = FillCandidates()
     logging.getLogger('').debug(f'Placing {len(itempool)} items among {len(locations)} potential locations.')
     itempool.sort(key=lambda item: not item.priority)
 
@@ -414,7 +499,7 @@ def fill_restrictive(worlds: list[World], base_search: Search, locations: list[L
         # get an item and remove it from the itempool
         item_to_place = itempool.pop()
         if item_to_place.priority:
-            l2cations = [l for l in locations if l.can_fill_fast(item_to_place)]
+            l2cations = [l for l in locations if candidates.can_fill_fast(l, item_to_place)]
         elif item_to_place.majoritem:
             l2cations = [l for l in locations if not l.minor_only]
         else:
@@ -424,8 +509,9 @@ def fill_restrictive(worlds: list[World], base_search: Search, locations: list[L
         # generate the max search with every remaining item
         # this will allow us to place this item in a reachable location
         items_search.uncollect(item_to_place)
-        max_search = items_search.copy()
+        max_search = items_search if incremental else items_search.copy()
         max_search.collect_locations()
+        candidates.update(max_search)
 
         # perform_access_check checks location reachability
         if worlds[0].check_beatable_only:
@@ -445,7 +531,7 @@ def fill_restrictive(worlds: list[World], base_search: Search, locations: list[L
         # in the world we are placing it (possibly checking for reachability)
         spot_to_fill = None
         for location in l2cations:
-            if location.can_fill(max_search.state_list[location.world.id], item_to_place, perform_access_check):
+            if candidates.can_fill(location, item_to_place, perform_access_check):
                 # for multiworld, make it so that the location is also reachable
                 # in the world the item is for. This is to prevent early restrictions
                 # in one world being placed late in another world. If this is not
@@ -453,7 +539,7 @@ def fill_restrictive(worlds: list[World], base_search: Search, locations: list[L
                 if location.world.id != item_to_place.world.id:
                     try:
                         source_location = item_to_place.world.get_location(location.name)
-                        if not source_location.can_fill(max_search.state_list[item_to_place.world.id], item_to_place, perform_access_check):
+                        if not candidates.can_fill(source_location, item_to_place, perform_access_check):
                             # location wasn't reachable in item's world, so skip it
                             continue
                     except KeyError:
@@ -471,6 +557,7 @@ def fill_restrictive(worlds: list[World], base_search: Search, locations: list[L
                         if not can_reach:
                             continue
 
+                spot_disabled = location.disabled
                 if location.disabled == DisableType.PENDING:
                     if not max_search.can_beat_game(False):
                         continue
@@ -488,11 +575,25 @@ def fill_restrictive(worlds: list[World], base_search: Search, locations: list[L
                 unplaced_items.append(item_to_place)
                 items_search.collect(item_to_place)
                 continue
+            elif placements and backtracks > 0:
+                # take back the last placement, and place this item before that one
+                backtracks -= 1
+                placement = placements.pop()
+                placement.undo()
+                logging.getLogger('').debug('Took back %s at %s to place %s first.', placement.item, placement.location, item_to_place)
+                locations.append(placement.location)
+                itempool.append(placement.item)
+                itempool.append(item_to_place)
+                items_search.collect(placement.item)
+                items_search.collect(item_to_place)
+                count += 1
+                continue
             else:
                 # we expect all items to be placed
                 raise FillError(f'Game unbeatable: No more spots to place {item_to_place} [World {item_to_place.world.id + 1}] from {len(l2cations)} locations ({len(locations)} total); {len(itempool)} other items left to place, plus {len(unplaced_items)} skipped')
 
         # Place the item in the world and continue
+        placements.append(Placement(spot_to_fill, item_to_place, spot_disabled))
         spot_to_fill.world.push_item(spot_to_fill, item_to_place)
         locations.remove(spot_to_fill)
 
@@ -7,7 +7,7 @@ from typing import TYPE_CHECKING, Optional, Any
 from HintList import goalTable, get_hint_group, hint_exclusions
 from ItemList import item_table
 from RulesCommon import AccessRule
-from Search import Search, ValidGoals
+from Search import Search, IncrementalSearch, ValidGoals
 
 if sys.version_info >= (3, 10):
     from typing import TypeAlias
@@ -188,8 +188,7 @@ def update_goal_items(spoiler: Spoiler) -> None:
         # References first world for goal categories only
         for cat_name, category in worlds[0].locked_goal_categories.items():
             for cat_world in worlds:
-                search = Search([world.state for world in worlds])
-                search.collect_pseudo_starting_items()
+                search = spoiler.sphere_log.search_at(0)
 
                 cat_state = list(filter(lambda s: s.world.id == cat_world.id, search.state_list))
                 category_locks = lock_category_entrances(category, cat_state)
@@ -215,16 +214,14 @@ def update_goal_items(spoiler: Spoiler) -> None:
 
                 unlock_category_entrances(category_locks, cat_state)
 
-    search = Search([world.state for world in worlds])
-    search.collect_pseudo_starting_items()
+    search = spoiler.sphere_log.search_at(0)
     reachable_goals = {}
     # Force all goals to be unreachable if goal hints are not part of the distro
     # Saves a minor amount of search time. Most of the benefit is skipping the
     # locked goal categories. This section still needs to run to generate WOTH.
     # WOTH isn't a goal, so it still is searched successfully.
     if worlds[0].enable_goal_hints:
-        full_search = search.copy()
-        full_search.collect_locations()
+        full_search = spoiler.sphere_log.max_search
         for cat_name, category in worlds[0].unlocked_goal_categories.items():
             category.update_reachable_goals(search, full_search)
         reachable_goals = full_search.beatable_goals_fast(worlds[0].unlocked_goal_categories)
@@ -295,6 +292,7 @@ def lock_category_entrances(category: GoalCategory, state_list: Iterable[State])
                 exit = state.world.get_entrance(lock)
                 category_locks[index][exit.name] = exit.access_rule
                 exit.access_rule = lambda state, **kwargs: False
+                exit.world.rule_changed()
     return category_locks
 
 
@@ -305,6 +303,7 @@ def unlock_category_entrances(category_locks: dict[int, dict[str, AccessRule]],
         for exit_name, access_rule in exits.items():
             exit = state_list[state_id].world.get_entrance(exit_name)
             exit.access_rule = access_rule
+            exit.world.rule_changed()
 
 
 def search_goals(categories: dict[str, GoalCategory], reachable_goals: ValidGoals, search: Search, priority_locations: dict[int, dict[str, str]],
@@ -316,14 +315,16 @@ def search_goals(categories: dict[str, GoalCategory], reachable_goals: ValidGoal
     if search_woth:
         required_locations['way of the hero'] = []
     remaining_locations = all_locations[:]
+    # Goals are tested against a fully explored search that only re-explores
+    # what depends on each removed item.
+    goal_search = IncrementalSearch([state.world.state for state in search.state_list])
+    goal_search.collect_pseudo_starting_items()
     for location in search.iter_reachable_locations(all_locations):
         # Try to remove items one at a time and see if the goal is still reachable
         if location in item_locations:
             old_item = location.item
             location.item = None
-            # copies state! This is very important as we're in the middle of a search
-            # already, but beneficially, has search it can start from
-            valid_goals = search.beatable_goals(categories)
+            valid_goals = goal_search.beatable_goals(categories)
             for cat_name, category in categories.items():
                 # Exit early if no goals are beatable with category locks
                 if category.name in reachable_goals and reachable_goals[category.name]:
@@ -22,7 +22,7 @@ from Messages import Message, COLOR_MAP, update_message_by_id
 from Region import Region
 from Search import Search
 from TextBox import line_wrap
-from Utils import random_choices, data_path
+from Utils import data_path
 
 if sys.version_info >= (3, 10):
     from typing import TypeAlias
@@ -1293,7 +1293,7 @@ def build_world_gossip_hints(spoiler: Spoiler, world: World, checked_locations:
     world.woth_dungeon = 0
     world.last_woth = 0
 
-    search = Search.max_explore([w.state for w in spoiler.worlds])
+    search = spoiler.sphere_log.max_explore
     for stone in gossipLocations.values():
         stone.reachable = (
             search.spot_access(world.get_location(stone.location))
@@ -28,7 +28,7 @@ class Location:
                  filter_tags: LocationFilterTags = None, internal: bool = False, vanilla_item: Optional[str] = None) -> None:
         self.name: str = name
         self.parent_region: Optional[Region] = parent
-        self.item: Optional[Item] = None
+        self._item: Optional[Item] = None
         self.vanilla_item: Optional[str] = vanilla_item
         self.address: LocationAddress = address
         self.address2: LocationAddress = address2
@@ -67,11 +67,24 @@ class Location:
 
         return new_location
 
+    # Placing or removing an item changes what searches of the world find.
+    @property
+    def item(self) -> Optional[Item]:
+        return self._item
+
+    @item.setter
+    def item(self, item: Optional[Item]) -> None:
+        self._item = item
+        if self.world is not None:
+            self.world.graph_changed()
+
     @property
     def dungeon(self) -> Optional[Dungeon]:
         return self.parent_region.dungeon if self.parent_region is not None else None
 
     def add_rule(self, lambda_rule: AccessRule) -> None:
+        if self.world is not None:
+            self.world.rule_changed()
         if self.always:
             self.set_rule(lambda_rule)
             self.always = False
@@ -90,6 +103,8 @@ class Location:
     def set_rule(self, lambda_rule: AccessRule) -> None:
         self.access_rule = lambda_rule
         self.access_rules = [lambda_rule]
+        if self.world is not None:
+            self.world.rule_changed()
 
     def can_fill(self, state: State, item: Item, check_access: bool = True) -> bool:
         if state.search is None:
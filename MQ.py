@@ -89,7 +89,7 @@ class File:
         offset = new_start - self.start
         new_end = self.end + offset
 
-        rom.buffer[new_start:new_end] = rom.buffer[self.start:self.end]
+        rom.write_bytes(new_start, rom.buffer[self.start:self.end])
         self.start = new_start
         self.end = new_end
         update_dmadata(rom, self)
@@ -307,7 +307,7 @@ class Scene:
             b_start = self.file.start + (types_move_addr & 0xFFFFFF)
             size = mesh.polytypes * 8
 
-            rom.buffer[b_start:b_start + size] = rom.buffer[a_start:a_start + size]
+            rom.write_bytes(b_start, rom.buffer[a_start:a_start + size])
             mesh.polytypes_addr = types_move_addr
 
         # patch polytypes
@@ -445,7 +445,7 @@ def get_segment_address(base: int, offset: int) -> int:
 
 
 def patch_ice_cavern_scene_header(rom: Rom) -> None:
-    rom.buffer[0x2BEB000:0x2BEB038] = rom.buffer[0x2BEB008:0x2BEB040]
+    rom.write_bytes(0x2BEB000, rom.buffer[0x2BEB008:0x2BEB040])
     rom.write_int32s(0x2BEB038, [0x0D000000, 0x02000000])
 
 
@@ -485,9 +485,8 @@ def patch_spirit_temple_mq_room_6(rom: Rom, room_addr: int) -> None:
     a_start = room_addr
     a_end = a_start + header_size
     b_start = room_addr + alt_header_off
-    b_end = b_start + header_size
 
-    rom.buffer[b_start:b_end] = rom.buffer[a_start:a_end]
+    rom.write_bytes(b_start, rom.buffer[a_start:a_end])
 
     # make the child header skip the first actor,
     # which avoids the spawning of the block while in the hole
@@ -498,7 +497,7 @@ def patch_spirit_temple_mq_room_6(rom: Rom, room_addr: int) -> None:
     rom.write_int32(cmd_addr + 4, actor_list_addr)
 
     # move header
-    rom.buffer[a_start + 8:a_end + 8] = rom.buffer[a_start:a_end]
+    rom.write_bytes(a_start + 8, rom.buffer[a_start:a_end])
 
     # write alternate header command
     seg = get_segment_address(3, alt_data_off)
@@ -657,8 +656,8 @@ def insert_space(rom: Rom, file: File, vram_start: int, insert_section: int, ins
         cur += 4
 
     # Move rom bytes
-    rom.buffer[(insert_rom + insert_size):(file.end + insert_size)] = rom.buffer[insert_rom:file.end]
-    rom.buffer[insert_rom:(insert_rom + insert_size)] = [0] * insert_size
+    rom.write_bytes(insert_rom + insert_size, rom.buffer[insert_rom:file.end])
+    rom.write_bytes(insert_rom, [0] * insert_size)
     file.end += insert_size
 
 
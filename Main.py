@@ -1,11 +1,16 @@
 from __future__ import annotations
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import ast
 import copy
 import hashlib
 import io
 import itertools
+import json
 import logging
 import os
+import pickle
 import platform
 import random
 import shutil
@@ -14,59 +19,61 @@ import sys
 import struct
 import time
 import zipfile
-from typing import Optional
+from typing import Any, Optional
 
-from Rom import Rom
-from Patches import patch_rom
 from Cosmetics import CosmeticsLog, patch_cosmetics
+from Entrance import Entrance
 from EntranceShuffle import set_entrances
-from Dungeon import create_dungeons
-from DungeonList import create_dungeons
 from Fill import distribute_items_restrictive, ShuffleError
-from Goals import update_goal_items, maybe_set_misc_item_hints, replace_goal_names
-from Hints import buildGossipHints
+from Goals import update_goal_items, replace_goal_names
+from Hints import build_gossip_hints
 from HintList import clear_hint_exclusion_cache, misc_item_hint_table, misc_location_hint_table
-from Item import Item
+from Item import Item, ItemInfo
 from ItemPool import generate_itempool
-from Hints import buildGossipHints
-from HintList import clearHintExclusionCache
-from N64Patch import create_patch_file, apply_patch_file
 from MBSDIFFPatch import apply_ootr_3_web_patch
-
-from HintList import clearHintExclusionCache, misc_item_hint_table, misc_location_hint_table
 from Models import patch_model_adult, patch_model_child
 from N64Patch import create_patch_file, apply_patch_file
-
-
 from Patches import patch_rom
-from Rom import Rom
-from Rules import set_rules, set_shop_rules
 from Plandomizer import Distribution
-from Search import Search, RewindableSearch
-
-from LocationList import set_drop_location_names
+from Rom import Rom, RomLayer
+from Rules import set_rules, set_shop_rules
+from RuleParser import load_rule_cache, rule_ast_cache, update_rule_cache
+from Search import Search, IncrementalSearch
 from Settings import Settings
-from SettingsList import setting_infos, logic_tricks
+from SettingsListTricks import logic_tricks
 from Spoiler import Spoiler
-from Utils import default_output_path, is_bundled, run_process, data_path
+from Utils import default_output_path, is_bundled, run_process, data_path, local_path
 from World import World
 from version import __version__
 
 
 
 
-def main(settings: Settings, max_attempts: int = 10) -> Spoiler:
+# Returns the spoiler, or the artifacts the seed was output from when it was reused from the artifact cache,
+# since a reused seed is never generated and has no spoiler.
+def main(settings: Settings, max_attempts: int = 10, base_rom: Optional[memoryview] = None,
+         artifact_cache: Optional[str] = None) -> Spoiler | GenerationArtifacts:
     clear_hint_exclusion_cache()
     logger = logging.getLogger('')
     start = time.process_time()
 
-    rom = resolve_settings(settings)
+    rom = resolve_settings(settings, base_rom)
+
+    key = artifacts_key(settings) if artifact_cache else None
+    if artifact_cache:
+        artifacts = load_artifacts(artifact_cache, key)
+        if artifacts is not None and artifacts.covers(settings, rom):
+            logger.info('Reusing the generated seed from the artifact cache.')
+            patch_and_output(settings, None, rom, artifacts)
+            logger.debug('Total Time: %s', time.process_time() - start)
+            return artifacts
 
     max_attempts = max(max_attempts, 1)
     spoiler = None
+    template = WorldTemplate() if max_attempts > 1 else None
     for attempt in range(1, max_attempts + 1):
         try:
-            spoiler = generate(settings)
+            spoiler = generate(settings, template)
             break
         except ShuffleError as e:
             logger.warning('Failed attempt %d of %d: %s', attempt, max_attempts, e)
@@ -77,12 +84,171 @@ def main(settings: Settings, max_attempts: int = 10) -> Spoiler:
             settings.reset_distribution()
     if spoiler is None:
         raise RuntimeError("Generation failed.")
-    patch_and_output(settings, spoiler, rom)
+    # Only keep what patching produced when there is a cache to keep it in.
+    artifacts = GenerationArtifacts(key) if artifact_cache else None
+    patch_and_output(settings, spoiler, rom, artifacts)
+    if artifacts is not None:
+        save_artifacts(artifact_cache, artifacts)
     logger.debug('Total Time: %s', time.process_time() - start)
     return spoiler
 
 
-def resolve_settings(settings: Settings) -> Optional[Rom]:
+# What generating a seed produced before any cosmetics were applied: the rom changes
+# patch_rom made to each patched world along with the random state it left behind,
+# and the settings and spoiler logs. Cosmetic settings are in neither, so a seed
+# can be repatched with other cosmetics from these alone.
+class GenerationArtifacts:
+    def __init__(self, key: str) -> None:
+        self.key: str = key
+        self.rom_layers: dict[int, RomLayer] = {}
+        self.rng_states: dict[int, tuple] = {}
+        self.settings_log: Optional[str] = None
+        self.spoiler_log: Optional[str] = None
+
+    # Whether these artifacts have everything patch_and_output needs for the settings.
+    def covers(self, settings: Settings, rom: Optional[Rom]) -> bool:
+        if self.settings_log is None or (settings.create_spoiler and self.spoiler_log is None):
+            return False
+        return all(world_id in self.rom_layers for world_id in patched_world_ids(settings, rom))
+
+
+# Identifies the artifacts of a seed by the randomizer version, the settings string, the seed and the
+# plandomizer file, which are everything generation depends on besides the cosmetic settings.
+def artifacts_key(settings: Settings) -> str:
+    key = hashlib.blake2b(__version__.encode(), digest_size=20)
+    key.update(settings.settings_string.encode())
+    key.update(b'\0' + settings.seed.encode())
+    if settings.enable_distribution_file and settings.distribution_file:
+        with open(settings.distribution_file, 'rb') as stream:
+            key.update(stream.read())
+    return key.hexdigest()
+
+
+def load_artifacts(artifact_cache: str, key: str) -> Optional[GenerationArtifacts]:
+    cache_file = os.path.join(artifact_cache, f'{key}.pkl')
+    if not os.path.isfile(cache_file):
+        return None
+    try:
+        with open(cache_file, 'rb') as stream:
+            return pickle.load(stream)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        logging.getLogger('').debug('Ignoring unreadable artifact cache: %s', cache_file)
+        return None
+
+
+def save_artifacts(artifact_cache: str, artifacts: GenerationArtifacts) -> None:
+    cache_file = os.path.join(artifact_cache, f'{artifacts.key}.pkl')
+    try:
+        os.makedirs(artifact_cache, exist_ok=True)
+        # Write to a temporary file first, so a concurrent request never loads a partial file.
+        temp_file = f'{cache_file}.{os.getpid()}.tmp'
+        with open(temp_file, 'wb') as stream:
+            pickle.dump(artifacts, stream)
+        os.replace(temp_file, cache_file)
+    except OSError:
+        logging.getLogger('').debug('Unable to save artifact cache: %s', cache_file)
+
+
+# Whether the settings output anything that needs the base rom.
+def uses_rom(settings: Settings) -> bool:
+    outputting_specific_world = settings.create_uncompressed_rom or settings.create_compressed_rom or settings.create_wad_file
+    return outputting_specific_world or settings.create_patch_file or settings.patch_without_output
+
+
+# The worlds patch_and_output patches a rom for.
+def patched_world_ids(settings: Settings, rom: Optional[Rom]) -> list[int]:
+    if rom is None or not uses_rom(settings):
+        return []
+    if settings.create_patch_file:
+        return list(range(settings.world_count))
+    return [settings.player_num - 1]
+
+
+# The decompressed base rom each worker process of a seed batch maps once, read-only,
+# so the workers share the page cache of the file instead of holding a copy each.
+batch_base_rom: Optional[memoryview] = None
+
+
+def init_batch_worker(map_base_rom: bool, loglevel: int, logic_cache: Optional[str]) -> None:
+    global batch_base_rom
+    # Workers started with spawn don't inherit the logging setup or loaded rules.
+    logging.basicConfig(format='%(message)s', level=loglevel)
+    if logic_cache and not rule_ast_cache:
+        load_rule_cache(logic_cache)
+    if map_base_rom:
+        batch_base_rom = Rom.map_rom(local_path('ZOOTDEC.z64'))
+
+
+# Generates a single seed of a batch in a worker process.
+# Returns its summary entry instead of raising, so one failed seed doesn't stop the batch,
+# along with the rules it transformed if the main process keeps a logic cache.
+def generate_batch_seed(settings: Settings, artifact_cache: Optional[str] = None,
+                        keep_rules: bool = False) -> tuple[dict[str, Any], dict[tuple[str, str], tuple[ast.AST, frozenset[str]]]]:
+    start = time.perf_counter()
+    known_rules = set(rule_ast_cache) if keep_rules else None
+    entry = {'seed': settings.seed}
+    try:
+        main(settings, base_rom=batch_base_rom, artifact_cache=artifact_cache)
+        entry['success'] = True
+    except Exception as ex:
+        logging.getLogger('').exception(ex)
+        entry['success'] = False
+        entry['error'] = f'{type(ex).__name__}: {ex}'
+    entry['time'] = round(time.perf_counter() - start, 3)
+    rules = {key: rule for key, rule in rule_ast_cache.items() if key not in known_rules} if keep_rules else {}
+    return entry, rules
+
+
+# Generates settings.count seeds across jobs worker processes, and writes a summary
+# of every seed's result and generation time to the output directory.
+# Seeds are named like the serial --count seeds, so a seed generates the same either way.
+def generate_batch(settings: Settings, jobs: int, logic_cache: Optional[str] = None, artifact_cache: Optional[str] = None) -> list[dict[str, Any]]:
+    logger = logging.getLogger('')
+    start = time.perf_counter()
+    orig_seed = settings.seed
+
+    # Load the base rom once, so it is decompressed before the workers map it.
+    map_base_rom = uses_rom(settings)
+    if map_base_rom:
+        Rom(settings.rom)
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_batch_worker,
+                             initargs=(map_base_rom, logger.getEffectiveLevel(), logic_cache)) as executor:
+        futures = []
+        for i in range(settings.count):
+            seed_settings = settings.copy()
+            seed_settings.update_seed(f'{orig_seed}-{i}')
+            futures.append((seed_settings.seed, executor.submit(generate_batch_seed, seed_settings, artifact_cache, bool(logic_cache))))
+        results = []
+        for seed, future in futures:
+            try:
+                entry, rules = future.result()
+            except BrokenProcessPool as ex:
+                # A worker died, taking the seeds it and the pool had left with it.
+                logger.error('Seed %s was lost with its worker: %s', seed, ex)
+                entry, rules = {'seed': seed, 'success': False, 'error': f'{type(ex).__name__}: {ex}'}, {}
+            results.append(entry)
+            # The caller saves the logic cache once the batch is done.
+            update_rule_cache(rules)
+
+    failed = sum(not entry['success'] for entry in results)
+    summary = {
+        'seed': orig_seed,
+        'count': settings.count,
+        'jobs': jobs,
+        'succeeded': len(results) - failed,
+        'failed': failed,
+        'time': round(time.perf_counter() - start, 3),
+        'seeds': results,
+    }
+    summary_path = os.path.join(default_output_path(settings.output_dir), f'OoT_{orig_seed}_Batch.json')
+    with open(summary_path, 'w') as f:
+        json.dump(summary, f, indent=4)
+    logger.info('Generated %d of %d seeds. Created batch summary at: %s', len(results) - failed, len(results), summary_path)
+    return results
+
+
+def resolve_settings(settings: Settings, base_rom: Optional[memoryview] = None) -> Optional[Rom]:
     logger = logging.getLogger('')
 
     old_tricks = settings.allowed_tricks
@@ -98,12 +264,12 @@ def resolve_settings(settings: Settings) -> Optional[Rom]:
 
     # we load the rom before creating the seed so that errors get caught early
     outputting_specific_world = settings.create_uncompressed_rom or settings.create_compressed_rom or settings.create_wad_file
-    using_rom = outputting_specific_world or settings.create_patch_file or settings.patch_without_output
+    using_rom = uses_rom(settings)
     if not (using_rom or settings.patch_without_output) and not settings.create_spoiler:
         raise Exception('You must have at least one output type or spoiler log enabled to produce anything.')
 
     if using_rom:
-        rom = Rom(settings.rom)
+        rom = Rom(settings.rom, base=base_rom)
     else:
         rom = None
 
@@ -133,8 +299,8 @@ def resolve_settings(settings: Settings) -> Optional[Rom]:
     return rom
 
 
-def generate(settings: Settings) -> Spoiler:
-    worlds = build_world_graphs(settings)
+def generate(settings: Settings, template: Optional[WorldTemplate] = None) -> Spoiler:
+    worlds = build_world_graphs(settings, template)
     place_items(worlds)
     for world in worlds:
         world.distribution.configure_effective_starting_items(worlds, world)
@@ -143,43 +309,80 @@ def generate(settings: Settings) -> Spoiler:
     return make_spoiler(settings, worlds)
 
 
-def build_world_graphs(settings: Settings) -> list[World]:
+# The worlds as build_world_graphs leaves them right before shuffling entrances,
+# so that retrying a seed only has to shuffle entrances and fill again.
+# Every world built from the same settings is kept in the same template and cloned
+# together with them, since they share the plando distribution. Each world made its
+# own random choices (dungeon forms, prices, item pool), so they aren't clones of each other.
+#
+# Attempts from the template repeat those choices, so one that keeps failing for them could
+# keep failing for good. After max_loads attempts from the same template, the worlds are
+# built from scratch again and saved in its place.
+# Copying the worlds costs about a fifth of building them, so the first worlds built aren't
+# saved: most seeds generate on the first attempt, and the second one saves its worlds instead.
+class WorldTemplate:
+    def __init__(self, max_loads: int = 3) -> None:
+        self.worlds: Optional[list[World]] = None
+        self.savewarps_to_connect: list[tuple[Entrance, str]] = []
+        self.max_loads: int = max_loads
+        self.builds: int = 0
+        self.loads: int = 0
+
+    # Whether the next attempt should copy the saved worlds rather than build new ones.
+    def usable(self) -> bool:
+        return self.worlds is not None and self.loads < self.max_loads
+
+    def save(self, settings: Settings, worlds: list[World], savewarps_to_connect: list[tuple[Entrance, str]]) -> None:
+        self.builds += 1
+        self.loads = 0
+        if self.builds > 1:
+            self.worlds, self.savewarps_to_connect = self.clone(settings, worlds, savewarps_to_connect)
+
+    # Returns new copies of the saved worlds and savewarps, and makes the settings use their distribution.
+    def load(self, settings: Settings) -> tuple[list[World], list[tuple[Entrance, str]]]:
+        self.loads += 1
+        worlds, savewarps_to_connect = self.clone(settings, self.worlds, self.savewarps_to_connect)
+        settings.distribution = worlds[0].settings.distribution
+        for world in worlds:
+            world.graph_changed()
+        return worlds, savewarps_to_connect
+
+    # Deep copies the worlds. Every region, entrance and location gets an empty copy first,
+    # so copying what they refer to doesn't recurse along the paths of the graph.
+    # The item infos and the settings the generation was started with are shared, not copied.
+    @staticmethod
+    def clone(settings: Settings, worlds: list[World], savewarps_to_connect: list[tuple[Entrance, str]]) -> tuple[list[World], list[tuple[Entrance, str]]]:
+        memo = {id(info): info for info in ItemInfo.items.values()}
+        memo[id(settings)] = settings
+        spots = {}
+        for world in worlds:
+            for region in world.regions:
+                spots[id(region)] = region
+                spots.update((id(spot), spot) for spot in itertools.chain(region.exits, region.entrances, region.locations))
+            spots.update((id(entrance), entrance) for entrance in world._entrance_cache.values())
+        for spot_id, spot in spots.items():
+            memo[spot_id] = copy.copy(spot)
+        for spot_id, spot in spots.items():
+            memo[spot_id].__dict__.update(copy.deepcopy(spot.__dict__, memo))
+        return copy.deepcopy((worlds, savewarps_to_connect), memo)
+
+
+def build_world_graphs(settings: Settings, template: Optional[WorldTemplate] = None) -> list[World]:
     logger = logging.getLogger('')
-    worlds = []
-    for i in range(0, settings.world_count):
-        worlds.append(World(i, settings.copy()))
-
-    savewarps_to_connect = []
-    for id, world in enumerate(worlds):
-        logger.info('Generating World %d.' % (id + 1))
-        logger.info('Creating Overworld')
-
-        # Load common json rule files (those used regardless of MQ status)
-        if settings.logic_rules == 'glitched':
-            path = 'Glitched World'
-        else:
-            path = 'World'
-        path = data_path(path)
-
-        for filename in ('Overworld.json', 'Bosses.json'):
-            savewarps_to_connect += world.load_regions_from_json(os.path.join(path, filename))
-
-        # Compile the json rules based on settings
-        savewarps_to_connect += world.create_dungeons()
-        world.create_internal_locations()
-
-        if settings.shopsanity != 'off':
-            world.random_shop_prices()
-        world.set_scrub_prices()
+    if template is not None and template.usable():
+        logger.info('Copying the worlds from the template.')
+        worlds, savewarps_to_connect = template.load(settings)
+    else:
+        worlds = []
+        for i in range(0, settings.world_count):
+            worlds.append(World(i, settings.copy()))
 
-        logger.info('Calculating Access Rules.')
-        set_rules(world)
+        savewarps_to_connect = []
+        for world in worlds:
+            savewarps_to_connect += build_world_graph(world)
 
-        logger.info('Generating Item Pool.')
-        generate_itempool(world)
-        set_shop_rules(world)
-        world.set_drop_location_names()
-        world.fill_bosses()
+        if template is not None:
+            template.save(settings, worlds, savewarps_to_connect)
 
     if settings.triforce_hunt:
         settings.distribution.configure_triforce_hunt(worlds)
@@ -189,6 +392,42 @@ def build_world_graphs(settings: Settings) -> list[World]:
     return worlds
 
 
+# Builds the regions, rules and item pool of one world, and returns the savewarps to connect once every world is built.
+def build_world_graph(world: World) -> list[tuple[Entrance, str]]:
+    logger = logging.getLogger('')
+    logger.info('Generating World %d.' % (world.id + 1))
+    logger.info('Creating Overworld')
+
+    # Load common json rule files (those used regardless of MQ status)
+    if world.settings.logic_rules == 'glitched':
+        path = 'Glitched World'
+    else:
+        path = 'World'
+    path = data_path(path)
+
+    savewarps_to_connect = []
+    for filename in ('Overworld.json', 'Bosses.json'):
+        savewarps_to_connect += world.load_regions_from_json(os.path.join(path, filename))
+
+    # Compile the json rules based on settings
+    savewarps_to_connect += world.create_dungeons()
+    world.create_internal_locations()
+
+    if world.settings.shopsanity != 'off':
+        world.random_shop_prices()
+    world.set_scrub_prices()
+
+    logger.info('Calculating Access Rules.')
+    set_rules(world)
+
+    logger.info('Generating Item Pool.')
+    generate_itempool(world)
+    set_shop_rules(world)
+    world.set_drop_location_names()
+    world.fill_bosses()
+    return savewarps_to_connect
+
+
 def place_items(worlds: list[World]) -> None:
     logger = logging.getLogger('')
     logger.info('Fill the world.')
@@ -201,12 +440,9 @@ def make_spoiler(settings: Settings, worlds: list[World]) -> Spoiler:
     if settings.create_spoiler:
         logger.info('Calculating playthrough.')
         spoiler.create_playthrough()
-        #window.update_progress(45)
     if settings.create_spoiler or settings.hints != 'none':
-        window.update_status('Calculating Hint Data')
         logger.info('Calculating coarse spheres.')
         compute_coarse_spheres(spoiler)
-        window.update_progress(50)
         logger.info('Calculating hint data.')
         update_goal_items(spoiler)
         build_gossip_hints(spoiler, worlds)
@@ -216,18 +452,27 @@ def make_spoiler(settings: Settings, worlds: list[World]) -> Spoiler:
     return spoiler
 
 
-def prepare_rom(spoiler: Spoiler, world: World, rom: Rom, settings: Settings, rng_state: Optional[tuple] = None, restore: bool = True) -> CosmeticsLog:
+# Reapplies the world's rom changes from the artifacts if they have them, and records them otherwise.
+def prepare_rom(spoiler: Optional[Spoiler], world_id: int, rom: Rom, settings: Settings, rng_state: Optional[tuple] = None,
+                restore: bool = True, artifacts: Optional[GenerationArtifacts] = None) -> CosmeticsLog:
     if rng_state:
         random.setstate(rng_state)
         # Use different seeds for each world when patching.
         seed = int(random.getrandbits(256))
-        for i in range(0, world.id):
+        for i in range(0, world_id):
             seed = int(random.getrandbits(256))
         random.seed(seed)
 
     if restore:
         rom.restore()
-    patch_rom(spoiler, world, rom)
+    if artifacts is not None and world_id in artifacts.rom_layers:
+        artifacts.rom_layers[world_id].apply(rom)
+        random.setstate(artifacts.rng_states[world_id])
+    else:
+        patch_rom(spoiler, spoiler.worlds[world_id], rom)
+        if artifacts is not None:
+            artifacts.rom_layers[world_id] = RomLayer.capture(rom)
+            artifacts.rng_states[world_id] = random.getstate()
     cosmetics_log = patch_cosmetics(settings, rom)
     if not settings.generating_patch_file:
         if settings.model_adult != "Default" or len(settings.model_adult_filepicker) > 0:
@@ -310,9 +555,10 @@ def generate_wad(wad_file: str, rom_file: str, output_file: str, channel_title:
         os.remove(rom_file)
 
 
-def patch_and_output(settings: Settings, spoiler: Spoiler, rom: Optional[Rom]) -> None:
+# Without a spoiler, the seed is output from the artifacts of an earlier generation.
+# With both, what the seed produced is also recorded in the artifacts.
+def patch_and_output(settings: Settings, spoiler: Optional[Spoiler], rom: Optional[Rom], artifacts: Optional[GenerationArtifacts] = None) -> None:
     logger = logging.getLogger('')
-    worlds = spoiler.worlds
     cosmetics_log = None
 
     settings_string_hash = hashlib.sha1(settings.settings_string.encode('utf-8')).hexdigest().upper()[:5]
@@ -334,20 +580,20 @@ def patch_and_output(settings: Settings, spoiler: Spoiler, rom: Optional[Rom]) -
         rng_state = random.getstate()
         file_list = []
         restore_rom = False
-        for world in worlds:
+        for world_id in range(settings.world_count):
             # If we aren't creating a patch file and this world isn't the one being outputted, move to the next world.
-            if not (settings.create_patch_file or world.id == settings.player_num - 1):
+            if not (settings.create_patch_file or world_id == settings.player_num - 1):
                 continue
 
             if settings.world_count > 1:
-                logger.info(f"Patching ROM: Player {world.id + 1}")
-                player_filename_suffix = f"P{world.id + 1}"
+                logger.info(f"Patching ROM: Player {world_id + 1}")
+                player_filename_suffix = f"P{world_id + 1}"
             else:
                 logger.info('Patching ROM')
                 player_filename_suffix = ""
 
             settings.generating_patch_file = settings.create_patch_file
-            patch_cosmetics_log = prepare_rom(spoiler, world, rom, settings, rng_state, restore_rom)
+            patch_cosmetics_log = prepare_rom(spoiler, world_id, rom, settings, rng_state, restore_rom, artifacts)
             restore_rom = True
 
             if settings.create_patch_file:
@@ -368,7 +614,7 @@ def patch_and_output(settings: Settings, spoiler: Spoiler, rom: Optional[Rom]) -
                     file_list.append(cosmetics_log_filename)
 
             # If we aren't outputting an uncompressed ROM, move to the next world.
-            if not uncompressed_rom or world.id != settings.player_num - 1:
+            if not uncompressed_rom or world_id != settings.player_num - 1:
                 continue
 
             uncompressed_filename = f"{output_filename_base}{player_filename_suffix}_uncompressed.z64"
@@ -376,7 +622,7 @@ def patch_and_output(settings: Settings, spoiler: Spoiler, rom: Optional[Rom]) -
             logger.info(f"Saving Uncompressed ROM: {uncompressed_filename}")
             if separate_cosmetics:
                 settings.generating_patch_file = False
-                cosmetics_log = prepare_rom(spoiler, world, rom, settings, rng_state, restore_rom)
+                cosmetics_log = prepare_rom(spoiler, world_id, rom, settings, rng_state, restore_rom, artifacts)
             else:
                 cosmetics_log = patch_cosmetics_log
             rom.write_to_file(uncompressed_path)
@@ -417,15 +663,30 @@ def patch_and_output(settings: Settings, spoiler: Spoiler, rom: Optional[Rom]) -
                 os.remove(os.path.join(output_dir, file))
             logger.info("Created patch file archive at: %s" % patch_archive_path)
 
-    if not settings.create_spoiler or settings.output_settings:
+    if spoiler is not None and artifacts is not None:
         settings.distribution.update_spoiler(spoiler, False)
+        artifacts.settings_log = settings.distribution.to_str(spoiler=False)
+        if settings.create_spoiler:
+            settings.distribution.update_spoiler(spoiler, True)
+            artifacts.spoiler_log = settings.distribution.to_str(spoiler=True)
+
+    if not settings.create_spoiler or settings.output_settings:
         settings_path = os.path.join(output_dir, '%s_Settings.json' % output_filename_base)
-        settings.distribution.to_file(settings_path, False)
+        if artifacts is not None:
+            with open(settings_path, 'w', encoding='utf-8') as outfile:
+                outfile.write(artifacts.settings_log)
+        else:
+            settings.distribution.update_spoiler(spoiler, False)
+            settings.distribution.to_file(settings_path, False)
         logger.info("Created settings log at: %s" % ('%s_Settings.json' % output_filename_base))
     if settings.create_spoiler:
-        settings.distribution.update_spoiler(spoiler, True)
         spoiler_path = os.path.join(output_dir, '%s_Spoiler.json' % output_filename_base)
-        settings.distribution.to_file(spoiler_path, True)
+        if artifacts is not None:
+            with open(spoiler_path, 'w', encoding='utf-8') as outfile:
+                outfile.write(artifacts.spoiler_log)
+        else:
+            settings.distribution.update_spoiler(spoiler, True)
+            settings.distribution.to_file(spoiler_path, True)
         logger.info("Created spoiler log at: %s" % ('%s_Spoiler.json' % output_filename_base))
 
     if settings.create_cosmetics_log and cosmetics_log:
@@ -564,7 +825,7 @@ def cosmetic_patch(settings: Settings) -> None:
 
     # clear changes from the base patch file
     patched_base_rom = copy.copy(rom.buffer)
-    rom.changed_address = {}
+    rom.changed_ranges.clear()
     rom.changed_dma = {}
     rom.force_patch = []
 
@@ -625,28 +886,9 @@ def diff_roms(settings: Settings, diff_rom_file: str) -> None:
     logger.debug('Total Time: %s', time.process_time() - start)
 
 
-def copy_worlds(worlds):
-    worlds = [world.copy() for world in worlds]
-    Item.fix_worlds_after_copy(worlds)
-    return worlds
-
-
-def find_misc_hint_items(spoiler):
-    search = Search([world.state for world in spoiler.worlds])
-    all_locations = [location for world in spoiler.worlds for location in world.get_filled_locations()]
-    for location in search.iter_reachable_locations(all_locations[:]):
-        search.collect(location.item)
-        # include locations that are reachable but not part of the spoiler log playthrough in misc. item hints
-        maybe_set_misc_item_hints(location)
-        all_locations.remove(location)
-    for location in all_locations:
-        # finally, collect unreachable locations for misc. item hints
-        maybe_set_misc_item_hints(location)
-
-
 def compute_coarse_spheres(spoiler):
+    # the search works on copies of the world states, so the worlds themselves are left untouched
     worlds = spoiler.worlds
-    worlds = copy_worlds(worlds)
     collection_spheres = []
     
     # this function tracks spheres in a simplified way: it increments spheres only when "noteworthy" items are collected
@@ -672,16 +914,15 @@ def compute_coarse_spheres(spoiler):
     # get list of all of the progressive items that can appear in hints
     # all_locations: all progressive items. have to collect from these
     # item_locations: only the ones that should appear as "required"/WotH
-    all_locations = [location for world in worlds for location in world.get_filled_locations()]
+    # Items without a solver id never change what is reachable, so they are left out.
+    all_locations = [location for world in worlds for location in world.get_filled_locations() if location.item.solver_id is not None]
     item_locations = {location for location in all_locations if location.item.majoritem and not location.locked and location.item.name != 'Triforce Piece'}
     
     # if the playthrough was generated, filter the list of locations to the
     # locations in the playthrough. The required locations is a subset of these
-    # locations. Can't use the locations directly since they are location to the
-    # copied spoiler world, so must compare via name and world id
+    # locations.
     if spoiler.playthrough:
-        translate = lambda loc: worlds[loc.world.id].get_location(loc.name)
-        spoiler_locations = set(map(translate, itertools.chain.from_iterable(spoiler.playthrough.values())))
+        spoiler_locations = set(itertools.chain.from_iterable(spoiler.playthrough.values()))
         item_locations &= spoiler_locations
     else:
         spoiler_locations = all_locations
@@ -695,13 +936,14 @@ def compute_coarse_spheres(spoiler):
     distribution = spoiler.settings.distribution.world_dists[0]
     for (name, record) in distribution.starting_items.items():
         item = Item(name, world=worlds[0])
-        search.state_list[0].collect(item)
+        if item.solver_id is not None:
+            search.state_list[0].collect(item)
 
     item = worlds[0].get_location("Links Pocket").item
     search.state_list[0].collect(item)
     collection_spheres[-1][item.location] = item.name
 
-    if spoiler.settings.skip_child_zelda:
+    if worlds[0].skip_child_zelda:
         location = worlds[0].get_location("HC Zeldas Letter")
         item = location.item
         search.state_list[0].collect(item)
@@ -790,11 +1032,9 @@ def update_required_items(spoiler):
 
     # if the playthrough was generated, filter the list of locations to the
     # locations in the playthrough. The required locations is a subset of these
-    # locations. Can't use the locations directly since they are location to the
-    # copied spoiler world, so must compare via name and world id
+    # locations.
     if spoiler.playthrough:
-        translate = lambda loc: worlds[loc.world.id].get_location(loc.name)
-        spoiler_locations = set(map(translate, itertools.chain.from_iterable(spoiler.playthrough.values())))
+        spoiler_locations = set(itertools.chain.from_iterable(spoiler.playthrough.values()))
         item_locations &= spoiler_locations
         # Skip even the checks
         _maybe_set_light_arrows = lambda _: None
@@ -804,17 +1044,21 @@ def update_required_items(spoiler):
     required_locations = []
 
     search = Search([world.state for world in worlds])
+    # Beatability is checked against a separate fully explored search that only
+    # re-explores what depends on each removed item.
+    woth_search = IncrementalSearch([world.state for world in worlds])
+    # Only the items the search relied on to win can be required, so only those are removed and rechecked.
+    win_support = woth_search.win_support()
 
     for location in search.iter_reachable_locations(all_locations):
         # Try to remove items one at a time and see if the game is still beatable
         if location in item_locations:
-            old_item = location.item
-            location.item = None
-            # copies state! This is very important as we're in the middle of a search
-            # already, but beneficially, has search it can start from
-            if not search.can_beat_game():
-                required_locations.append(location)
-            location.item = old_item
+            if win_support is None or location in win_support:
+                old_item = location.item
+                location.item = None
+                if not woth_search.can_beat_game():
+                    required_locations.append(location)
+                location.item = old_item
             _maybe_set_light_arrows(location)
         search.state_list[location.item.world.id].collect(location.item)
 
@@ -827,151 +1071,5 @@ def update_required_items(spoiler):
 
 
 def create_playthrough(spoiler):
-    logger = logging.getLogger('')
-    worlds = spoiler.worlds
-    if worlds[0].check_beatable_only and not Search([world.state for world in worlds]).can_beat_game():
-        raise RuntimeError('Game unbeatable after placing all items.')
-    # create a copy as we will modify it
-    old_worlds = worlds
-    worlds = copy_worlds(worlds)
-
-    # if we only check for beatable, we can do this sanity check first before writing down spheres
-    if worlds[0].check_beatable_only and not Search([world.state for world in worlds]).can_beat_game():
-        raise RuntimeError('Uncopied world beatable but copied world is not.')
-
-    search = RewindableSearch([world.state for world in worlds])
-    logger.debug('Initial search: %s', search.state_list[0].get_prog_items())
-    # Get all item locations in the worlds
-    item_locations = search.progression_locations()
-    # Omit certain items from the playthrough
-    internal_locations = {location for location in item_locations if location.internal}
-    # Generate a list of spheres by iterating over reachable locations without collecting as we go.
-    # Collecting every item in one sphere means that every item
-    # in the next sphere is collectable. Will contain every reachable item this way.
-    logger.debug('Building up collection spheres.')
-    collection_spheres = []
-    entrance_spheres = []
-    remaining_entrances = set(entrance for world in worlds for entrance in world.get_shuffled_entrances())
-
-    search.checkpoint()
-    search.collect_pseudo_starting_items()
-    logger.debug('With pseudo starting items: %s', search.state_list[0].get_prog_items())
-
-    while True:
-        search.checkpoint()
-        # Not collecting while the generator runs means we only get one sphere at a time
-        # Otherwise, an item we collect could influence later item collection in the same sphere
-        collected = list(search.iter_reachable_locations(item_locations))
-        if not collected: break
-        random.shuffle(collected)
-        # Gather the new entrances before collecting items.
-        collection_spheres.append(collected)
-        accessed_entrances = set(filter(search.spot_access, remaining_entrances))
-        entrance_spheres.append(list(accessed_entrances))
-        remaining_entrances -= accessed_entrances
-        for location in collected:
-            # Collect the item for the state world it is for
-            search.state_list[location.item.world.id].collect(location.item)
-            maybe_set_misc_item_hints(location)
-    logger.info('Collected %d spheres', len(collection_spheres))
-    spoiler.full_playthrough = dict((location.name, i + 1) for i, sphere in enumerate(collection_spheres) for location in sphere)
-    spoiler.max_sphere = len(collection_spheres)
-
-    # Reduce each sphere in reverse order, by checking if the game is beatable
-    # when we remove the item. We do this to make sure that progressive items
-    # like bow and slingshot appear as early as possible rather than as late as possible.
-    required_locations = []
-    for sphere in reversed(collection_spheres):
-        random.shuffle(sphere)
-        for location in sphere:
-            # we remove the item at location and check if the game is still beatable in case the item could be required
-            old_item = location.item
-
-            # Uncollect the item and location.
-            search.state_list[old_item.world.id].remove(old_item)
-            search.unvisit(location)
-
-            # Generic events might show up or not, as usual, but since we don't
-            # show them in the final output, might as well skip over them. We'll
-            # still need them in the final pass, so make sure to include them.
-            if location.internal:
-                required_locations.append(location)
-                continue
-
-            location.item = None
-
-            # An item can only be required if it isn't already obtained or if it's progressive
-            if search.state_list[old_item.world.id].item_count(old_item.solver_id) < old_item.world.max_progressions[old_item.name]:
-                # Test whether the game is still beatable from here.
-                logger.debug('Checking if %s is required to beat the game.', old_item.name)
-                if not search.can_beat_game():
-                    # still required, so reset the item
-                    location.item = old_item
-                    required_locations.append(location)
-
-    # Reduce each entrance sphere in reverse order, by checking if the game is beatable when we disconnect the entrance.
-    required_entrances = []
-    for sphere in reversed(entrance_spheres):
-        random.shuffle(sphere)
-        for entrance in sphere:
-            # we disconnect the entrance and check if the game is still beatable
-            old_connected_region = entrance.disconnect()
-
-            # we use a new search to ensure the disconnected entrance is no longer used
-            sub_search = Search([world.state for world in worlds])
-
-            # Test whether the game is still beatable from here.
-            logger.debug('Checking if reaching %s, through %s, is required to beat the game.', old_connected_region.name, entrance.name)
-            if not sub_search.can_beat_game():
-                # still required, so reconnect the entrance
-                entrance.connect(old_connected_region)
-                required_entrances.append(entrance)
-
-    # Regenerate the spheres as we might not reach places the same way anymore.
-    search.reset() # search state has no items, okay to reuse sphere 0 cache
-    collection_spheres = []
-    collection_spheres.append(list(filter(lambda loc: loc.item.advancement and loc.item.world.max_progressions[loc.item.name] > 0, search.iter_pseudo_starting_locations())))
-    entrance_spheres = []
-    remaining_entrances = set(required_entrances)
-    collected = set()
-    while True:
-        # Not collecting while the generator runs means we only get one sphere at a time
-        # Otherwise, an item we collect could influence later item collection in the same sphere
-        collected.update(search.iter_reachable_locations(required_locations))
-        if not collected: break
-        internal = collected & internal_locations
-        if internal:
-            # collect only the internal events but don't record them in a sphere
-            for location in internal:
-                search.state_list[location.item.world.id].collect(location.item)
-            # Remaining locations need to be saved to be collected later
-            collected -= internal
-            continue
-        # Gather the new entrances before collecting items.
-        collection_spheres.append(list(collected))
-        accessed_entrances = set(filter(search.spot_access, remaining_entrances))
-        entrance_spheres.append(accessed_entrances)
-        remaining_entrances -= accessed_entrances
-        for location in collected:
-            # Collect the item for the state world it is for
-            search.state_list[location.item.world.id].collect(location.item)
-        collected.clear()
-    logger.info('Collected %d final spheres', len(collection_spheres))
-
-    if not search.can_beat_game(False):
-        logger.error('Playthrough could not beat the game!')
-        # Add temporary debugging info or breakpoint here if this happens
-
-    # Then we can finally output our playthrough
-    spoiler.playthrough = OrderedDict((str(i), {location: location.item for location in sphere}) for i, sphere in enumerate(collection_spheres))
-    # Copy our misc. hint items, since we set them in the world copy
-    for w, sw in zip(worlds, spoiler.worlds):
-        # But the actual location saved here may be in a different world
-        for item_name, item_location in w.hinted_dungeon_reward_locations.items():
-            sw.hinted_dungeon_reward_locations[item_name] = spoiler.worlds[item_location.world.id].get_location(item_location.name)
-        for hint_type, item_location in w.misc_hint_item_locations.items():
-            sw.misc_hint_item_locations[hint_type] = spoiler.worlds[item_location.world.id].get_location(item_location.name)
-
-    if worlds[0].entrance_shuffle:
-        spoiler.entrance_playthrough = OrderedDict((str(i + 1), list(sphere)) for i, sphere in enumerate(entrance_spheres))
->>>>>>> df604360 (Implements coarse spheres + last woth)
+    # the playthrough reduces the shared world graph in place through a journal
+    spoiler.create_playthrough()
@@ -446,7 +446,7 @@ def rebuild_sequences(rom: Rom, sequences: list[Sequence], log: CosmeticsLog, sy
     # Check if the new audio sequence is larger than the vanilla one
     if address > audioseq_size:
         # Zero out the old audio sequence
-        rom.buffer[audioseq_start:audioseq_end] = [0] * audioseq_size
+        rom.write_bytes(audioseq_start, [0] * audioseq_size)
 
         # Find free space and update dmatable
         new_address = rom.dma.free_space(address)
@@ -1,86 +1,159 @@
 from __future__ import annotations
-import copy
+import bisect
+import itertools
 import random
+import re
 import zipfile
 import zlib
 from typing import TYPE_CHECKING, Optional
 
-from Rom import Rom
+from Rom import Rom, diff_runs
 from ntype import BigStream
 
 if TYPE_CHECKING:
     from Settings import Settings
 
 
-# get the next XOR key. Uses some location in the source rom.
-# This will skip of 0s, since if we hit a block of 0s, the
-# patch data will be raw.
-def key_next(rom: Rom, key_address: int, address_range: tuple[int, int]) -> tuple[int, int]:
-    key = 0
-    while key == 0:
-        key_address += 1
-        if key_address > address_range[1]:
-            key_address = address_range[0]
-        key = rom.original.buffer[key_address]
-    return key, key_address
+# The XOR keys are the nonzero bytes of a range of the source rom, read in order
+# from some starting address and wrapping around at the end of the range.
+# 0s are skipped, since if we hit a block of 0s, the patch data would be raw.
+# The keys are gathered once, so a whole run of bytes can be XORed in one go.
+class XorKeyStream:
+    def __init__(self, rom: Rom, xor_address: int, xor_range: tuple[int, int]) -> None:
+        key_range = bytes(rom.original.buffer[xor_range[0]:xor_range[1] + 1])
+        self.keys: bytes = key_range.translate(None, b'\x00')
+        # The first key is the first nonzero byte after xor_address.
+        self.index: int = len(key_range[:xor_address - xor_range[0] + 1].translate(None, b'\x00')) % len(self.keys)
+
+    # Returns the next count keys without using them up.
+    def peek(self, count: int) -> bytes:
+        keys = self.keys[self.index:self.index + count]
+        while len(keys) < count:
+            keys += self.keys[:count - len(keys)]
+        return keys
+
+    def skip(self, count: int) -> None:
+        self.index = (self.index + count) % len(self.keys)
+
+    def next(self) -> int:
+        key = self.keys[self.index]
+        self.skip(1)
+        return key
+
+    def xor(self, data: bytes | bytearray) -> bytes:
+        xored = xor_bytes(data, self.peek(len(data)))
+        self.skip(len(data))
+        return xored
+
+
+def xor_bytes(data: bytes | bytearray, keys: bytes | bytearray) -> bytes:
+    return (int.from_bytes(data, 'big') ^ int.from_bytes(keys, 'big')).to_bytes(len(data), 'big')
+
+
+# Splits data into alternating runs of 0s and nonzero bytes, starting and ending with a (maybe empty) run of 0s.
+_nonzero_split: re.Pattern[bytes] = re.compile(rb'([^\x00]+)')
+MAX_SECTION_SIZE: int = 0xFFFF
+# How many bytes are XORed at a time, since a key that matches its byte
+# changes which key every later byte gets.
+XOR_WINDOW: int = 0x200
+
+
+# Returns where each nonzero run ends among the nonzero bytes.
+def nonzero_run_ends(runs: list[bytes]) -> list[int]:
+    return list(itertools.accumulate(map(len, runs[1::2])))
+
+
+# Returns the runs joined back together, with the nonzero bytes replaced, in order, by values.
+def replace_nonzero(runs: list[bytes], values: bytes | bytearray) -> bytearray:
+    run_ends = nonzero_run_ends(runs)
+    runs = runs.copy()
+    runs[1::2] = list(map(values.__getitem__, map(slice, [0] + run_ends[:-1], run_ends)))
+    return bytearray(b''.join(runs))
 
 
 # creates a XOR block for the patch. This might break it up into
 # multiple smaller blocks if there is a concern about the XOR key
 # or if it is too long.
-def write_block(rom: Rom, xor_address: int, xor_range: tuple[int, int], block_start: int,
-                data: list[int], patch_data: BigStream) -> int:
-    new_data = []
-    key_offset = 0
-    continue_block = False
-
-    for b in data:
-        if b == 0:
-            # Leave 0s as 0s. Do not XOR
-            new_data += [0]
-        else:
-            # get the next XOR key
-            key, xor_address = key_next(rom, xor_address, xor_range)
-
+def write_block(keys: XorKeyStream, block_start: int, data: bytes | bytearray, patch_data: BigStream) -> None:
+    # 0s are left as 0s, so only the nonzero bytes use up keys.
+    runs = _nonzero_split.split(data)
+    nonzero = b''.join(runs[1::2])
+    xored = bytearray()
+    # Where the nonzero bytes that had to skip keys are among the nonzero bytes, and how many they skipped.
+    skipped_bytes = []
+    skipped_keys = []
+    while len(xored) < len(nonzero):
+        # XOR as many bytes as possible, up to the first one that matches its key.
+        window = nonzero[len(xored):len(xored) + XOR_WINDOW]
+        window_xored = xor_bytes(window, keys.peek(len(window)))
+        safe = window_xored.find(0)
+        if safe < 0:
+            safe = len(window_xored)
+        xored += window_xored[:safe]
+        keys.skip(safe)
+        if safe < len(window_xored):
             # if the XOR would result in 0, change the key.
             # This requires breaking up the block.
-            if b == key:
-                write_block_section(block_start, key_offset, new_data, patch_data, continue_block)
-                new_data = []
-                key_offset = 0
-                continue_block = True
-
-                # search for next safe XOR key
-                while b == key:
-                    key_offset += 1
-                    key, xor_address = key_next(rom, xor_address, xor_range)
-                    # if we aren't able to find one quickly, we may need to break again
-                    if key_offset == 0xFF:
-                        write_block_section(block_start, key_offset, new_data, patch_data, continue_block)
-                        new_data = []
-                        key_offset = 0
-                        continue_block = True
-
+            b = window[safe]
+            key = keys.next()
+            skipped = 0
+            # search for next safe XOR key
+            while b == key:
+                skipped += 1
+                key = keys.next()
+            skipped_bytes.append(len(xored))
+            skipped_keys.append(skipped)
             # XOR the key with the byte
-            new_data += [b ^ key]
+            xored.append(b ^ key)
+    new_data = replace_nonzero(runs, xored)
+
+    # Find where in the block the bytes that skipped keys are.
+    run_ends = nonzero_run_ends(runs)
+    run_starts = list(itertools.accumulate(map(len, runs)))[0::2]
+    skipped_addresses = []
+    for index in skipped_bytes:
+        run = bisect.bisect_right(run_ends, index)
+        skipped_addresses.append(run_starts[run] + index - (run_ends[run - 1] if run else 0))
+
+    section_start = 0
+    key_offset = 0
+    continue_block = False
 
-            # Break the block if it's too long
-            if len(new_data) == 0xFFFF:
-                write_block_section(block_start, key_offset, new_data, patch_data, continue_block)
-                new_data = []
-                key_offset = 0
-                continue_block = True
+    def save_section(section_end: int, key_skip: int) -> None:
+        nonlocal section_start, continue_block
+        write_block_section(block_start, key_skip, new_data[section_start:section_end], patch_data, continue_block)
+        section_start = section_end
+        continue_block = True
+
+    # Save the sections up to (not including) section_end, breaking them if they're too long.
+    # A section filled up by a nonzero byte is saved right away, even if nothing follows it.
+    def save_sections(section_end: int) -> None:
+        nonlocal key_offset
+        while section_end - section_start > MAX_SECTION_SIZE or \
+                (section_end - section_start == MAX_SECTION_SIZE and data[section_end - 1] != 0):
+            save_section(section_start + MAX_SECTION_SIZE, key_offset)
+            key_offset = 0
+        save_section(section_end, key_offset)
+        key_offset = 0
+
+    # Break the block before every byte that had to skip keys.
+    for section_break, skipped in zip(skipped_addresses, skipped_keys):
+        save_sections(section_break)
+        # if we aren't able to find a key quickly, we may need to break again
+        while skipped >= 0xFF:
+            save_section(section_start, 0xFF)
+            skipped -= 0xFF
+        key_offset = skipped
 
     # Save the block
-    write_block_section(block_start, key_offset, new_data, patch_data, continue_block)
-    return xor_address
+    save_sections(len(data))
 
 
 # This saves a sub-block for the XOR block. If it's the first part
 # then it will include the address to write to. Otherwise, it will
 # have a number of XOR keys to skip and then continue writing after
 # the previous block
-def write_block_section(start: int, key_skip: int, in_data: list[int], patch_data: BigStream, is_continue: bool) -> None:
+def write_block_section(start: int, key_skip: int, in_data: bytes | bytearray, patch_data: BigStream, is_continue: bool) -> None:
     if not is_continue:
         patch_data.append_int32(start)
     else:
@@ -107,8 +180,9 @@ def create_patch_file(rom: Rom, file: str, xor_range: tuple[int, int] = (0x00B8A
     # doesn't have many sections of 0s
     xor_address = random.Random().randint(*xor_range)
     patch_data.append_int32(xor_address)
+    keys = XorKeyStream(rom, xor_address, xor_range)
 
-    new_buffer = copy.copy(rom.original.buffer)
+    new_buffer = bytearray(rom.original.buffer)
 
     # write every changed DMA entry
     for dma_index, (from_file, start, size) in rom.changed_dma.items():
@@ -120,8 +194,7 @@ def create_patch_file(rom: Rom, file: str, xor_range: tuple[int, int] = (0x00B8A
         # We don't trust files that have modified DMA to have their
         # changed addresses tracked correctly, so we invalidate the
         # entire file
-        for address in range(start, start + size):
-            rom.changed_address[address] = rom.buffer[address]
+        rom.changed_ranges.add(start, start + size)
 
         # Simulate moving the files to know which addresses have changed
         if from_file >= 0:
@@ -136,39 +209,39 @@ def create_patch_file(rom: Rom, file: str, xor_range: tuple[int, int] = (0x00B8A
     # end of DMA entries
     patch_data.append_int16(0xFFFF)
 
-    # filter down the addresses that will actually need to change.
+    # filter down the addresses that will actually need to change, by comparing
+    # the written ranges against the unpatched rom.
     # Make sure to not include any of the DMA table addresses
-    changed_addresses = [address for address, value in rom.changed_address.items()
-                         if (address >= dma_end or address < dma_start) and
-                         (address in rom.force_patch or new_buffer[address] != value)]
-    changed_addresses.sort()
+    changed_runs = []
+    for range_start, range_end in rom.changed_ranges:
+        for start, end in ((range_start, min(range_end, dma_start)), (max(range_start, dma_end), range_end)):
+            if start < end:
+                changed_runs.extend(diff_runs(rom.buffer, new_buffer, start, end))
+    changed_runs.extend((address, address + 1) for address in set(rom.force_patch)
+                        if address in rom.changed_ranges and (address >= dma_end or address < dma_start))
+    changed_runs.sort()
 
     # Write the address changes. We'll store the data with XOR so that
     # the patch data won't be raw data from the patched rom.
-    data = []
     block_start = block_end = None
     BLOCK_HEADER_SIZE = 7  # this is used to break up gaps
-    for address in changed_addresses:
+    for start, end in changed_runs:
         # if there's a block to write and there's a gap, write it
-        if block_start:
-            block_end = block_start + len(data) - 1
-            if address > block_end + BLOCK_HEADER_SIZE:
-                xor_address = write_block(rom, xor_address, xor_range, block_start, data, patch_data)
-                data = []
-                block_start = None
-                block_end = None
+        if block_start is not None and start > block_end + BLOCK_HEADER_SIZE:
+            write_block(keys, block_start, rom.buffer[block_start:block_end+1], patch_data)
+            block_start = None
 
         # start a new block
-        if not block_start:
-            block_start = address
-            block_end = address - 1
+        if block_start is None:
+            block_start = start
+            block_end = start - 1
 
         # save the new data
-        data += rom.buffer[block_end+1:address+1]
+        block_end = max(block_end, end - 1)
 
     # if there was any leftover blocks, write them out
-    if block_start:
-        xor_address = write_block(rom, xor_address, xor_range, block_start, data, patch_data)
+    if block_start is not None:
+        write_block(keys, block_start, rom.buffer[block_start:block_end+1], patch_data)
 
     # compress the patch file
     patch_data = bytes(patch_data.buffer)
@@ -209,6 +282,7 @@ def apply_patch_file(rom: Rom, settings: Settings, sub_file: Optional[str] = Non
     dma_start = patch_data.read_int32()
     xor_range = (patch_data.read_int32(), patch_data.read_int32())
     xor_address = patch_data.read_int32()
+    keys = XorKeyStream(rom, xor_address, xor_range)
 
     # Load all the DMA table updates. This will move the files around.
     # A key thing is that some of these entries will list a source file
@@ -238,10 +312,10 @@ def apply_patch_file(rom: Rom, settings: Settings, sub_file: Optional[str] = Non
             old_dma_start, old_dma_end, old_size = rom.original.dma.get_dmadata_record_by_key(from_file).as_tuple()
             copy_size = min(size, old_size)
             rom.write_bytes(start, rom.original.read_bytes(from_file, copy_size))
-            rom.buffer[start+copy_size:start+size] = [0] * (size - copy_size)
+            rom.write_bytes(start+copy_size, bytes(size - copy_size))
         else:
             # if it's a new file, fill with 0s
-            rom.buffer[start:start+size] = [0] * size
+            rom.write_bytes(start, bytes(size))
 
     # Read in the XOR data blocks. This goes to the end of the file.
     block_start = 0
@@ -258,19 +332,12 @@ def apply_patch_file(rom: Rom, settings: Settings, sub_file: Optional[str] = Non
             key_skip = patch_data.read_byte()
             block_size = patch_data.read_int16()
             # skip specified XOR keys
-            for _ in range(key_skip):
-                key, xor_address = key_next(rom, xor_address, xor_range)
-
-        # read in the new data
-        data = []
-        for b in patch_data.read_bytes(length=block_size):
-            if b == 0:
-                # keep 0s as 0s
-                data += [0]
-            else:
-                # The XOR will always be safe and will never produce 0
-                key, xor_address = key_next(rom, xor_address, xor_range)
-                data += [b ^ key]
+            keys.skip(key_skip)
+
+        # read in the new data, keeping 0s as 0s.
+        # The XOR will always be safe and will never produce 0
+        runs = _nonzero_split.split(patch_data.read_bytes(length=block_size))
+        data = replace_nonzero(runs, keys.xor(b''.join(runs[1::2])))
 
         # Save the new data to rom
         if settings.repatch_cosmetics:
@@ -11,10 +11,11 @@ import time
 
 
 def start() -> None:
-    from Main import main, from_patch_file, cosmetic_patch, diff_roms
+    from Main import main, from_patch_file, cosmetic_patch, diff_roms, generate_batch
+    from RuleParser import load_rule_cache, save_rule_cache
     from Settings import get_settings_from_command_line_args
     from Utils import check_version, VersionError, local_path
-    settings, gui, args_loglevel, no_log_file, diff_rom = get_settings_from_command_line_args()
+    settings, gui, args_loglevel, no_log_file, diff_rom, jobs, logic_cache, artifact_cache = get_settings_from_command_line_args()
 
     # set up logger
     loglevel = {'error': logging.ERROR, 'info': logging.INFO, 'warning': logging.WARNING, 'debug': logging.DEBUG}[args_loglevel]
@@ -38,6 +39,9 @@ def start() -> None:
         except VersionError as e:
             logger.warning(str(e))
 
+    if logic_cache:
+        load_rule_cache(logic_cache)
+
     try:
         if gui:
             from Gui import gui_main
@@ -48,13 +52,17 @@ def start() -> None:
             cosmetic_patch(settings)
         elif settings.patch_file != '':
             from_patch_file(settings)
+        elif settings.count is not None and settings.count > 1 and jobs > 1:
+            generate_batch(settings, jobs, logic_cache, artifact_cache)
         elif settings.count is not None and settings.count > 1:
             orig_seed = settings.seed
             for i in range(settings.count):
                 settings.update_seed(orig_seed + '-' + str(i))
-                main(settings)
+                main(settings, artifact_cache=artifact_cache)
         else:
-            main(settings)
+            main(settings, artifact_cache=artifact_cache)
+        if logic_cache:
+            save_rule_cache(logic_cache)
     except Exception as ex:
         logger.exception(ex)
         sys.exit(1)
@@ -1,6 +1,11 @@
 from __future__ import annotations
 import datetime
+import glob
+import hashlib
 import itertools
+import logging
+import os
+import pickle
 import random
 import re
 import struct
@@ -22,15 +27,18 @@ from Messages import read_messages, update_message_by_id, read_shop_items, updat
         add_item_messages, repack_messages, shuffle_messages, \
         get_message_by_id, TextCode
 from OcarinaSongs import patch_songs
+import MQ
 from MQ import patch_files, File, update_dmadata, insert_space, add_relocations
-from Rom import Rom
+from Rom import Rom, RomLayer
 from SaveContext import SaveContext, Scenes, FlagType
 from SceneFlags import get_alt_list_bytes, get_collectible_flag_table, get_collectible_flag_table_bytes
 from Sounds import move_audiobank_table
 from Spoiler import Spoiler
-from Utils import data_path
+from Utils import data_path, local_path
 from World import World
 from TextBox import line_wrap
+import ntype
+import texture_util
 from texture_util import ci4_rgba16patch_to_ci8, rgba16_patch
 from version import __version__
 
@@ -42,7 +50,72 @@ else:
 OverrideEntry: TypeAlias = "tuple[int, int, int, int, int, int]"
 
 
-def patch_rom(spoiler: Spoiler, world: World, rom: Rom) -> Rom:
+# The files the static base layer is made from, besides the rom itself:
+# its data files, and the modules of every function patch_static_base writes the rom with.
+def static_base_sources() -> list[str]:
+    sources = [data_path('generated/rom_patch.txt'), data_path('title.bin'), data_path('keaton.bin')]
+    sources += sorted(glob.glob(data_path('items/*.zobj')))
+    sources += sorted(glob.glob(data_path('textures/**/*.bin'), recursive=True))
+    sources += [__file__, sys.modules[Rom.__module__].__file__, MQ.__file__, texture_util.__file__, ntype.__file__]
+    return sources
+
+
+# The digest of the static base sources, read once per process.
+static_base_sources_digest: Optional[bytes] = None
+
+
+# Identifies a static base layer by the randomizer version, the files it's made from and the rom it's applied to.
+def static_base_key(rom: Rom) -> str:
+    global static_base_sources_digest
+    if static_base_sources_digest is None:
+        sources = hashlib.blake2b(digest_size=20)
+        for source in static_base_sources():
+            with open(source, 'rb') as stream:
+                sources.update(stream.read())
+        static_base_sources_digest = sources.digest()
+    key = hashlib.blake2b(__version__.encode(), digest_size=20)
+    key.update(static_base_sources_digest)
+    key.update(rom.original.digest())
+    return key.hexdigest()
+
+
+static_base_layers: dict[str, RomLayer] = {}
+
+
+# Applies the static base layer, reusing it from memory or from the cache folder if it was made before.
+# Saving a new layer deletes the ones saved for other keys, which are left over from older sources or roms.
+def apply_static_base(rom: Rom) -> None:
+    key = static_base_key(rom)
+    cache_dir = local_path('cache')
+    cache_file = os.path.join(cache_dir, f'base_patch_{key}.pkl')
+    layer = static_base_layers.get(key)
+    if layer is None and os.path.isfile(cache_file):
+        try:
+            with open(cache_file, 'rb') as stream:
+                layer = pickle.load(stream)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            logging.getLogger('').debug('Ignoring unreadable base patch cache: %s', cache_file)
+
+    if layer is not None:
+        layer.apply(rom)
+    else:
+        patch_static_base(rom)
+        layer = RomLayer.capture(rom)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(cache_file, 'wb') as stream:
+                pickle.dump(layer, stream)
+            for stale_file in glob.glob(os.path.join(cache_dir, 'base_patch_*.pkl')):
+                if stale_file != cache_file:
+                    os.remove(stale_file)
+        except OSError:
+            logging.getLogger('').debug('Unable to save base patch cache: %s', cache_file)
+    static_base_layers[key] = layer
+
+
+# The part of the patching that doesn't depend on the settings or the seed: the ASM patch,
+# the binary asset patches, the extended objects and the pot/crate textures.
+def patch_static_base(rom: Rom) -> None:
     with open(data_path('generated/rom_patch.txt'), 'r') as stream:
         for line in stream:
             address, value = [int(x, 16) for x in line.split(',')]
@@ -89,9 +162,6 @@ def patch_rom(spoiler: Spoiler, world: World, rom: Rom) -> Rom:
         ('object_gi_cbutton',     data_path('items/C_Button_Vertical.zobj'),   0x1AA),  # C button Vertical
     )
 
-    if world.settings.key_appearance_match_dungeon:
-        rom.write_byte(rom.sym('CUSTOM_KEY_MODELS'), 0x01)
-
     extended_objects_start = start_address = rom.dma.free_space()
     for name, zobj_path, object_id in zobj_imports:
         with open(zobj_path, 'rb') as stream:
@@ -122,7 +192,7 @@ def patch_rom(spoiler: Spoiler, world: World, rom: Rom) -> Rom:
     # Add the new models to the extended object file.
     for name, start, end, object_id, patches in zobj_patches:
         end_address = start_address + end - start
-        rom.buffer[start_address:end_address] = rom.buffer[start:end]
+        rom.write_bytes(start_address, rom.buffer[start:end])
         # Apply patches
         for offset, patch in patches:
             rom.write_bytes(start_address + offset, patch)
@@ -188,6 +258,13 @@ def patch_rom(spoiler: Spoiler, world: World, rom: Rom) -> Rom:
     # Add the extended texture data to the DMA table.
     rom.update_dmadata_record_by_key(None, extended_textures_start, end_address)
 
+
+def patch_rom(spoiler: Spoiler, world: World, rom: Rom) -> Rom:
+    apply_static_base(rom)
+
+    if world.settings.key_appearance_match_dungeon:
+        rom.write_byte(rom.sym('CUSTOM_KEY_MODELS'), 0x01)
+
     # Create an option so that recovery hearts no longer drop by changing the code which checks Link's health when an item is spawned.
     if world.settings.no_collectible_hearts:
         symbol = rom.sym('NO_COLLECTIBLE_HEARTS')
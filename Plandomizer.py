@@ -223,6 +223,12 @@ class StarterRecord(Record):
     def copy(self) -> StarterRecord:
         return StarterRecord(self.count)
 
+    # Default factory for starting item dicts. Unlike a lambda it can be pickled,
+    # so settings holding those dicts can be sent to worker processes.
+    @staticmethod
+    def empty() -> StarterRecord:
+        return StarterRecord(0)
+
     def to_json(self) -> int:
         return self.count
 
@@ -1051,7 +1057,7 @@ class WorldDistribution:
 
     @property
     def starting_items(self) -> dict[str, StarterRecord]:
-        data = defaultdict(lambda: StarterRecord(0))
+        data = defaultdict(StarterRecord.empty)
         world_names = ['World %d' % (i + 1) for i in range(len(self.distribution.world_dists))]
 
         # For each entry here of the form 'World %d', apply that entry to that world.
@@ -1255,7 +1261,7 @@ class Distribution:
 
         # normalize starting items to use the dictionary format
         starting_items = itertools.chain(self.settings.starting_equipment, self.settings.starting_songs, self.settings.starting_inventory)
-        data: dict[str, StarterRecord | dict[str, StarterRecord]] = defaultdict(lambda: StarterRecord(0))
+        data: dict[str, StarterRecord | dict[str, StarterRecord]] = defaultdict(StarterRecord.empty)
         if isinstance(self.settings.starting_items, dict) and self.settings.starting_items:
             world_names = ['World %d' % (i + 1) for i in range(len(self.world_dists))]
             for name, record in self.settings.starting_items.items():
@@ -1,9 +1,14 @@
 from __future__ import annotations
 import copy
+import hashlib
 import json
+import mmap
 import os
 import platform
+import re
+import struct
 import subprocess
+from bisect import bisect_left, bisect_right, insort
 from collections.abc import Iterator, Sequence
 from typing import Optional
 
@@ -14,19 +19,23 @@ from ntype import BigStream
 from version import base_version, branch_identifier, supplementary_version
 
 DMADATA_START: int = 0x7430  # NTSC 1.0/1.1: 0x7430, NTSC 1.2: 0x7960, Debug: 0x012F70
+DECOMPRESSED_CRC: list[int] = [0x93, 0x52, 0x2E, 0x7B, 0xE5, 0x06, 0xD4, 0x27]
 
 
 class Rom(BigStream):
-    def __init__(self, file: Optional[str] = None) -> None:
+    # base is an already decompressed and extended rom buffer to use instead of reading file,
+    # such as the original buffer of another Rom shared between generator processes.
+    def __init__(self, file: Optional[str] = None, base: Optional[bytes | bytearray | memoryview] = None) -> None:
         super().__init__(bytearray())
 
         self.original: Rom = self
-        self.changed_address: dict[int, int] = {}
+        self.changed_ranges: ChangedRanges = ChangedRanges()
         self.changed_dma: dict[int, tuple[int, int, int]] = {}
         self.force_patch: list[int] = []
         self.dma: DMAIterator = DMAIterator(self, DMADATA_START)
+        self._digest: Optional[tuple[bytes | bytearray | memoryview, bytes]] = None
 
-        if file is None:
+        if file is None and base is None:
             return
 
         decompressed_file: str = local_path('ZOOTDEC.z64')
@@ -37,35 +46,65 @@ class Rom(BigStream):
             symbols = json.load(stream)
             self.symbols: dict[str, int] = {name: int(addr, 16) for name, addr in symbols.items()}
 
-        if os.path.isfile(decompressed_file):
-            # Try to read from previously decompressed rom if one exists.
-            try:
-                self.read_rom(decompressed_file)
-            except (FileNotFoundError, RuntimeError):
-                # Decompress the provided file.
-                if not file:
-                    raise FileNotFoundError('Must specify path to base ROM')
+        original: Optional[bytes | bytearray | memoryview] = base
+        if original is None and os.path.isfile(decompressed_file):
+            original = self.map_rom(decompressed_file)
+        if original is None:
+            if os.path.isfile(decompressed_file):
+                # Try to read from previously decompressed rom if one exists.
+                try:
+                    self.read_rom(decompressed_file)
+                except (FileNotFoundError, RuntimeError):
+                    # Decompress the provided file.
+                    if not file:
+                        raise FileNotFoundError('Must specify path to base ROM')
+                    self.read_rom(file, decompressed_file)
+            elif file:
                 self.read_rom(file, decompressed_file)
-        elif file:
-            self.read_rom(file, decompressed_file)
-        else:
-            raise FileNotFoundError('Must specify path to base ROM')
+            else:
+                raise FileNotFoundError('Must specify path to base ROM')
+
+            # Add file to maximum size
+            self.buffer.extend(bytearray([0x00] * (0x4000000 - len(self.buffer))))
+            original = self.buffer
 
-        # Add file to maximum size
-        self.buffer.extend(bytearray([0x00] * (0x4000000 - len(self.buffer))))
-        self.original = self.copy()
+        # The original is only ever read, so it can be the mapped file or shared buffer itself.
+        self.original = Rom()
+        self.original.buffer = original
+        self.buffer = bytearray(original)
 
         # Add version number to header.
         self.write_version_bytes()
 
+    # A digest of the buffer, computed again only once the buffer is replaced.
+    # Meant for the original rom, whose buffer is never written to.
+    def digest(self) -> bytes:
+        if self._digest is None or self._digest[0] is not self.buffer:
+            self._digest = (self.buffer, hashlib.blake2b(self.buffer, digest_size=20).digest())
+        return self._digest[1]
+
     def copy(self) -> Rom:
         new_rom: Rom = Rom()
-        new_rom.buffer = copy.copy(self.buffer)
-        new_rom.changed_address = copy.copy(self.changed_address)
+        new_rom.buffer = bytearray(self.buffer)
+        new_rom.changed_ranges = self.changed_ranges.copy()
         new_rom.changed_dma = copy.copy(self.changed_dma)
         new_rom.force_patch = copy.copy(self.force_patch)
         return new_rom
 
+    # Maps an already decompressed and extended rom file read-only, so every process
+    # using it shares the same memory. Returns None if the file isn't one.
+    @staticmethod
+    def map_rom(input_file: str) -> Optional[memoryview]:
+        try:
+            with open(input_file, 'rb') as stream:
+                mapped = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        if len(mapped) != 0x4000000 or list(mapped[0x10:0x18]) != DECOMPRESSED_CRC:
+            mapped.close()
+            return None
+        return memoryview(mapped)
+
     def read_rom(self, input_file: str, output_file: Optional[str] = None, verify_crc: bool = True) -> None:
         try:
             with open(input_file, 'rb') as stream:
@@ -80,7 +119,7 @@ class Rom(BigStream):
         valid_crc = [
             [0xEC, 0x70, 0x11, 0xB7, 0x76, 0x16, 0xD7, 0x2B], # Compressed
             [0x70, 0xEC, 0xB7, 0x11, 0x16, 0x76, 0x2B, 0xD7], # Byteswap compressed
-            [0x93, 0x52, 0x2E, 0x7B, 0xE5, 0x06, 0xD4, 0x27], # Decompressed
+            DECOMPRESSED_CRC,
         ]
 
         file_name = os.path.splitext(input_file)
@@ -131,7 +170,9 @@ class Rom(BigStream):
 
     def write_byte(self, address: int, value: int) -> None:
         super().write_byte(address, value)
-        self.changed_address[self.last_address-1] = value
+        self.changed_ranges.add(self.last_address - 1, self.last_address)
+        if self.dma.dma_start < self.last_address <= self.dma.dma_end:
+            self.dma.update_index(self.last_address - 1, self.last_address)
 
     def write_bytes_restrictive(self, start: int, size: int, values: Sequence[int]) -> None:
         for i in range(size):
@@ -147,11 +188,23 @@ class Rom(BigStream):
 
     def write_bytes(self, address: int, values: Sequence[int]) -> None:
         super().write_bytes(address, values)
-        self.changed_address.update(zip(range(address, address + len(values)), values))
+        start = self.last_address - len(values)
+        self.changed_ranges.add(start, self.last_address)
+        if start < self.dma.dma_end and self.last_address > self.dma.dma_start:
+            self.dma.update_index(start, self.last_address)
 
+    # Every write goes through write_byte or write_bytes, so changed_ranges covers every byte
+    # that may differ from the original, and only those have to be put back.
     def restore(self) -> None:
-        self.buffer = copy.copy(self.original.buffer)
-        self.changed_address = {}
+        if len(self.buffer) == len(self.original.buffer):
+            with memoryview(self.original.buffer) as original:
+                for start, end in self.changed_ranges:
+                    self.buffer[start:end] = original[start:end]
+                    if start < self.dma.dma_end and end > self.dma.dma_start:
+                        self.dma.update_index(start, end)
+        else:
+            self.buffer = bytearray(self.original.buffer)
+        self.changed_ranges = ChangedRanges()
         self.changed_dma = {}
         self.force_patch = []
         self.last_address = 0
@@ -243,20 +296,113 @@ class Rom(BigStream):
                     from_file = old_dma_start
                 self.changed_dma[dma_entry.index] = (from_file, dma_start, dma_end - dma_start)
 
-    # This will rescan the entire ROM, compare to original ROM, and repopulate changed_address.
+    # This will rescan the entire ROM, compare to original ROM, and repopulate changed_ranges.
     def rescan_changed_bytes(self) -> None:
-        self.changed_address = {}
+        self.changed_ranges = ChangedRanges()
         size = len(self.buffer)
         original_size = len(self.original.buffer)
-        for i, byte in enumerate(self.buffer):
-            if i >= original_size:
-                self.changed_address[i] = byte
-                continue
-            orig_byte = self.original.read_byte(i)
-            if byte != orig_byte:
-                self.changed_address[i] = byte
-        if size < original_size:
-            self.changed_address.update(zip(range(size, original_size-1), [0]*(original_size-size)))
+        for start, end in diff_runs(self.buffer, self.original.buffer, 0, min(size, original_size)):
+            self.changed_ranges.add(start, end)
+        if size > original_size:
+            self.changed_ranges.add(original_size, size)
+        elif size < original_size:
+            self.changed_ranges.add(size, original_size - 1)
+
+
+# The changes made to a Rom since it was last restored, as the changed ranges,
+# their bytes packed back to back, the changed dma records and the forced patch addresses.
+class RomLayer:
+    def __init__(self, ranges: list[tuple[int, int]], data: bytes, changed_dma: dict[int, tuple[int, int, int]], force_patch: list[int]) -> None:
+        self.ranges: list[tuple[int, int]] = ranges
+        self.data: bytes = data
+        self.changed_dma: dict[int, tuple[int, int, int]] = changed_dma
+        self.force_patch: list[int] = force_patch
+
+    @classmethod
+    def capture(cls, rom: Rom) -> RomLayer:
+        ranges = list(rom.changed_ranges)
+        buffer = memoryview(rom.buffer)
+        data = b''.join(buffer[start:end] for start, end in ranges)
+        return cls(ranges, data, dict(rom.changed_dma), list(rom.force_patch))
+
+    def apply(self, rom: Rom) -> None:
+        data = memoryview(self.data)
+        offset = 0
+        for start, end in self.ranges:
+            rom.write_bytes(start, data[offset:offset + end - start])
+            offset += end - start
+        rom.changed_dma.update(self.changed_dma)
+        rom.force_patch.extend(self.force_patch)
+
+
+# The addresses written to a Rom, as sorted and disjoint [start, end) ranges.
+# Overlapping and adjacent writes are merged into one range, so a file written
+# byte by byte takes a single entry.
+class ChangedRanges:
+    def __init__(self) -> None:
+        self.starts: list[int] = []
+        self.ends: list[int] = []
+
+    def add(self, start: int, end: int) -> None:
+        if start >= end:
+            return
+        starts, ends = self.starts, self.ends
+        # Most writes go after or extend the last range.
+        if starts and start >= starts[-1]:
+            if start <= ends[-1]:
+                if end > ends[-1]:
+                    ends[-1] = end
+            else:
+                starts.append(start)
+                ends.append(end)
+            return
+        # Merge every range that overlaps or touches the new one.
+        first = bisect_left(ends, start)
+        last = bisect_right(starts, end)
+        if first < last:
+            start = min(start, starts[first])
+            end = max(end, ends[last - 1])
+        starts[first:last] = [start]
+        ends[first:last] = [end]
+
+    def clear(self) -> None:
+        self.starts.clear()
+        self.ends.clear()
+
+    def copy(self) -> ChangedRanges:
+        new_ranges = ChangedRanges()
+        new_ranges.starts = list(self.starts)
+        new_ranges.ends = list(self.ends)
+        return new_ranges
+
+    def __contains__(self, address: int) -> bool:
+        i = bisect_right(self.starts, address) - 1
+        return i >= 0 and address < self.ends[i]
+
+    def __iter__(self) -> Iterator[tuple[int, int]]:
+        return zip(self.starts, self.ends)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+
+_nonzero_run: re.Pattern[bytes] = re.compile(rb'[^\x00]+')
+
+
+# Yields the [start, end) runs of addresses between start and end where the two buffers differ.
+# Runs may be split at chunk boundaries.
+def diff_runs(buffer: bytes | bytearray, other: bytes | bytearray, start: int, end: int,
+              chunk_size: int = 0x100000) -> Iterator[tuple[int, int]]:
+    for chunk_start in range(start, end, chunk_size):
+        chunk_end = min(chunk_start + chunk_size, end)
+        data = buffer[chunk_start:chunk_end]
+        other_data = other[chunk_start:chunk_end]
+        if data == other_data:
+            continue
+        # The xor of the two chunks is zero exactly where they agree.
+        diff = (int.from_bytes(data, 'big') ^ int.from_bytes(other_data, 'big')).to_bytes(chunk_end - chunk_start, 'big')
+        for match in _nonzero_run.finditer(diff):
+            yield chunk_start + match.start(), chunk_start + match.end()
 
 
 class DMAEntry:
@@ -306,6 +452,18 @@ class DMAIterator:
         self.dma_end: int = 0
         self._dma_entries: int = 0
 
+        # An index of the table, built on first use and kept up to date by the rom's writes to the table.
+        # It is rebuilt if the rom's buffer is replaced.
+        self._indexed_buffer: Optional[bytes | bytearray | memoryview] = None
+        # The (start, end) of every entry.
+        self._records: list[tuple[int, int]] = []
+        # The indices of the entries starting at each address.
+        self._by_start: dict[int, list[int]] = {}
+        # The (start, end, size) of every entry, sorted.
+        self._sorted: list[tuple[int, int, int]] = []
+        # The (size, start) of every span of free space, sorted. Recomputed when the table changes.
+        self._free_space: Optional[list[tuple[int, int]]] = None
+
     @property
     def dma_entries(self) -> int:
         if not self._dma_entries:
@@ -324,6 +482,41 @@ class DMAIterator:
         self.dma_end = self.rom.read_int32(self.dma_start + (self.dma_index * 0x10) + 0x04)
         self._dma_entries = (self.dma_end - self.dma_start) >> 4
 
+    def _build_index(self) -> None:
+        if self._indexed_buffer is self.rom.buffer:
+            return
+        table = self.rom.buffer[self.dma_start:self.dma_start + self.dma_entries * 0x10]
+        self._records = [(start, end) for start, end, _, _ in struct.iter_unpack('>IIII', table)]
+        self._by_start = {}
+        for index, (start, end) in enumerate(self._records):
+            self._by_start.setdefault(start, []).append(index)
+        self._sorted = sorted((start, end, end - start) for start, end in self._records)
+        self._free_space = None
+        self._indexed_buffer = self.rom.buffer
+
+    # Updates the index for the entries in the written range [start, end) of the table.
+    def update_index(self, start: int, end: int) -> None:
+        if self._indexed_buffer is not self.rom.buffer:
+            return
+        first = max(start - self.dma_start, 0) >> 4
+        last = min((end - 1 - self.dma_start) >> 4, len(self._records) - 1)
+        for index in range(first, last + 1):
+            address = self.dma_start + (index * 0x10)
+            record = (int.from_bytes(self.rom.buffer[address:address + 4], 'big'),
+                      int.from_bytes(self.rom.buffer[address + 4:address + 8], 'big'))
+            old_record = self._records[index]
+            if record == old_record:
+                continue
+            self._records[index] = record
+            indices = self._by_start[old_record[0]]
+            indices.remove(index)
+            if not indices:
+                del self._by_start[old_record[0]]
+            insort(self._by_start.setdefault(record[0], []), index)
+            del self._sorted[bisect_left(self._sorted, (old_record[0], old_record[1], old_record[1] - old_record[0]))]
+            insort(self._sorted, (record[0], record[1], record[1] - record[0]))
+            self._free_space = None
+
     def __getitem__(self, item: int) -> DMAEntry:
         if not isinstance(item, int):
             raise ValueError("DMAIterator only supports integer keys.")
@@ -340,37 +533,37 @@ class DMAIterator:
 
     # Gets a dmadata entry by the file start position.
     def get_dmadata_record_by_key(self, key: Optional[int]) -> DMAEntry:
-        for dma_entry in self:
-            if key is None and dma_entry.end == 0 and dma_entry.start == 0:
-                return dma_entry
-            elif dma_entry.start == key:
-                return dma_entry
+        self._build_index()
+        for index in self._by_start.get(0 if key is None else key, []):
+            # A key of None finds the first unused entry.
+            if key is not None or self._records[index][1] == 0:
+                return DMAEntry(self.rom, index)
         raise Exception(f"`get_dmadata_record_by_key`: DMA Start '{key}' not found in the DMA Table.")
 
     # Gets the last used byte of rom defined in the DMA table
     def end_of_data(self) -> int:
-        max_end = 0
-        for dma_entry in self:
-            max_end = max(max_end, dma_entry.end)
+        self._build_index()
+        max_end = max((end for start, end in self._records), default=0)
 
         max_end = ((max_end + 0x0F) >> 4) << 4
         return max_end
 
     # Finds the smallest suitable place between current files. If size is None, find the largest span of free space.
     def free_space(self, size: Optional[int] = None) -> int:
-        free_space = []  # List of tuples containing size of free space and start of free space.
-
-        # Get DMA entries in tuple form and then sort them.
-        files = sorted([dma_entry.as_tuple() for dma_entry in self])
-
-        # Find free space between files.
-        for i in range(len(files)):
-            end_current = ((files[i][1] + 0x0F) >> 4) << 4
-            start_next = ((files[i+1][0] + 0x0F) >> 4) << 4 if i+1 < len(files) else len(self.rom.buffer)
-            if end_current < start_next:
-                free_space.append((start_next - end_current, end_current))
-
-        free_space.sort()
+        self._build_index()
+        if self._free_space is None:
+            self._free_space = []  # List of tuples containing size of free space and start of free space.
+
+            # Find free space between files.
+            files = self._sorted
+            for i in range(len(files)):
+                end_current = ((files[i][1] + 0x0F) >> 4) << 4
+                start_next = ((files[i+1][0] + 0x0F) >> 4) << 4 if i+1 < len(files) else len(self.rom.buffer)
+                if end_current < start_next:
+                    self._free_space.append((start_next - end_current, end_current))
+
+            self._free_space.sort()
+        free_space = self._free_space
         if not free_space:
             raise Exception(f"No free space in ROM. This should never happen. DMA entries: {self.dma_entries}")
 
@@ -379,7 +572,7 @@ class DMAIterator:
             return free_space[-1][1]
         else:
             # Return the smallest area of free space that fits size.
-            try:
-                return next(filter(lambda f: f[0] >= size, free_space))[1]
-            except StopIteration:
+            index = bisect_left(free_space, (size, 0))
+            if index == len(free_space):
                 raise Exception(f"Not enough free space in ROM to fit a file of size {size}. Largest region of free space available: {free_space[-1][0]}.")
+            return free_space[index][1]
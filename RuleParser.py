@@ -1,8 +1,12 @@
 from __future__ import annotations
 import ast
+import hashlib
 import logging
+import os
+import pickle
 import re
 from collections import defaultdict
+from enum import Enum
 from typing import TYPE_CHECKING, Optional, Any
 
 from Entrance import Entrance
@@ -10,8 +14,9 @@ from Item import ItemInfo, Item, make_event_item
 from Location import Location
 from Region import TimeOfDay
 from RulesCommon import AccessRule, allowed_globals, escape_name
-from State import State
+from State import State, Rutos_Letter, Piece_of_Heart
 from Utils import data_path, read_logic_file
+from version import __version__
 
 if TYPE_CHECKING:
     from World import World
@@ -37,6 +42,31 @@ allowed_globals.update(special_globals)
 rule_aliases: dict[str, tuple[list[re.Pattern[str]], str]] = {}
 nonaliases: set[str] = set()
 
+# Names a compiled rule can use that aren't items or events.
+rule_locals: set[str] = {'state', *kwarg_defaults, *special_globals}
+
+# Solver ids read by the State helpers that rules call, on top of any items passed as arguments.
+# A rule calling a State method that isn't listed here is assumed to read anything.
+state_helper_reads: dict[str, frozenset[int]] = {
+    'has': frozenset(),
+    'has_any_of': frozenset(),
+    'has_all_of': frozenset(),
+    'count_of': frozenset(),
+    'item_count': frozenset(),
+    'item_name_count': frozenset(),
+    'has_bottle': frozenset((*ItemInfo.bottle_ids, Rutos_Letter)),
+    'has_hearts': frozenset((Piece_of_Heart,)),
+    'heart_count': frozenset((Piece_of_Heart,)),
+    'has_medallions': frozenset(ItemInfo.medallion_ids),
+    'has_stones': frozenset(ItemInfo.stone_ids),
+    'has_dungeon_rewards': frozenset((*ItemInfo.medallion_ids, *ItemInfo.stone_ids)),
+    'has_ocarina_buttons': frozenset(ItemInfo.ocarina_buttons_ids),
+    'has_all_notes_for_song': frozenset(ItemInfo.ocarina_buttons_ids),
+    'had_night_start': frozenset(),
+    'can_live_dmg': frozenset(),
+    'region_has_shortcuts': frozenset(),
+}
+
 
 def load_aliases() -> None:
     j = read_logic_file(data_path('LogicHelpers.json'))
@@ -52,10 +82,115 @@ def load_aliases() -> None:
     nonaliases.difference_update(rule_aliases.keys())
 
 
+# Transformed rule bodies by world logic fingerprint and rule string, shared by every world
+# in the process, with the events each rule refers to.
+rule_ast_cache: dict[tuple[str, str], tuple[ast.AST, frozenset[str]]] = {}
+# Compiled rules by transformed rule body dump. These only depend on the body, so every world can use them.
+compiled_rules: dict[str, AccessRule] = {}
+
+
 def isliteral(expr: ast.expr) -> bool:
     return isinstance(expr, ast.Constant)
 
 
+# Returns a repr of a value the parser can inline into rules that is the same in every process,
+# or None if the value is made of anything else.
+def plain_repr(value: Any) -> Optional[str]:
+    if value is None or isinstance(value, (bool, int, float, str, Enum)):
+        return repr(value)
+    if isinstance(value, (list, tuple, set, frozenset)):
+        elements = [plain_repr(element) for element in value]
+        if None in elements:
+            return None
+        if isinstance(value, (set, frozenset)):
+            elements.sort()
+        return f'{type(value).__name__}({", ".join(elements)})'
+    if isinstance(value, dict):
+        items = [(plain_repr(key), plain_repr(element)) for key, element in value.items()]
+        if any(key is None or element is None for key, element in items):
+            return None
+        return f'{{{", ".join(sorted(f"{key}: {element}" for key, element in items))}}}'
+    return None
+
+
+# Identifies everything the parser can read from the world and its settings while transforming rules.
+# Worlds with the same fingerprint transform every rule string the same way.
+def logic_fingerprint(world: World) -> str:
+    # Only the names of other attributes matter, since their values can't be inlined.
+    # The world id is the one difference between otherwise identical worlds, and rules don't use it.
+    attributes = sorted(f'{name}={plain_repr(value) or type(value).__name__}'
+                        for name, value in world.__dict__.items() if name != 'id')
+    # Settings that aren't shared can't change the generated seed, so they can't change the logic either.
+    settings = sorted(f'{name}={plain_repr(value) or type(value).__name__}'
+                      for name, value in world.settings.settings_dict.items()
+                      if name in world.settings.setting_infos and world.settings.setting_infos[name].shared)
+    return hashlib.sha1(repr((attributes, settings)).encode('utf-8')).hexdigest()
+
+
+# The logic files transformed rules come from, with their modification times.
+def logic_sources() -> dict[str, float]:
+    sources = {}
+    for folder in ('World', 'Glitched World'):
+        for filename in os.listdir(data_path(folder)):
+            if filename.endswith('.json'):
+                path = os.path.join(data_path(folder), filename)
+                sources[path] = os.path.getmtime(path)
+    path = data_path('LogicHelpers.json')
+    sources[path] = os.path.getmtime(path)
+    return sources
+
+
+# Loads transformed rules saved by save_rule_cache, unless they were made
+# by another version or from logic files that changed since.
+def load_rule_cache(file_path: str) -> None:
+    try:
+        with open(file_path, 'rb') as stream:
+            saved = pickle.load(stream)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return
+    if saved.get('version') != __version__ or saved.get('sources') != logic_sources():
+        logging.getLogger('').debug('Ignoring outdated rule cache: %s', file_path)
+        return
+    update_rule_cache(saved['rules'])
+
+
+# Adds rules transformed elsewhere, like in another process or an earlier run, to the rule cache.
+def update_rule_cache(rules: dict[tuple[str, str], tuple[ast.AST, frozenset[str]]]) -> None:
+    for body, events in rules.values():
+        # Events are registered while transforming, so do it for the rules that weren't.
+        for node in ast.walk(body):
+            if isinstance(node, ast.Name) and node.id not in ItemInfo.solver_ids and node.id not in rule_locals:
+                Item(node.id, event=True)
+    rule_ast_cache.update(rules)
+
+
+def save_rule_cache(file_path: str) -> None:
+    with open(file_path, 'wb') as stream:
+        pickle.dump({'version': __version__, 'sources': logic_sources(), 'rules': rule_ast_cache}, stream)
+
+
+# Returns the access rules that decide a spot's current access rule.
+def spot_rules(spot: Location | Entrance) -> tuple[AccessRule, ...]:
+    rule = spot.access_rule
+    # Rules combined by add_rule run every rule in the list of the spot they were bound to,
+    # which is not necessarily this spot for copies.
+    if getattr(rule, '__func__', None) in (Location._run_rules, Entrance._run_rules):
+        return tuple(rule.__self__.access_rules)
+    return (rule,)
+
+
+# Returns the solver ids the spot's current access rule reads,
+# or None if that isn't known, e.g. for rules not created by the parser.
+def spot_reads(spot: Location | Entrance) -> Optional[frozenset[int]]:
+    reads = set()
+    for rule in spot_rules(spot):
+        rule_reads = getattr(rule, 'solver_reads', None)
+        if rule_reads is None:
+            return None
+        reads.update(rule_reads)
+    return frozenset(reads)
+
+
 class Rule_AST_Transformer(ast.NodeTransformer):
     def __init__(self, world: World) -> None:
         self.world: World = world
@@ -70,6 +205,10 @@ class Rule_AST_Transformer(ast.NodeTransformer):
             load_aliases()
         # final rule cache
         self.rule_cache: dict[str, AccessRule] = {}
+        # Set while the world's logic files are parsed, to share transformed rules with other worlds.
+        self.fingerprint: Optional[str] = None
+        # Cleared while transforming a rule that depends on its spot or adds subrules, which can't be shared.
+        self.cacheable: bool = True
 
     def visit_Name(self, node: ast.Name) -> Any:
         if node.id in dir(self):
@@ -358,6 +497,7 @@ class Rule_AST_Transformer(ast.NodeTransformer):
             keywords=keywords)
 
     def replace_subrule(self, target: str, node: ast.AST) -> ast.Call:
+        self.cacheable = False
         rule = ast.dump(node, False)
         if rule in self.replaced_rules[target]:
             return self.replaced_rules[target][rule]
@@ -404,13 +544,108 @@ class Rule_AST_Transformer(ast.NodeTransformer):
         # Safeguard in case this is called multiple times per world
         self.delayed_rules.clear()
 
+    # Returns the kind ('all' or 'any') and solver id mask of a single presence check,
+    # or None if the node is anything else.
+    @staticmethod
+    def mask_test(node: ast.AST) -> Optional[tuple[str, int]]:
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                and isinstance(node.func.value, ast.Name) and node.func.value.id == 'state'
+                and not node.keywords and node.args):
+            return None
+        if node.func.attr == 'has':
+            if len(node.args) == 2 and not (isinstance(node.args[1], ast.Constant) and node.args[1].value == 1
+                                            and not isinstance(node.args[1].value, bool)):
+                return None
+            if len(node.args) > 2:
+                return None
+            names = [node.args[0]]
+            kind = 'all'
+        elif node.func.attr in ('has_all_of', 'has_any_of') and len(node.args) == 1 and isinstance(node.args[0], ast.Tuple):
+            names = node.args[0].elts
+            kind = 'all' if node.func.attr == 'has_all_of' else 'any'
+        else:
+            return None
+        mask = 0
+        for name in names:
+            if not isinstance(name, ast.Name) or name.id not in ItemInfo.solver_ids:
+                return None
+            mask |= 1 << ItemInfo.solver_ids[name.id]
+        if not mask:
+            return None
+        return kind, mask
+
+    # Lowers rules made only of presence checks (has with a count of 1, has_all_of,
+    # has_any_of, and and/or combinations of those) to bit tests on State.solver_mask.
+    # Returns the lowered expression, or None if the rule needs the generic lambda.
+    def lower_mask_rule(self, node: ast.AST) -> Optional[str]:
+        if isinstance(node, ast.BoolOp):
+            kind = 'all' if isinstance(node.op, ast.And) else 'any'
+            merged = 0
+            terms = []
+            for value in node.values:
+                test = self.mask_test(value)
+                # A single item can be merged either way.
+                if test is not None and (test[0] == kind or test[1] & (test[1] - 1) == 0):
+                    merged |= test[1]
+                    continue
+                term = self.lower_mask_rule(value)
+                if term is None:
+                    return None
+                terms.append(f'({term})')
+            if merged:
+                terms.insert(0, self.mask_expression(kind, merged))
+            return (' and ' if kind == 'all' else ' or ').join(terms)
+        test = self.mask_test(node)
+        if test is None:
+            return None
+        return self.mask_expression(*test)
+
+    @staticmethod
+    def mask_expression(kind: str, mask: int) -> str:
+        if kind == 'any' or mask & (mask - 1) == 0:
+            return f'state.solver_mask & {mask} != 0'
+        return f'state.solver_mask & {mask} == {mask}'
+
+    # Returns the solver ids (items and events) a rule body reads from the state,
+    # or None if it may read anything, e.g. by querying the search for time of day access.
+    @staticmethod
+    def rule_reads(node: ast.AST) -> Optional[frozenset[int]]:
+        reads = set()
+        for child in ast.walk(node):
+            if isinstance(child, ast.Name):
+                if child.id in ItemInfo.solver_ids:
+                    reads.add(ItemInfo.solver_ids[child.id])
+                elif child.id not in rule_locals:
+                    return None
+            elif isinstance(child, ast.Constant) and isinstance(child.value, str):
+                # Item names passed to helpers like item_name_count or has_all_notes_for_song.
+                # Other strings may match an item by chance, which only makes the set larger.
+                escaped = escape_name(child.value)
+                if escaped in ItemInfo.solver_ids:
+                    reads.add(ItemInfo.solver_ids[escaped])
+            elif isinstance(child, ast.Attribute) and isinstance(child.value, ast.Name) and child.value.id == 'state':
+                if child.attr == 'world':
+                    continue
+                if child.attr not in state_helper_reads:
+                    return None
+                reads.update(state_helper_reads[child.attr])
+        return frozenset(reads)
+
     def make_access_rule(self, body: ast.AST) -> AccessRule:
         rule_str = ast.dump(body, False)
-        if rule_str not in self.rule_cache:
+        if rule_str not in self.rule_cache and rule_str in compiled_rules:
+            self.rule_cache[rule_str] = compiled_rules[rule_str]
+        elif rule_str not in self.rule_cache:
+            reads = self.rule_reads(body)
+            any_age = reads is not None and not any(isinstance(child, ast.Name) and child.id == 'age' for child in ast.walk(body))
+            mask_rule = self.lower_mask_rule(body)
+            if mask_rule is not None:
+                body = ast.parse(mask_rule, mode='eval').body
             # requires consistent iteration on dicts
             kwargs = [ast.arg(arg=k) for k in kwarg_defaults.keys()]
             kwd = list(map(ast.Constant, kwarg_defaults.values()))
-            name = f'<{self.current_spot and self.current_spot.name}: {rule_str}>'
+            # Compiled rules are shared by every spot and world with the same rule, so name them by the rule alone.
+            name = f'<rule {hashlib.sha1(rule_str.encode("utf-8")).hexdigest()[:12]}>'
             try:
                 self.rule_cache[rule_str] = eval(compile(
                     ast.fix_missing_locations(
@@ -428,6 +663,11 @@ class Rule_AST_Transformer(ast.NodeTransformer):
                     allowed_globals)
             except TypeError as e:
                 raise Exception('Parse Error: %s' % e, self.current_spot.name, ast.dump(body, False))
+            # Lets searches skip retrying this rule until one of these changes.
+            self.rule_cache[rule_str].solver_reads = reads
+            # Lets searches share one result between the child and adult passes.
+            self.rule_cache[rule_str].any_age = any_age
+            compiled_rules[rule_str] = self.rule_cache[rule_str]
         return self.rule_cache[rule_str]
 
     ## Handlers for specific internal functions used in the json logic.
@@ -464,6 +704,7 @@ class Rule_AST_Transformer(ast.NodeTransformer):
         return ast.Constant(True)
 
     def at_night(self, node: ast.Call) -> ast.expr:
+        self.cacheable = False
         if self.current_spot.type == 'GS Token' and self.world.settings.logic_no_night_tokens_without_suns_song:
             # Using visit here to resolve 'can_play' rule
             return self.visit(ast.parse('can_play(Suns_Song)', mode='eval').body)
@@ -477,7 +718,23 @@ class Rule_AST_Transformer(ast.NodeTransformer):
     # If spot is None, here() rules won't work.
     def parse_rule(self, rule_string: str, spot: Optional[Location | Entrance] = None) -> AccessRule:
         self.current_spot = spot
-        return self.make_access_rule(self.visit(ast.parse(rule_string, mode='eval').body))
+        if self.fingerprint is None:
+            return self.make_access_rule(self.visit(ast.parse(rule_string, mode='eval').body))
+
+        key = (self.fingerprint, rule_string)
+        if key in rule_ast_cache:
+            body, events = rule_ast_cache[key]
+            self.events.update(events)
+            return self.make_access_rule(body)
+
+        # Collect this rule's events separately to cache them with it.
+        outer_events, self.events = self.events, set()
+        self.cacheable = True
+        body = self.visit(ast.parse(rule_string, mode='eval').body)
+        events, self.events = self.events, outer_events | self.events
+        if self.cacheable:
+            rule_ast_cache[key] = (body, frozenset(events))
+        return self.make_access_rule(body)
 
     def parse_spot_rule(self, spot: Location | Entrance) -> None:
         rule = spot.rule_string.split('#', 1)[0].strip()
@@ -102,6 +102,8 @@ def create_shop_rule(location: Location) -> AccessRule:
 
 def set_rule(spot: Location | Entrance, rule: AccessRule) -> None:
     spot.access_rule = rule
+    if spot.world is not None:
+        spot.world.rule_changed()
 
 
 def add_item_rule(spot: Location, rule: Callable[[Location, Item], bool]) -> None:
@@ -2,10 +2,13 @@ from __future__ import annotations
 import copy
 import itertools
 import sys
-from collections.abc import Callable, Iterable
+from array import array
+from collections import OrderedDict, defaultdict, deque
+from collections.abc import Callable, Collection, Iterable
 from dataclasses import dataclass, field
 from typing import TYPE_CHECKING, Optional
 
+from Location import Location
 from Region import Region, TimeOfDay
 from State import State
 
@@ -17,10 +20,13 @@ else:
 if TYPE_CHECKING:
     from Entrance import Entrance
     from Item import Item
-    from Location import Location
     from Goals import GoalCategory
+    from World import World
 
 ValidGoals: TypeAlias = "dict[str, bool | dict[str, list[int] | dict[int, list[str]]]]"
+Spot: TypeAlias = "Entrance | Location"
+# A visited location, or a region reached at an age.
+Fact: TypeAlias = "Location | tuple[str, Region]"
 
 
 @dataclass
@@ -39,6 +45,13 @@ class SearchCache:
 
 
 class Search:
+    # Results of can_beat_game by the fingerprint of the search they were computed on, shared
+    # by every search since they often start from the same place, least recently used first.
+    beatable_memo: OrderedDict[tuple, bool] = OrderedDict()
+    beatable_memo_size: int = 256
+    beatable_memo_hits: int = 0
+    beatable_memo_misses: int = 0
+
     def __init__(self, state_list: Iterable[State], initial_cache: Optional[SearchCache] = None) -> None:
         self.state_list: list[State] = [state.copy() for state in state_list]
 
@@ -47,10 +60,13 @@ class Search:
             state.search = self
 
         self._cache: SearchCache
-        self.cached_spheres: list[SearchCache]
+        # Spots whose access rules read an item that changed in the last sphere, or None for all of them.
+        self._affected: Optional[set[Spot]] = None
+        # World.rules_version when the queues were last expanded, or None if the changes of the
+        # states since then aren't known, like for a cache that was expanded by another search.
+        self._rules_version: Optional[int] = None
         if initial_cache:
             self._cache = initial_cache
-            self.cached_spheres = [self._cache]
         else:
             root_regions = [state.world.get_region('Root') for state in self.state_list]
             # The cache is a dict with 5 values:
@@ -65,13 +81,15 @@ class Search:
                 child_regions={region: TimeOfDay.NONE for region in root_regions},
                 adult_regions={region: TimeOfDay.NONE for region in root_regions},
             )
-            self.cached_spheres = [self._cache]
             self.next_sphere()
 
     def copy(self) -> Search:
         # we only need to copy the top sphere since that's what we're starting with and we don't go back
         # copy always makes a nonreversible instance
-        return Search(self.state_list, initial_cache=self._cache.copy())
+        search = Search(self.state_list, initial_cache=self._cache.copy())
+        # The states are copied along with their changes, so the copy can carry on skipping spots.
+        search._rules_version = self._rules_version
+        return search
 
     def collect_all(self, itempool: Iterable[Item]) -> None:
         for item in itempool:
@@ -123,24 +141,41 @@ class Search:
     def reset(self) -> None:
         raise Exception('Unimplemented for Search. Perhaps you want RewindableSearch.')
 
-    # Internal to the iteration. Modifies the exit_queue, regions.
+    # Internal to the iteration. Modifies the regions.
     # Returns a queue of the exits whose access rule failed,
     # as a cache for the exits to try on the next iteration.
-    def _expand_regions(self, exit_queue: list[Entrance], regions: dict[Region, int], age: Optional[str]) -> list[Entrance]:
+    # Exits in unaffected failed last time and read nothing that changed since, so they fail again.
+    # Results of rules that don't depend on the age are stored in any_age, so that the other
+    # age's pass, and retries after finding a new tod, reuse them instead of evaluating again.
+    # The states must not change while any_age is in use.
+    def _expand_regions(self, exit_queue: list[Entrance], regions: dict[Region, int], age: Optional[str],
+                        unaffected: Collection[Entrance] = (), any_age: Optional[dict[Entrance, bool]] = None) -> list[Entrance]:
+        if any_age is None:
+            any_age = {}
         failed = []
-        for exit in exit_queue:
+        # The given queue is left as it is, so a rewindable search can keep it in its journal.
+        retried = []
+        for exit in itertools.chain(exit_queue, retried):
             if exit.world and exit.connected_region and exit.connected_region not in regions:
-                # Evaluate the access rule directly, without tod
-                if exit.access_rule(self.state_list[exit.world.id], spot=exit, age=age):
+                if exit in unaffected:
+                    failed.append(exit)
+                    continue
+                access = any_age.get(exit)
+                if access is None:
+                    # Evaluate the access rule directly, without tod
+                    access = exit.access_rule(self.state_list[exit.world.id], spot=exit, age=age)
+                    if getattr(exit.access_rule, 'any_age', False):
+                        any_age[exit] = access
+                if access:
                     # If it found a new tod, make sure we try other entrances again.
                     # Probably would take too long and not be worth it if we only grabbed the exits
                     # for the given world...
                     if exit.connected_region.provides_time and ~regions[exit.world.get_region('Root')] & exit.connected_region.provides_time:
-                        exit_queue.extend(failed)
+                        retried.extend(failed)
                         failed = []
                         regions[exit.world.get_region('Root')] |= exit.connected_region.provides_time
                     regions[exit.connected_region] = exit.connected_region.provides_time
-                    exit_queue.extend(exit.connected_region.exits)
+                    retried.extend(exit.connected_region.exits)
                 else:
                     failed.append(exit)
         return failed
@@ -172,8 +207,14 @@ class Search:
 
         # Replace the queues (which have been modified) with just the
         # failed exits that we can retry next time.
-        self._cache.adult_queue = self._expand_regions(self._cache.adult_queue, self._cache.adult_regions, 'adult')
-        self._cache.child_queue = self._expand_regions(self._cache.child_queue, self._cache.child_regions, 'child')
+        # Only the exits reading items collected or removed since the last sphere are retried.
+        self._affected = self._affected_spots(self._take_changes())
+        # Exits whose rules don't depend on the age are evaluated once for both passes.
+        any_age = {}
+        self._cache.adult_queue = self._expand_regions(self._cache.adult_queue, self._cache.adult_regions, 'adult',
+                                                       set(filter(self._unaffected, self._cache.adult_queue)), any_age)
+        self._cache.child_queue = self._expand_regions(self._cache.child_queue, self._cache.child_regions, 'child',
+                                                       set(filter(self._unaffected, self._cache.child_queue)), any_age)
 
         return self._cache.child_regions, self._cache.adult_regions, self._cache.visited_locations
 
@@ -187,6 +228,9 @@ class Search:
     # using internal State (recommended to just call search.collect).
     def iter_reachable_locations(self, item_locations: Iterable[Location]) -> Iterable[Location]:
         had_reachable_locations = True
+        # Locations that failed in an earlier loop, and whether their region
+        # was reached as adult and as child at the time.
+        failed: dict[Location, tuple[bool, bool]] = {}
         # will loop as long as any visits were made, and at least once
         while had_reachable_locations:
             child_regions, adult_regions, visited_locations = self.next_sphere()
@@ -197,21 +241,63 @@ class Search:
             for loc in item_locations:
                 if loc in visited_locations:
                     continue
+                reached = (loc.parent_region in adult_regions, loc.parent_region in child_regions)
+                # Nothing the rule reads has changed, so it would fail again.
+                if failed.get(loc) == reached and self._unaffected(loc):
+                    continue
                 # Check adult first; it's the most likely.
-                if (loc.parent_region in adult_regions
+                if (reached[0]
                         and loc.access_rule(self.state_list[loc.world.id], spot=loc, age='adult')):
                     had_reachable_locations = True
                     # Mark it visited for this algorithm
                     visited_locations.add(loc)
                     yield loc
 
-                elif (loc.parent_region in child_regions
+                # A rule that doesn't depend on the age fails as child too.
+                elif (reached[1]
+                      and not (reached[0] and getattr(loc.access_rule, 'any_age', False))
                       and loc.access_rule(self.state_list[loc.world.id], spot=loc, age='child')):
                     had_reachable_locations = True
                     # Mark it visited for this algorithm
                     visited_locations.add(loc)
                     yield loc
 
+                else:
+                    failed[loc] = reached
+
+    # Returns the solver ids collected or removed in each state since the queues were last expanded,
+    # or None if they aren't known or access rules changed since, and starts recording anew.
+    def _take_changes(self) -> Optional[list[set[int]]]:
+        changed = [state.changed for state in self.state_list]
+        for state in self.state_list:
+            state.changed = set()
+        rules_version = self._rules_version
+        self._rules_version = self.state_list[0].world.rules_version if self.state_list else None
+        if rules_version is None or rules_version != self._rules_version:
+            return None
+        return changed
+
+    # Returns the entrances and locations whose access rules read any of the changed solver ids,
+    # using each world's rule index, or None if nothing is known to be unchanged.
+    def _affected_spots(self, changed: Optional[list[set[int]]]) -> Optional[set[Spot]]:
+        if changed is None:
+            return None
+        affected = set()
+        for state, item_ids in zip(self.state_list, changed):
+            dependents = state.world.get_rule_dependents()
+            for item_id in item_ids:
+                if item_id in dependents:
+                    entrances, locations = dependents[item_id]
+                    affected.update(entrances)
+                    affected.update(locations)
+        return affected
+
+    # Whether the spot's access rule reads nothing that changed in the last sphere.
+    # Spots with rules the index doesn't know about, or that changed since it was built, are always retried.
+    def _unaffected(self, spot: Spot) -> bool:
+        return (self._affected is not None and spot.world is not None and spot not in self._affected
+                and self.state_list[spot.world.id].world.is_rule_indexed(spot))
+
     # This collects all item locations available in the state list given that
     # the states have collected items. The purpose is that it will search for
     # all new items that become accessible with a new item set.
@@ -249,15 +335,37 @@ class Search:
             return True
 
         if scan_for_items:
+            key = (predicate, self.fingerprint())
+            beatable = Search.beatable_memo.get(key)
+            if beatable is not None:
+                Search.beatable_memo.move_to_end(key)
+                Search.beatable_memo_hits += 1
+                return beatable
+            Search.beatable_memo_misses += 1
             # collect all available items
             # make a new search since we might be iterating over one already
             search = self.copy()
             search.collect_locations()
             # if every state got the Triforce, then return True
-            return all(map(predicate, search.state_list))
+            beatable = all(map(predicate, search.state_list))
+            Search.beatable_memo[key] = beatable
+            if len(Search.beatable_memo) > Search.beatable_memo_size:
+                Search.beatable_memo.popitem(last=False)
+            return beatable
         else:
             return False
 
+    # Everything exploring the rest of the worlds from this search depends on: the graph
+    # version and inventory of every world, and what the cache has already reached.
+    # Equal fingerprints explore to the same result.
+    def fingerprint(self) -> tuple:
+        return (
+            tuple((state.world.graph_version, state.inventory_key()) for state in self.state_list),
+            frozenset(self._cache.visited_locations),
+            frozenset(self._cache.child_regions.items()),
+            frozenset(self._cache.adult_regions.items()),
+        )
+
     def beatable_goals_fast(self, goal_categories: dict[str, GoalCategory], world_filter: Optional[int] = None) -> ValidGoals:
         valid_goals = self.test_category_goals(goal_categories, world_filter)
         if all(map(State.won, self.state_list)):
@@ -373,24 +481,633 @@ class Search:
                             and spot.access_rule(self.state_list[spot.world.id], spot=spot, age='child', tod=tod))
 
 
+# Marks an entry that a journaled container didn't hold before a change.
+_MISSING = object()
+
+
+# A dict that records the previous value of every entry it changes in its cache's journal.
+class JournaledDict(dict):
+    def __init__(self, values: Iterable, journal: list[tuple], field_name: str) -> None:
+        super().__init__(values)
+        self.journal: list[tuple] = journal
+        self.field_name: str = field_name
+
+    def __setitem__(self, key, value) -> None:
+        self.journal.append((self.field_name, key, dict.get(self, key, _MISSING)))
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key) -> None:
+        self.journal.append((self.field_name, key, dict.__getitem__(self, key)))
+        dict.__delitem__(self, key)
+
+    def restore(self, key, old) -> None:
+        if old is _MISSING:
+            dict.__delitem__(self, key)
+        else:
+            dict.__setitem__(self, key, old)
+
+
+# A set that records every entry it adds or discards in its cache's journal.
+# Each entry is stamped with the journal position it was added at, so a search can tell
+# whether it was already there at a checkpoint. Entries it started with are stamped -1.
+class JournaledSet(set):
+    def __init__(self, values: Iterable, journal: list[tuple], field_name: str, stamps: Optional[dict] = None) -> None:
+        super().__init__(values)
+        self.journal: list[tuple] = journal
+        self.field_name: str = field_name
+        self.stamps: dict = stamps if stamps is not None else dict.fromkeys(self, -1)
+
+    def add(self, item) -> None:
+        if item not in self:
+            self.stamps[item] = len(self.journal)
+            self.journal.append((self.field_name, item, _MISSING))
+            set.add(self, item)
+
+    def discard(self, item) -> None:
+        if item in self:
+            self.journal.append((self.field_name, item, self.stamps.pop(item)))
+            set.discard(self, item)
+
+    def restore(self, item, old) -> None:
+        if old is _MISSING:
+            del self.stamps[item]
+            set.discard(self, item)
+        else:
+            self.stamps[item] = old
+            set.add(self, item)
+
+
+# A search cache that journals every change made to it, so it can be rewound to any
+# earlier position of the journal by undoing only the entries changed since.
+# The queues are always replaced rather than modified, so the journal
+# keeps the lists they are replaced with.
+class JournaledCache(SearchCache):
+    def __init__(self, cache: SearchCache, journal: Optional[list[tuple]] = None, stamps: Optional[dict] = None) -> None:
+        journal = journal if journal is not None else []
+        object.__setattr__(self, 'journal', journal)
+        object.__setattr__(self, 'child_queue', list(cache.child_queue))
+        object.__setattr__(self, 'adult_queue', list(cache.adult_queue))
+        object.__setattr__(self, 'visited_locations', JournaledSet(cache.visited_locations, journal, 'visited_locations', stamps))
+        object.__setattr__(self, 'child_regions', JournaledDict(cache.child_regions, journal, 'child_regions'))
+        object.__setattr__(self, 'adult_regions', JournaledDict(cache.adult_regions, journal, 'adult_regions'))
+
+    def __setattr__(self, name: str, value) -> None:
+        self.journal.append((None, name, getattr(self, name)))
+        object.__setattr__(self, name, value)
+
+    # A plain copy of the current contents.
+    def copy(self) -> SearchCache:
+        return SearchCache(
+            child_queue=list(self.child_queue),
+            adult_queue=list(self.adult_queue),
+            visited_locations=set(self.visited_locations),
+            child_regions=dict(self.child_regions),
+            adult_regions=dict(self.adult_regions),
+        )
+
+    # A journaled copy that can be rewound as far back as this cache.
+    def fork(self) -> JournaledCache:
+        return JournaledCache(self, list(self.journal), dict(self.visited_locations.stamps))
+
+    # Undoes every change made since the given position of the journal.
+    def rewind(self, position: int) -> None:
+        journal = self.journal
+        while len(journal) > position:
+            field_name, key, old = journal.pop()
+            if field_name is None:
+                object.__setattr__(self, key, old)
+            else:
+                getattr(self, field_name).restore(key, old)
+
+
+# A search that can go back to earlier spheres.
+# Instead of copying the cache at every checkpoint, the cache journals its changes and
+# a checkpoint is just the current journal position, so checkpoints are free and going
+# back only undoes what changed since.
 class RewindableSearch(Search):
+    def __init__(self, state_list: Iterable[State], initial_cache: Optional[SearchCache] = None) -> None:
+        super().__init__(state_list, initial_cache)
+        if not isinstance(self._cache, JournaledCache):
+            self._cache = JournaledCache(self._cache)
+        # The journal position of each checkpoint, the start of each layer after the first.
+        self.checkpoints: list[int] = []
+
     def unvisit(self, location: Location) -> None:
         # A location being unvisited is either:
-        # in the top two caches (if it's the first being unvisited for a sphere)
-        # in the topmost cache only (otherwise)
-        # After we unvisit every location in a sphere, the top two caches have identical visited locations.
-        assert location in self.cached_spheres[-1].visited_locations
-        if location in self.cached_spheres[-2].visited_locations:
-            self.cached_spheres.pop()
-            self._cache = self.cached_spheres[-1]
-        self._cache.visited_locations.discard(location)
+        # visited before the last checkpoint (if it's the first being unvisited for a sphere)
+        # visited since the last checkpoint (otherwise)
+        # After we unvisit every location in a sphere, the top layer has no visits of its own.
+        visited_locations = self._cache.visited_locations
+        assert location in visited_locations
+        if visited_locations.stamps[location] < self.checkpoints[-1]:
+            self._cache.rewind(self.checkpoints.pop())
+            # The queues are back to an earlier sphere, expanded before the changes the states recorded since.
+            self._rules_version = None
+        visited_locations.discard(location)
 
     def reset(self) -> None:
-        self._cache = self.cached_spheres[0]
-        self.cached_spheres[1:] = []
+        if self.checkpoints:
+            self._cache.rewind(self.checkpoints[0])
+            self.checkpoints.clear()
+            self._rules_version = None
 
-    # Adds a new layer to the sphere cache, as a copy of the previous.
+    # Adds a new layer to the sphere cache, starting from the current contents.
     def checkpoint(self) -> None:
-        # Save the current data into the cache.
-        self.cached_spheres.append(self._cache.copy())
-        self._cache = self.cached_spheres[-1]
+        self.checkpoints.append(len(self._cache.journal))
+
+    # A plain copy of the cache as it was at the given checkpoint.
+    def cache_at(self, checkpoint: int) -> SearchCache:
+        position = self.checkpoints[checkpoint]
+        cache = JournaledCache(self._cache, self._cache.journal[position:])
+        cache.rewind(0)
+        return cache.copy()
+
+    # A copy that keeps the checkpoints, so it can be rewound independently of this search.
+    def rewindable_copy(self) -> RewindableSearch:
+        search = RewindableSearch(self.state_list, initial_cache=self._cache.fork())
+        search.checkpoints = list(self.checkpoints)
+        search._rules_version = self._rules_version
+        return search
+
+
+# One sphere by sphere exploration of the filled worlds, shared by everything that
+# explores them after the fill: the playthrough, the goal search and the gossip hints.
+#
+# The spheres are found the way the playthrough always has: starting from the pseudo
+# starting items, each sphere is every progression location reachable with the items of
+# the earlier spheres. A checkpoint and the states at each sphere boundary are kept,
+# so consumers start a search from any boundary instead of exploring from scratch.
+class SphereLog:
+    def __init__(self, worlds: Iterable[World]) -> None:
+        self.worlds: list[World] = list(worlds)
+        search = RewindableSearch([world.state for world in self.worlds])
+        self.item_locations: list[Location] = search.progression_locations()
+        self.spheres: list[list[Location]] = []
+        # The shuffled entrances that became accessible with each sphere.
+        self.entrance_spheres: list[list[Entrance]] = []
+        # The search checkpoint and the states before each sphere, and after the last one.
+        self.boundaries: list[tuple[int, list[State]]] = []
+        remaining_entrances = set(entrance for state in search.state_list for entrance in state.world.get_shuffled_entrances())
+
+        search.checkpoint()
+        search.collect_pseudo_starting_items()
+        while True:
+            search.checkpoint()
+            self.boundaries.append((len(search.checkpoints) - 1, [state.copy() for state in search.state_list]))
+            # Not collecting while the generator runs means we only get one sphere at a time
+            # Otherwise, an item we collect could influence later item collection in the same sphere
+            collected = list(search.iter_reachable_locations(self.item_locations))
+            if not collected:
+                break
+            # Gather the new entrances before collecting items.
+            self.spheres.append(collected)
+            accessed_entrances = set(filter(search.spot_access, remaining_entrances))
+            self.entrance_spheres.append(list(accessed_entrances))
+            remaining_entrances -= accessed_entrances
+            for location in collected:
+                # Collect the item for the state world it is for
+                search.state_list[location.item.world.id].collect(location.item)
+        self._search: RewindableSearch = search
+        # Everything reachable is collected once no sphere is left, so this is what Search.max_explore
+        # would find, except that the pseudo starting items count as collected too.
+        self.max_search: Search = search.copy()
+        self.beatable: bool = all(map(State.won, self.max_search.state_list))
+        self._max_explore: Optional[Search] = None
+
+    # Search.max_explore of the worlds, made on first use. Unlike max_search, the pseudo starting
+    # items only count if their locations are reachable, which is what the gossip stone hints rely on.
+    @property
+    def max_explore(self) -> Search:
+        if self._max_explore is None:
+            self._max_explore = Search.max_explore([world.state for world in self.worlds])
+        return self._max_explore
+
+    # A new search starting from the boundary before the given sphere.
+    def search_at(self, sphere: int) -> Search:
+        checkpoint, states = self.boundaries[sphere]
+        return Search(states, initial_cache=self._search.cache_at(checkpoint))
+
+    # A new rewindable search over every sphere, with a checkpoint at each boundary,
+    # for passes that take the spheres back apart like the playthrough reduction.
+    def rewindable_search(self) -> RewindableSearch:
+        return self._search.rewindable_copy()
+
+
+# An array of solver item counts, like State.solv_items, that reports which entries
+# are read or written while its owning IncrementalSearch is recording.
+class TrackedItems(array):
+    def __new__(cls, values: Iterable[int], search: IncrementalSearch, world_id: int) -> TrackedItems:
+        items = super().__new__(cls, 'H', values)
+        items.search = search
+        items.world_id = world_id
+        return items
+
+    def __getitem__(self, index):
+        reads = self.search.reads
+        if reads is not None:
+            reads.add((self.world_id, index))
+        return array.__getitem__(self, index)
+
+    def __setitem__(self, index, value) -> None:
+        writes = self.search.writes
+        if writes is not None:
+            writes.add((self.world_id, index))
+        array.__setitem__(self, index, value)
+
+
+# Stands in for State.solver_mask, reporting which bits compiled rules test
+# while its owning IncrementalSearch is recording.
+class TrackedMask(int):
+    def __new__(cls, value: int, search: IncrementalSearch, world_id: int) -> TrackedMask:
+        mask = super().__new__(cls, value)
+        mask.search = search
+        mask.world_id = world_id
+        return mask
+
+    def __and__(self, other: int) -> int:
+        if other < 0:
+            # Clearing a bit in State.update_mask.
+            return TrackedMask(int(self) & other, self.search, self.world_id)
+        reads = self.search.reads
+        if reads is not None:
+            bits = other
+            while bits:
+                low = bits & -bits
+                reads.add((self.world_id, low.bit_length() - 1))
+                bits ^= low
+        return int(self) & other
+
+    def __or__(self, other: int) -> TrackedMask:
+        return TrackedMask(int(self) | other, self.search, self.world_id)
+
+
+# A search that is always fully explored, and that updates itself in place when
+# items are collected or removed instead of exploring again from the start.
+#
+# Every reached region (per age) and visited location remembers which solver ids
+# its access rule read when it succeeded, and every failed exit or location
+# remembers which solver ids it read when it failed. Collecting an item only retries
+# the spots that read that item, and removing an item drops only the regions and
+# locations that depended on it (and everything reached through them) before
+# rederiving whatever is still reachable.
+#
+# Rules that query the search itself (time of day checks) can't be tracked this
+# way, so they are treated as depending on everything.
+#
+# Placements are synced lazily: setting location.item (for example to None while
+# testing whether it is required) is picked up by the next can_beat_game or
+# beatable_goals call. Only the locations given at construction are tracked.
+# Reconnecting an entrance or changing an access rule makes it start over.
+class IncrementalSearch(Search):
+    def __init__(self, state_list: Iterable[State], item_locations: Optional[Iterable[Location]] = None) -> None:
+        super().__init__(state_list, initial_cache=SearchCache())
+        self.reads: Optional[set[tuple[int, int]]] = None
+        self.writes: Optional[set[tuple[int, int]]] = None
+        self._read_search: bool = False
+        self._tod_expanded: bool = False
+        for state in self.state_list:
+            state.solv_items = TrackedItems(state.solv_items, self, state.world.id)
+            state.solver_mask = TrackedMask(state.solver_mask, self, state.world.id)
+
+        self.item_locations: set[Location] = set(item_locations if item_locations is not None else self.progression_locations())
+        self._collected: dict[Location, Item] = {}
+        self._start()
+
+    # Starts exploring from the root regions again, uncollecting the items of every visited location.
+    # Placements are kept up with incrementally, but a reconnected entrance or a changed access rule
+    # could invalidate anything reached so far.
+    def _start(self) -> None:
+        for item in self._collected.values():
+            self.state_list[item.world.id].remove(item)
+        root_regions = [state.world.get_region('Root') for state in self.state_list]
+        self._cache = SearchCache(
+            child_regions={region: TimeOfDay.NONE for region in root_regions},
+            adult_regions={region: TimeOfDay.NONE for region in root_regions},
+        )
+        self._tod_expanded = False
+        self._logic_versions: tuple[int, int] = self._current_logic_versions()
+        # Reached regions and visited locations, with the exit and age they were reached by.
+        self._region_sources: dict[tuple[str, Region], Optional[Entrance]] = {('child', region): None for region in root_regions}
+        self._region_sources.update({('adult', region): None for region in root_regions})
+        self._location_ages: dict[Location, str] = {}
+        self._collected = {}
+        # The solver ids each collected item wrote.
+        self._collected_writes: dict[Location, set[tuple[int, int]]] = {}
+        # Reverse index from (world id, solver id) to the facts whose rule read it,
+        # and the solver ids read by each fact.
+        self._dependents: defaultdict[tuple[int, int], set[Fact]] = defaultdict(set)
+        self._fact_reads: dict[Fact, set[tuple[int, int]]] = {}
+        self._volatile_facts: set[Fact] = set()
+        # Failed spots, waiting on a change to one of the solver ids they read.
+        self._waiting: defaultdict[tuple[int, int], set[tuple[str, Spot]]] = defaultdict(set)
+        self._volatile_waiting: set[tuple[str, Spot]] = set()
+        self._queue: deque[tuple[str, Spot]] = deque()
+        for age in ('child', 'adult'):
+            for region in root_regions:
+                self._queue.extend((age, exit) for exit in region.exits)
+                self._queue.extend((age, location) for location in region.locations if location in self.item_locations)
+
+    def _current_logic_versions(self) -> tuple[int, int]:
+        world = self.state_list[0].world
+        return world.rules_version, world.connections_version
+
+    # A plain search of the current exploration, whose queues hold the exits
+    # leading out of the reached regions so it can carry on from there.
+    def copy(self) -> Search:
+        self._update()
+        cache = self._cache.copy()
+        cache.child_queue = self._frontier(cache.child_regions)
+        cache.adult_queue = self._frontier(cache.adult_regions)
+        return Search(self.state_list, initial_cache=cache)
+
+    @staticmethod
+    def _frontier(regions: dict[Region, int]) -> list[Entrance]:
+        return [exit for region in regions for exit in region.exits
+                if exit.connected_region is not None and exit.connected_region not in regions]
+
+    def collect(self, item: Item) -> None:
+        self._collect(item)
+
+    # Collects the item and returns the solver ids it wrote.
+    def _collect(self, item: Item) -> set[tuple[int, int]]:
+        if item.world is None:
+            raise Exception(f"Item '{item.name}' cannot be collected as it does not have a world.")
+        self.writes = writes = set()
+        try:
+            self.state_list[item.world.id].collect(item)
+            self._wake(writes)
+        finally:
+            self.writes = None
+        return writes
+
+    def collect_all(self, itempool: Iterable[Item]) -> None:
+        for item in itempool:
+            if item.solver_id is not None and item.world is not None:
+                self.collect(item)
+
+    def uncollect(self, item: Item) -> None:
+        if item.world is None:
+            raise Exception(f"Item '{item.name}' cannot be uncollected as it does not have a world.")
+        self._retract([], [item])
+
+    def next_sphere(self) -> tuple[dict[Region, int], dict[Region, int], set[Location]]:
+        self._update()
+        return self._cache.child_regions, self._cache.adult_regions, self._cache.visited_locations
+
+    # Everything reachable is visited as soon as it becomes reachable,
+    # so there is never anything new to yield.
+    def iter_reachable_locations(self, item_locations: Iterable[Location]) -> Iterable[Location]:
+        self._update()
+        return iter(())
+
+    # The tracked locations are collected as they are visited, so this only brings the search up to date.
+    def collect_locations(self, item_locations: Optional[Iterable[Location]] = None) -> None:
+        self._update()
+
+    # Like Search.can_beat_game, without scan_for_items this only checks what the search already holds.
+    def can_beat_game(self, scan_for_items: bool = True, predicate: Callable[[State], bool] = State.won) -> bool:
+        if scan_for_items:
+            self._update()
+        return all(map(predicate, self.state_list))
+
+    def beatable_goals(self, goal_categories: dict[str, GoalCategory]) -> ValidGoals:
+        self._update()
+        return self.beatable_goals_fast(goal_categories)
+
+    # The visited locations whose items the current exploration relied on to beat the game,
+    # found in one backward pass from the win condition: each solver id a rule read pulls in
+    # every location whose item wrote it, and each region pulls in the exit it was reached by.
+    # Removing the item of any other location leaves that whole derivation intact, so the
+    # game stays beatable without it and only these locations need an actual re-search.
+    # Returns None if the game isn't beatable, or if the derivation went through a rule that
+    # queried the search itself, since what those rules relied on isn't recorded.
+    def win_support(self, predicate: Callable[[State], bool] = State.won) -> Optional[set[Location]]:
+        self._update()
+        self.reads = reads = set()
+        self._read_search = False
+        try:
+            won = all(map(predicate, self.state_list))
+        finally:
+            self.reads = None
+        if not won or self._read_search:
+            return None
+
+        providers: defaultdict[tuple[int, int], list[Location]] = defaultdict(list)
+        for location, writes in self._collected_writes.items():
+            for key in writes:
+                providers[key].append(location)
+
+        support: set[Location] = set()
+        seen_keys: set[tuple[int, int]] = set()
+        seen_regions: set[tuple[str, Region]] = set()
+        keys = list(reads)
+        facts: list[Fact] = []
+        while keys or facts:
+            while keys:
+                key = keys.pop()
+                if key in seen_keys:
+                    continue
+                seen_keys.add(key)
+                for location in providers.get(key, ()):
+                    if location not in support:
+                        support.add(location)
+                        facts.append(location)
+            if facts:
+                fact = facts.pop()
+                if fact in self._volatile_facts:
+                    return None
+                keys.extend(self._fact_reads.get(fact, ()))
+                if isinstance(fact, Location):
+                    region_fact = (self._location_ages[fact], fact.parent_region)
+                else:
+                    source = self._region_sources.get(fact)
+                    if source is None:
+                        # A root region.
+                        continue
+                    region_fact = (fact[0], source.parent_region)
+                if region_fact not in seen_regions:
+                    seen_regions.add(region_fact)
+                    facts.append(region_fact)
+        return support
+
+    def can_reach(self, region: Region, age: Optional[str] = None, tod: int = TimeOfDay.NONE) -> bool:
+        self._read_search = True
+        if tod:
+            self._tod_expanded = True
+        return super().can_reach(region, age, tod)
+
+    def _regions(self, age: str) -> dict[Region, int]:
+        return self._cache.adult_regions if age == 'adult' else self._cache.child_regions
+
+    # The item at the location that visiting it collects, if any. Like Search.progression_locations,
+    # only advancement items are collected.
+    @staticmethod
+    def _item_at(location: Location) -> Optional[Item]:
+        item = location.item
+        if item is not None and item.advancement and item.solver_id is not None and item.world is not None:
+            return item
+        return None
+
+    # Brings the exploration up to date with the current item placements, entrances and access rules.
+    def _update(self) -> None:
+        if self._logic_versions != self._current_logic_versions():
+            self._start()
+        changed = [location for location in self._location_ages if self._collected.get(location) is not self._item_at(location)]
+        if changed:
+            self._retract(changed, [])
+        self._propagate()
+
+    def _evaluate(self, age: str, spot: Spot) -> tuple[bool, set[tuple[int, int]], bool]:
+        self.reads = reads = set()
+        self._read_search = False
+        try:
+            result = spot.access_rule(self.state_list[spot.world.id], spot=spot, age=age)
+        finally:
+            self.reads = None
+        return result, reads, self._read_search
+
+    def _record(self, fact: Fact, reads: set[tuple[int, int]], volatile: bool) -> None:
+        self._fact_reads[fact] = reads
+        for key in reads:
+            self._dependents[key].add(fact)
+        if volatile:
+            self._volatile_facts.add(fact)
+
+    def _forget(self, fact: Fact) -> None:
+        for key in self._fact_reads.pop(fact, ()):
+            self._dependents[key].discard(fact)
+        self._volatile_facts.discard(fact)
+
+    def _wait(self, age: str, spot: Spot, reads: set[tuple[int, int]], volatile: bool) -> None:
+        if volatile:
+            self._volatile_waiting.add((age, spot))
+        for key in reads:
+            self._waiting[key].add((age, spot))
+
+    def _wake(self, keys: Iterable[tuple[int, int]]) -> None:
+        for key in keys:
+            waiting = self._waiting.pop(key, None)
+            if waiting:
+                self._queue.extend(waiting)
+
+    # Runs queued exits and locations until nothing new can be reached.
+    def _propagate(self) -> None:
+        queue = self._queue
+        changed = True
+        while changed:
+            changed = False
+            while queue:
+                age, spot = queue.popleft()
+                regions = self._regions(age)
+                if spot.parent_region not in regions:
+                    # Stale entry; it is queued again if its region is reached again.
+                    continue
+                if isinstance(spot, Location):
+                    if spot in self._cache.visited_locations:
+                        continue
+                    result, reads, volatile = self._evaluate(age, spot)
+                    if not result:
+                        self._wait(age, spot, reads, volatile)
+                        continue
+                    self._cache.visited_locations.add(spot)
+                    self._location_ages[spot] = age
+                    self._record(spot, reads, volatile)
+                    item = self._item_at(spot)
+                    if item is not None:
+                        self._collected[spot] = item
+                        self._collected_writes[spot] = self._collect(item)
+                else:
+                    target = spot.connected_region
+                    if not spot.world or target is None or target in regions:
+                        continue
+                    result, reads, volatile = self._evaluate(age, spot)
+                    if not result:
+                        self._wait(age, spot, reads, volatile)
+                        continue
+                    root = spot.world.get_region('Root')
+                    if target.provides_time and ~regions[root] & target.provides_time:
+                        regions[root] |= target.provides_time
+                    regions[target] = target.provides_time
+                    self._region_sources[(age, target)] = spot
+                    self._record((age, target), reads, volatile)
+                    queue.extend((age, exit) for exit in target.exits)
+                    queue.extend((age, location) for location in target.locations
+                                 if location in self.item_locations and location not in self._cache.visited_locations)
+                changed = True
+            # Rules that look at the search itself may pass now that more has been reached.
+            if changed and self._volatile_waiting:
+                queue.extend(self._volatile_waiting)
+                self._volatile_waiting.clear()
+
+    # Drops the given visited locations and uncollects the given items, along with
+    # everything that was reached through them, then queues whatever may still be
+    # reachable some other way. Remaining rules that looked at the search itself are
+    # dropped as well, since what they saw may no longer hold.
+    def _retract(self, locations: Iterable[Location], items: Iterable[Item]) -> None:
+        stack: list[Fact] = list(locations)
+        stack.extend(self._volatile_facts)
+        lost_regions: list[tuple[str, Region]] = []
+        lost_locations: list[Location] = []
+
+        def remove(item: Item) -> None:
+            self.writes = writes = set()
+            try:
+                self.state_list[item.world.id].remove(item)
+            finally:
+                self.writes = None
+            for key in writes:
+                stack.extend(self._dependents.get(key, ()))
+
+        for item in items:
+            remove(item)
+        while stack:
+            fact = stack.pop()
+            if isinstance(fact, Location):
+                if fact not in self._location_ages:
+                    continue
+                del self._location_ages[fact]
+                self._cache.visited_locations.discard(fact)
+                self._forget(fact)
+                lost_locations.append(fact)
+                item = self._collected.pop(fact, None)
+                self._collected_writes.pop(fact, None)
+                if item is not None:
+                    remove(item)
+            else:
+                if self._region_sources.get(fact) is None:
+                    # Not reached, or a root region.
+                    continue
+                age, region = fact
+                del self._region_sources[fact]
+                del self._regions(age)[region]
+                self._forget(fact)
+                lost_regions.append(fact)
+                for exit in region.exits:
+                    if exit.connected_region is not None and self._region_sources.get((age, exit.connected_region)) is exit:
+                        stack.append((age, exit.connected_region))
+                for location in region.locations:
+                    if self._location_ages.get(location) == age:
+                        stack.append(location)
+
+        if lost_regions or self._tod_expanded:
+            self._reset_tod()
+        for age, region in lost_regions:
+            self._queue.extend((age, entrance) for entrance in region.entrances)
+        for location in lost_locations:
+            self._queue.extend((age, location) for age in ('child', 'adult'))
+        self._queue.extend(self._volatile_waiting)
+        self._volatile_waiting.clear()
+
+    # Forgets time of day found by exploring from time providers, keeping only what the
+    # reached regions provide by themselves.
+    def _reset_tod(self) -> None:
+        self._tod_expanded = False
+        roots = {state.world.id: state.world.get_region('Root') for state in self.state_list}
+        for regions in (self._cache.child_regions, self._cache.adult_regions):
+            root_tod = defaultdict(int)
+            for region in regions:
+                regions[region] = region.provides_time
+                if region is not roots[region.world.id]:
+                    root_tod[region.world.id] |= region.provides_time
+            for world_id, root in roots.items():
+                regions[root] = root_tod[world_id]
@@ -386,7 +386,7 @@ class Settings(SettingInfos):
 
 
 # gets the randomizer settings, whether to open the gui, and the logger level from command line arguments
-def get_settings_from_command_line_args() -> tuple[Settings, bool, str, bool, str]:
+def get_settings_from_command_line_args() -> tuple[Settings, bool, str, bool, str, int, Optional[str], Optional[str]]:
     parser = argparse.ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
 
     parser.add_argument('--gui', help='Launch the GUI', action='store_true')
@@ -399,6 +399,10 @@ def get_settings_from_command_line_args() -> tuple[Settings, bool, str, bool, st
     parser.add_argument('--no_log', help='Suppresses the generation of a log file.', action='store_true')
     parser.add_argument('--output_settings', help='Always outputs a settings.json file even when spoiler is enabled.', action='store_true')
     parser.add_argument('--diff_rom', help='Generates a ZPF patch from the specified ROM file.')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of processes generating seeds in parallel when generating more than one.')
+    parser.add_argument('--logic_cache', help='Keep parsed logic rules in the specified file, to reuse them while the logic files are unchanged.')
+    parser.add_argument('--fill_engine', choices=['search', 'incremental'], help='How progression fill finds where items can go: by exploring the worlds again for every item, or by updating one exploration in place.')
+    parser.add_argument('--artifact_cache', help='Keep generated seeds in the specified folder, so generating one again with other cosmetics only repatches the cosmetics.')
 
     args = parser.parse_args()
     settings_base = {}
@@ -429,6 +433,8 @@ def get_settings_from_command_line_args() -> tuple[Settings, bool, str, bool, st
     settings = Settings(settings_base)
 
     settings.output_settings = args.output_settings
+    if args.fill_engine is not None:
+        settings.fill_engine = args.fill_engine
 
     if args.settings_string is not None:
         settings.update_with_settings_string(args.settings_string)
@@ -445,4 +451,4 @@ def get_settings_from_command_line_args() -> tuple[Settings, bool, str, bool, st
             print(settings.get_settings_string())
         sys.exit(0)
 
-    return settings, args.gui, args.loglevel, args.no_log, args.diff_rom
+    return settings, args.gui, args.loglevel, args.no_log, args.diff_rom, args.jobs, args.logic_cache, args.artifact_cache
@@ -28,6 +28,9 @@ class SettingInfos:
     check_version = Checkbutton(None)
     checked_version = SettingInfoStr(None, None)
     output_settings = Checkbutton(None)
+    # Timed with CI.py --benchmark_fill, the incremental engine fills multiworld, tokensanity and triforce hunt
+    # seeds faster, but single worlds with entrance shuffle or ludicrous pools slower, and all test settings slower overall.
+    fill_engine = SettingInfoStr(None, None, choices=['search', 'incremental'], default='search')
     patch_without_output = Checkbutton(None)
     generating_patch_file = Checkbutton(None)
     output_file = SettingInfoStr(None, None)
@@ -3380,9 +3383,9 @@ class SettingInfos:
         disable        = {
             '!bingo' : {'settings' : ['bingosync_url']},
         },
-    ),
-    last_woth=Checkbutton(
-        name           = 'include_last_woth',
+    )
+
+    include_last_woth = Checkbutton(
         gui_text       = 'Include Last Way of the Hero',
         gui_tooltip    = '''\
             Replace the first way of the hero hint generated
@@ -3391,13 +3394,11 @@ class SettingInfos:
             distribution without guaranteed way of the
             hero hints.
         ''',
+        default        = False,
         shared         = True,
-    ),
-    Setting_Info(
-        name           = "bingosync_url",
-        type           = str,
-        choices        = {},
-        gui_type       = "Textinput",
+    )
+
+    bingosync_url = Textinput(
         gui_text       = "Bingosync URL",
         shared         = False,
         gui_tooltip    = '''\
@@ -3416,8 +3417,7 @@ class SettingInfos:
             Non Bingosync bingo boards are not directly
             supported, and will also generate generic item hints.
         ''',
-        disabled_default = None,
-        gui_params       = {
+        gui_params     = {
             "size"               : "full",
             "hide_when_disabled" : True,
         },
@@ -2,20 +2,19 @@ from __future__ import annotations
 import logging
 import random
 from collections import OrderedDict
-from itertools import chain
-from typing import TYPE_CHECKING, Any
+from typing import TYPE_CHECKING, Any, Optional
 
 from Item import Item
 from LocationList import location_sort_order
-from Search import Search, RewindableSearch
+from Search import Search, IncrementalSearch, SphereLog
 
 if TYPE_CHECKING:
-    from Dungeon import Dungeon
     from Entrance import Entrance
     from Goals import GoalCategory
     from Hints import GossipText
     from Location import Location
     from Region import Region
+    from RulesCommon import AccessRule
     from Settings import Settings
     from World import World
 
@@ -70,7 +69,16 @@ class Spoiler:
         self.goal_categories: dict[int, dict[str, GoalCategory]] = {}
         self.hints: dict[int, dict[int, GossipText]] = {world.id: {} for world in worlds}
         self.file_hash: list[int] = []
-		self.coarse_spheres = {}
+        self.coarse_spheres = {}
+        self._sphere_log: Optional[SphereLog] = None
+
+    # Explored the first time it's needed, which has to be after the worlds are filled.
+    @property
+    def sphere_log(self) -> SphereLog:
+        if self._sphere_log is None:
+            self._sphere_log = SphereLog(self.worlds)
+        return self._sphere_log
+
     def build_file_hash(self) -> None:
         dist_file_hash = self.settings.distribution.file_hash
         for i in range(5):
@@ -120,11 +128,6 @@ class Spoiler:
             spoiler_entrances.sort(key=lambda entrance: entrance_sort_order.get(entrance.type, -1))
             self.entrances[world.id] = spoiler_entrances
 
-    def copy_worlds(self) -> list[World]:
-        copier = Copier(self)
-        worlds = copier.copy()
-        return worlds
-
     def find_misc_hint_items(self) -> None:
         search = Search([world.state for world in self.worlds])
         all_locations = [location for world in self.worlds for location in world.get_filled_locations()]
@@ -139,51 +142,29 @@ class Spoiler:
             location.maybe_set_misc_hints()
 
     def create_playthrough(self) -> None:
-        logger = logging.getLogger('')
-        if self.worlds[0].check_beatable_only and not Search([world.state for world in self.worlds]).can_beat_game():
+        if self.worlds[0].check_beatable_only and not self.sphere_log.beatable:
             raise RuntimeError('Game unbeatable after placing all items.')
 
-        # create a copy as we will modify it
-        worlds = self.copy_worlds()
+        # items and entrances are removed from the worlds below, the journal puts them back afterwards
+        with GraphJournal() as journal:
+            self._create_playthrough(journal)
 
-        # if we only check for beatable, we can do this sanity check first before writing down spheres
-        if worlds[0].check_beatable_only and not Search([world.state for world in worlds]).can_beat_game():
-            raise RuntimeError('Uncopied world beatable but copied world is not.')
+    def _create_playthrough(self, journal: GraphJournal) -> None:
+        logger = logging.getLogger('')
+        worlds = self.worlds
 
-        search = RewindableSearch([world.state for world in worlds])
-        logger.debug('Initial search: %s', search.state_list[0].get_prog_items())
-        # Get all item locations in the worlds
-        item_locations = search.progression_locations()
+        # Start from the spheres of the shared sphere log, on a search of our own since it gets taken apart below.
+        sphere_log = self.sphere_log
+        search = sphere_log.rewindable_search()
         # Omit certain items from the playthrough
-        internal_locations = {location for location in item_locations if location.internal}
-        # Generate a list of spheres by iterating over reachable locations without collecting as we go.
-        # Collecting every item in one sphere means that every item
-        # in the next sphere is collectable. Will contain every reachable item this way.
-        logger.debug('Building up collection spheres.')
+        internal_locations = {location for location in sphere_log.item_locations if location.internal}
         collection_spheres = []
-        entrance_spheres = []
-        remaining_entrances = set(entrance for world in worlds for entrance in world.get_shuffled_entrances())
-
-        search.checkpoint()
-        search.collect_pseudo_starting_items()
-        logger.debug('With pseudo starting items: %s', search.state_list[0].get_prog_items())
-
-        while True:
-            search.checkpoint()
-            # Not collecting while the generator runs means we only get one sphere at a time
-            # Otherwise, an item we collect could influence later item collection in the same sphere
-            collected = list(search.iter_reachable_locations(item_locations))
-            if not collected:
-                break
+        entrance_spheres = [list(sphere) for sphere in sphere_log.entrance_spheres]
+        for sphere in sphere_log.spheres:
+            collected = list(sphere)
             random.shuffle(collected)
-            # Gather the new entrances before collecting items.
             collection_spheres.append(collected)
-            accessed_entrances = set(filter(search.spot_access, remaining_entrances))
-            entrance_spheres.append(list(accessed_entrances))
-            remaining_entrances -= accessed_entrances
             for location in collected:
-                # Collect the item for the state world it is for
-                search.state_list[location.item.world.id].collect(location.item)
                 location.maybe_set_misc_hints()
         logger.info('Collected %d spheres', len(collection_spheres))
         self.full_playthrough = dict((location.name, i + 1) for i, sphere in enumerate(collection_spheres) for location in sphere)
@@ -192,7 +173,14 @@ class Spoiler:
         # Reduce each sphere in reverse order, by checking if the game is beatable
         # when we remove the item. We do this to make sure that progressive items
         # like bow and slingshot appear as early as possible rather than as late as possible.
+        # Beatability is checked against a separate fully explored search that only
+        # re-explores what depends on each removed item.
+        # Items outside the locations the search last relied on to win can be removed without
+        # checking; that set only changes when a removal is kept.
         required_locations = []
+        woth_search = IncrementalSearch([world.state for world in worlds])
+        woth_search.collect_pseudo_starting_items()
+        win_support = woth_search.win_support()
         for sphere in reversed(collection_spheres):
             random.shuffle(sphere)
             for location in sphere:
@@ -210,16 +198,20 @@ class Spoiler:
                     required_locations.append(location)
                     continue
 
-                location.item = None
+                journal.set_item(location, None)
 
                 # An item can only be required if it isn't already obtained or if it's progressive
                 if search.state_list[old_item.world.id].item_count(old_item.solver_id) < old_item.world.max_progressions[old_item.name]:
+                    if win_support is not None and location not in win_support:
+                        continue
                     # Test whether the game is still beatable from here.
                     logger.debug('Checking if %s is required to beat the game.', old_item.name)
-                    if not search.can_beat_game():
+                    if not woth_search.can_beat_game():
                         # still required, so reset the item
-                        location.item = old_item
+                        journal.set_item(location, old_item)
                         required_locations.append(location)
+                    else:
+                        win_support = woth_search.win_support()
 
         # Reduce each entrance sphere in reverse order, by checking if the game is beatable when we disconnect the entrance.
         required_entrances = []
@@ -227,7 +219,7 @@ class Spoiler:
             random.shuffle(sphere)
             for entrance in sphere:
                 # we disconnect the entrance and check if the game is still beatable
-                old_connected_region = entrance.disconnect()
+                old_connected_region = journal.disconnect(entrance)
 
                 # we use a new search to ensure the disconnected entrance is no longer used
                 sub_search = Search([world.state for world in worlds])
@@ -236,7 +228,7 @@ class Spoiler:
                 logger.debug('Checking if reaching %s, through %s, is required to beat the game.', old_connected_region.name, entrance.name)
                 if not sub_search.can_beat_game():
                     # still required, so reconnect the entrance
-                    entrance.connect(old_connected_region)
+                    journal.connect(entrance, old_connected_region)
                     required_entrances.append(entrance)
 
         # Regenerate the spheres as we might not reach places the same way anymore.
@@ -278,99 +270,74 @@ class Spoiler:
 
         # Then we can finally output our playthrough
         self.playthrough = OrderedDict((str(i), {location: location.item for location in sphere}) for i, sphere in enumerate(collection_spheres))
-        # Copy our misc. hint items, since we set them in the world copy
-        for w, sw in zip(worlds, self.worlds):
-            # But the actual location saved here may be in a different world
-            for item_name, item_location in w.hinted_dungeon_reward_locations.items():
-                sw.hinted_dungeon_reward_locations[item_name] = self.worlds[item_location.world.id].get_location(item_location.name)
-            for hint_type, item_location in w.misc_hint_item_locations.items():
-                sw.misc_hint_item_locations[hint_type] = self.worlds[item_location.world.id].get_location(item_location.name)
-
         if worlds[0].entrance_shuffle:
             self.entrance_playthrough = OrderedDict((str(i + 1), list(sphere)) for i, sphere in enumerate(entrance_spheres))
 
 
-class Copier:
-    def __init__(self, spoiler: Spoiler) -> None:
-        self.spoiler: Spoiler = spoiler
-        self.worlds: dict[int, World] = {}
-        self.dungeons: dict[int, Dungeon] = {}
-        self.regions: dict[int, Region] = {}
-        self.entrances: dict[int, Entrance] = {}
-        self.locations: dict[int, Location] = {}
-        self.items: dict[int, Item] = {}
-
-    def copy(self) -> list[World]:
-        if self.worlds:
-            return list(self.worlds.values())
-
-        # Make copies.
-        for world in self.spoiler.worlds:
-            self.worlds[id(world)] = world.copy()
-            for dungeon in world.dungeons:
-                self.dungeons[id(dungeon)] = dungeon.copy()
-                for item in chain(dungeon.boss_key, dungeon.small_keys, dungeon.dungeon_items, dungeon.silver_rupees):
-                    if id(item) in self.items:
-                        continue
-                    self.items[id(item)] = item.copy()
-            for region in world.regions:
-                self.regions[id(region)] = region.copy()
-                for entrance in chain(region.entrances, region.exits, [region.savewarp] if region.savewarp else []):
-                    if id(entrance) in self.entrances:
-                        continue
-                    self.entrances[id(entrance)] = entrance.copy()
-                for location in region.locations:
-                    if id(location) in self.locations:
-                        continue
-                    self.locations[id(location)] = location.copy()
-                    if location.item and id(location.item) not in self.items:
-                        self.items[id(location.item)] = location.item.copy()
-            for item in world.itempool:
-                if id(item) in self.items:
-                    continue
-                self.items[id(item)] = item.copy()
-
-        # Update references.
-        for world in self.worlds.values():
-            world.dungeons = [self.dungeons.get(id(dungeon), dungeon) for dungeon in world.dungeons]
-            world.regions = [self.regions.get(id(region), region) for region in world.regions]
-            world.itempool = [self.items.get(id(item), item) for item in world.itempool]
-
-        for dungeon in self.dungeons.values():
-            dungeon.world = self.worlds.get(id(dungeon.world), dungeon.world)
-            dungeon.regions = [self.regions.get(id(region), region) for region in dungeon.regions]
-            dungeon.boss_key = [self.items.get(id(item), item) for item in dungeon.boss_key]
-            dungeon.small_keys = [self.items.get(id(item), item) for item in dungeon.small_keys]
-            dungeon.dungeon_items = [self.items.get(id(item), item) for item in dungeon.dungeon_items]
-            dungeon.silver_rupees = [self.items.get(id(item), item) for item in dungeon.silver_rupees]
-
-        for region in self.regions.values():
-            region.world = self.worlds.get(id(region.world), region.world)
-            region.entrances = [self.entrances.get(id(entrance), entrance) for entrance in region.entrances]
-            region.exits = [self.entrances.get(id(entrance), entrance) for entrance in region.exits]
-            region.locations = [self.locations.get(id(location), location) for location in region.locations]
-            region.dungeon = self.dungeons.get(id(region.dungeon), region.dungeon)
-            region.savewarp = self.entrances.get(id(region.savewarp), region.savewarp)
-
-        for entrance in self.entrances.values():
-            entrance.world = self.worlds.get(id(entrance.world), entrance.world)
-            entrance.parent_region = self.regions.get(id(entrance.parent_region), entrance.parent_region)
-            entrance.connected_region = self.regions.get(id(entrance.connected_region), entrance.connected_region)
-            entrance.reverse = self.entrances.get(id(entrance.reverse), entrance.reverse)
-            entrance.replaces = self.entrances.get(id(entrance.replaces), entrance.replaces)
-            entrance.assumed = self.entrances.get(id(entrance.assumed), entrance.assumed)
-
-        for location in self.locations.values():
-            location.world = self.worlds.get(id(location.world), location.world)
-            location.parent_region = self.regions.get(id(location.parent_region), location.parent_region)
-            location.item = self.items.get(id(location.item), location.item)
-
-        for item in self.items.values():
-            item.world = self.worlds.get(id(item.world), item.world)
-            item.location = self.locations.get(id(item.location), item.location)
-            item.looks_like_item = self.items.get(id(item.looks_like_item), item.looks_like_item)
-
-        for world in self.worlds.values():
-            world.initialize_entrances()
-
-        return list(self.worlds.values())
+# Records every change made to the shared world graph so it can be undone.
+# Passes that experiment on the graph, like the playthrough reduction, modify the
+# original objects through the journal instead of working on a full clone of every
+# World, Region, Entrance, Location and Item. Only the first original value of each
+# overridden attribute or region entrance list is kept, so the cost follows the
+# number of changes rather than the size of the graph.
+class GraphJournal:
+    def __init__(self) -> None:
+        self.attributes: dict[tuple[int, str], tuple[Any, str, Any]] = {}
+        self.region_entrances: dict[int, tuple[Region, list[Entrance]]] = {}
+
+    def __enter__(self) -> GraphJournal:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.restore()
+
+    def set(self, obj: Any, attribute: str, value: Any) -> None:
+        key = (id(obj), attribute)
+        if key not in self.attributes:
+            self.attributes[key] = (obj, attribute, getattr(obj, attribute))
+        setattr(obj, attribute, value)
+        # Attributes set directly bypass the methods that keep graph_version up to date.
+        if obj.world is not None:
+            if attribute == 'access_rule':
+                obj.world.rule_changed()
+            elif attribute == 'connected_region':
+                obj.world.connection_changed()
+            else:
+                obj.world.graph_changed()
+
+    def set_item(self, location: Location, item: Optional[Item]) -> None:
+        self.set(location, 'item', item)
+
+    def set_access_rule(self, spot: Location | Entrance, rule: AccessRule) -> None:
+        self.set(spot, 'access_rule', rule)
+
+    def disconnect(self, entrance: Entrance) -> Optional[Region]:
+        self._save_entrances(entrance.connected_region)
+        self.set(entrance, 'connected_region', entrance.connected_region)
+        return entrance.disconnect()
+
+    def connect(self, entrance: Entrance, region: Region) -> None:
+        self._save_entrances(region)
+        self.set(entrance, 'connected_region', entrance.connected_region)
+        entrance.connect(region)
+
+    def _save_entrances(self, region: Optional[Region]) -> None:
+        if region is not None and id(region) not in self.region_entrances:
+            self.region_entrances[id(region)] = (region, list(region.entrances))
+
+    def restore(self) -> None:
+        for obj, attribute, value in self.attributes.values():
+            setattr(obj, attribute, value)
+        for region, entrances in self.region_entrances.values():
+            region.entrances = entrances
+        for world in {obj.world for obj, _, _ in self.attributes.values()} | {region.world for region, _ in self.region_entrances.values()}:
+            if world is not None:
+                world.graph_changed()
+        for world in {obj.world for obj, attribute, _ in self.attributes.values() if attribute == 'access_rule'}:
+            if world is not None:
+                world.rule_changed()
+        for world in {region.world for region, _ in self.region_entrances.values()}:
+            if world is not None:
+                world.connection_changed()
+        self.attributes.clear()
+        self.region_entrances.clear()
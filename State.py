@@ -1,4 +1,5 @@
 from __future__ import annotations
+from array import array
 from collections.abc import Iterable
 from typing import TYPE_CHECKING, Optional, Any
 
@@ -23,18 +24,33 @@ Ocarina_C_down_Button: int = ItemInfo.solver_ids['Ocarina_C_down_Button']
 Ocarina_C_right_Button: int = ItemInfo.solver_ids['Ocarina_C_right_Button']
 
 class State:
+    __slots__ = ('solv_items', 'solver_mask', 'changed', 'world', 'search')
+
     def __init__(self, parent: World) -> None:
-        self.solv_items: list[int] = [0] * len(ItemInfo.solver_ids)
+        # Item counts by solver id, as unsigned shorts so copying a state is a single buffer copy.
+        self.solv_items: array[int] = array('H', [0]) * len(ItemInfo.solver_ids)
+        # Bit i is set when solv_items[i] is nonzero. Compiled rules test this directly.
+        self.solver_mask: int = 0
+        # Solver ids collected or removed since the search owning this state last took them.
+        self.changed: set[int] = set()
         self.world: World = parent
         self.search: Optional[Search] = None
 
     def copy(self, new_world: Optional[World] = None) -> State:
         new_world = new_world if new_world else self.world
         new_state = State(new_world)
-        for i, val in enumerate(self.solv_items):
-            new_state.solv_items[i] = val
+        # array() and int() drop the tracking wrappers an IncrementalSearch may have added.
+        # The new state is sized for every solver id known now, including events registered since this one was made.
+        new_state.solv_items[:len(self.solv_items)] = array('H', self.solv_items)
+        new_state.solver_mask = int(self.solver_mask)
+        new_state.changed = set(self.changed)
         return new_state
 
+    # A hashable key for this world and inventory, equal for states holding the same items,
+    # for caches of results that only depend on what the state holds.
+    def inventory_key(self) -> tuple[int, bytes]:
+        return self.world.id, self.solv_items.tobytes()
+
     def item_name(self, location: str | Location) -> Optional[str]:
         location = self.world.get_location(location)
         if location.item is None:
@@ -156,9 +172,12 @@ class State:
             if dungeon_name in ('Forest Temple', 'Fire Temple', 'Water Temple', 'Shadow Temple', 'Spirit Temple'):
                 bk = f'Boss Key ({dungeon_name})'
                 self.solv_items[ItemInfo.solver_ids[escape_name(bk)]] = 1
+                self.update_mask(ItemInfo.solver_ids[escape_name(bk)])
         if item.alias and item.alias_id is not None:
             self.solv_items[item.alias_id] += item.alias[1]
+            self.update_mask(item.alias_id)
         self.solv_items[item.solver_id] += 1
+        self.update_mask(item.solver_id)
 
     # Be careful using this function. It will not uncollect any
     # items that may be locked behind the item, only the item itself.
@@ -170,12 +189,22 @@ class State:
             if dungeon_name in ('Forest Temple', 'Fire Temple', 'Water Temple', 'Shadow Temple', 'Spirit Temple'):
                 bk = f'Boss Key ({dungeon_name})'
                 self.solv_items[ItemInfo.solver_ids[escape_name(bk)]] = 0
+                self.update_mask(ItemInfo.solver_ids[escape_name(bk)])
         if item.alias and item.alias_id is not None and self.solv_items[item.alias_id] > 0:
-            self.solv_items[item.alias_id] -= item.alias[1]
-            if self.solv_items[item.alias_id] < 0:
-                self.solv_items[item.alias_id] = 0
+            # Counts are unsigned, so clamp before storing.
+            self.solv_items[item.alias_id] = max(self.solv_items[item.alias_id] - item.alias[1], 0)
+            self.update_mask(item.alias_id)
         if self.solv_items[item.solver_id] > 0:
             self.solv_items[item.solver_id] -= 1
+            self.update_mask(item.solver_id)
+
+    # Keeps solver_mask and changed in sync after solv_items[item] changes.
+    def update_mask(self, item: int) -> None:
+        self.changed.add(item)
+        if self.solv_items[item]:
+            self.solver_mask |= 1 << item
+        else:
+            self.solver_mask &= ~(1 << item)
 
     def region_has_shortcuts(self, region_name: str) -> bool:
         return self.world.region_has_shortcuts(region_name)
@@ -204,10 +233,11 @@ class State:
         return True
 
     def __getstate__(self) -> dict[str, Any]:
-        return self.__dict__.copy()
+        return {name: getattr(self, name) for name in self.__slots__}
 
     def __setstate__(self, state: dict[str, Any]) -> None:
-        self.__dict__.update(state)
+        for name, value in state.items():
+            setattr(self, name, value)
 
     def get_prog_items(self) -> dict[str, int]:
         return {
@@ -6,23 +6,35 @@ from __future__ import annotations
 import json
 import logging
 import os
+import pickle
 import random
 import re
+import shutil
 import unittest
 from collections import Counter, defaultdict
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
 from typing import Literal, Optional, Any, overload
 
 from EntranceShuffle import EntranceShuffleError
-from Fill import ShuffleError
-from Hints import HintArea, build_misc_item_hints
-from Item import ItemInfo
+from Fill import FillCandidates, FillError, ShuffleError, fill_restrictive
+from Hints import HintArea, build_misc_item_hints, gossipLocations
+from Item import Item, ItemInfo
 from ItemPool import remove_junk_items, remove_junk_ludicrous_items, ludicrous_items_base, ludicrous_items_extended, trade_items, ludicrous_exclusions
+from Location import Location
 from LocationList import location_is_viewable
-from Main import main, resolve_settings, build_world_graphs
+from Main import main, resolve_settings, build_world_graphs, place_items, generate_batch_seed, GenerationArtifacts, WorldTemplate
 from Messages import Message, read_messages, shuffle_messages
+from N64Patch import XorKeyStream, write_block
+from Patches import static_base_key, static_base_sources
 from Settings import Settings, get_preset_files
-from Spoiler import Spoiler
-from Rom import Rom
+from Spoiler import Spoiler, GraphJournal
+from Rom import Rom, RomLayer, ChangedRanges, DECOMPRESSED_CRC, DMADATA_START
+from RuleParser import rule_ast_cache, spot_rules
+from Search import Search, RewindableSearch, IncrementalSearch, SphereLog
+from World import World
+from ntype import BigStream
+import crc
 
 test_dir = os.path.join(os.path.dirname(__file__), 'tests')
 output_dir = os.path.join(test_dir, 'Output')
@@ -125,6 +137,48 @@ def generate_with_plandomizer(filename: str, live_copy: bool = False, max_attemp
     return distribution_file, spoiler
 
 
+# Settings files the world graph tests run on: plain, with shuffled entrances, and with several worlds.
+graph_test_files = ('plentiful.sav', 'entrance.sav', 'multiworld.sav')
+
+
+# Builds the worlds of a settings file and fills them, without generating the rest of the seed.
+def fill_worlds(settings_file: str) -> list[World]:
+    settings = load_settings(settings_file, seed='TESTTESTTEST')
+    resolve_settings(settings)
+    worlds = build_world_graphs(settings)
+    place_items(worlds)
+    return worlds
+
+
+# Filled worlds by settings file, shared between the tests that leave them as they found them.
+shared_worlds: dict[str, list[World]] = {}
+
+
+# Like fill_worlds, but fills each settings file once for every test using it.
+# Filling multiworld.sav alone takes most of the time of the tests over graph_test_files.
+def shared_fill_worlds(settings_file: str) -> list[World]:
+    if settings_file not in shared_worlds:
+        shared_worlds[settings_file] = fill_worlds(settings_file)
+    return shared_worlds[settings_file]
+
+
+# A fixed sample of the locations, for tests that search again for every location they check.
+def sample_locations(locations: Iterable[Location], count: int = 40) -> list[Location]:
+    locations = sorted(locations, key=lambda location: (location.world.id, location.name))
+    return random.Random('TESTTESTTEST').sample(locations, min(count, len(locations)))
+
+
+# Empties the location for the duration of the block, and yields the item it held.
+@contextmanager
+def removed_item(location: Location) -> Iterator[Optional[Item]]:
+    item = location.item
+    location.item = None
+    try:
+        yield item
+    finally:
+        location.item = item
+
+
 def get_actual_pool(spoiler: dict[str, Any]) -> dict[str, int]:
     """Retrieves the actual item pool based on items placed in the spoiler log.
 
@@ -640,6 +694,64 @@ class TestHints(unittest.TestCase):
         woth = [x['item'] if isinstance(x, dict) else x for x in spoiler[':woth_locations'].values()]
         self.assertIn('Blue Fire Arrows', woth)
 
+    def test_gossip_stone_reachability(self):
+        # The hints must see the stones Search.max_explore reaches, which unlike the sphere log's
+        # max search doesn't hold the pseudo starting items of locations it can't reach.
+        for filename in graph_test_files:
+            with self.subTest(filename=filename):
+                worlds = shared_fill_worlds(filename)
+                spoiler = Spoiler(worlds)
+                search = spoiler.sphere_log.max_explore
+                max_search = Search.max_explore([world.state for world in worlds])
+                for world in worlds:
+                    self.assertEqual(search.state_list[world.id].guarantee_hint(), max_search.state_list[world.id].guarantee_hint())
+                    for stone in gossipLocations.values():
+                        location = world.get_location(stone.location)
+                        self.assertEqual(search.spot_access(location), max_search.spot_access(location), location.name)
+
+
+class TestWorldTemplate(unittest.TestCase):
+    def test_retry_from_template(self):
+        # Worlds copied from the template must be separate from it, and generate like freshly built ones.
+        # The template is saved or loaded before entrances are shuffled, so an attempt failing to shuffle still counts.
+        def attempt(settings, template):
+            settings.reset_distribution()
+            try:
+                return build_world_graphs(settings, template)
+            except EntranceShuffleError:
+                return None
+
+        for filename in graph_test_files:
+            with self.subTest(filename=filename):
+                settings = load_settings(filename, seed='TESTTESTTEST')
+                resolve_settings(settings)
+                template = WorldTemplate(max_loads=2)
+                attempt(settings, template)
+                # The first attempt isn't saved, the second one is.
+                self.assertIsNone(template.worlds)
+                attempt(settings, template)
+                saved_worlds = template.worlds
+                self.assertIsNotNone(saved_worlds)
+                for _ in range(template.max_loads):
+                    worlds = attempt(settings, template)
+                    self.assertIs(template.worlds, saved_worlds)
+                    if worlds is None:
+                        continue
+                    self.assertIs(settings.distribution, worlds[0].distribution.distribution)
+                    for world, saved in zip(worlds, template.worlds):
+                        self.assertEqual([region.name for region in world.regions], [region.name for region in saved.regions])
+                        saved_spots = {id(spot) for region in saved.regions for spot in (region, *region.exits, *region.locations)}
+                        for region in world.regions:
+                            self.assertIs(region.world, world)
+                            for spot in (region, *region.exits, *region.locations):
+                                self.assertNotIn(id(spot), saved_spots, spot.name)
+                    place_items(worlds)
+                    self.assertTrue(Search([world.state for world in worlds]).can_beat_game())
+                # Once the template has been used max_loads times, the worlds are built anew and replace it.
+                attempt(settings, template)
+                self.assertIsNot(template.worlds, saved_worlds)
+                self.assertEqual(template.loads, 0)
+
 
 class TestEntranceRandomizer(unittest.TestCase):
     def test_spawn_point_invalid_areas(self):
@@ -665,6 +777,520 @@ class TestEntranceRandomizer(unittest.TestCase):
                 build_world_graphs(settings)
 
 
+class TestSearch(unittest.TestCase):
+    def test_state_copy(self):
+        # Copies must hold the same items, independently of the state they were copied from.
+        worlds = fill_worlds('plentiful.sav')
+        for search in (Search.max_explore([world.state for world in worlds]), IncrementalSearch([world.state for world in worlds])):
+            for state in search.state_list:
+                state_copy = state.copy()
+                self.assertEqual(list(state_copy.solv_items), list(state.solv_items))
+                self.assertEqual(state_copy.solver_mask, state.solver_mask)
+                self.assertEqual(state_copy.inventory_key(), state.inventory_key())
+                item = next(location.item for location in state.world.get_locations()
+                            if location.item and location.item.solver_id is not None and location.item.world is state.world)
+                state_copy.collect(item)
+                self.assertNotEqual(state_copy.inventory_key(), state.inventory_key())
+                state_copy.remove(item)
+                self.assertEqual(state_copy.inventory_key(), state.inventory_key())
+
+    def test_beatable_memo(self):
+        # Repeated checks must be answered from the memo, and changing the graph must not be.
+        worlds = fill_worlds('plentiful.sav')
+        Search.beatable_memo.clear()
+        self.assertTrue(Search([world.state for world in worlds]).can_beat_game())
+        hits = Search.beatable_memo_hits
+        self.assertTrue(Search([world.state for world in worlds]).can_beat_game())
+        self.assertEqual(Search.beatable_memo_hits, hits + 1)
+        location = next(location for world in worlds for location in world.get_locations()
+                        if location.item and location.item.name == 'Triforce')
+        with removed_item(location):
+            self.assertFalse(Search([world.state for world in worlds]).can_beat_game())
+        self.assertTrue(Search([world.state for world in worlds]).can_beat_game())
+
+    def test_incremental_fill(self):
+        # Both fill engines must place every item in the same location.
+        # The files cover a single world, shuffled entrances, several worlds, tokensanity, master quest,
+        # glitched logic and triforce hunt, and all shuffle their entrances for this seed, as a file that
+        # can't would fail before the fill engines are used.
+        for filename in ('plentiful.sav', 'entrance.sav', 'multiworld.sav', 'tokensanity.sav', 'mq.sav', 'glitched-standard.sav', 'triforce.sav'):
+            with self.subTest(filename=filename):
+                placements = []
+                for fill_engine in ('search', 'incremental'):
+                    settings = load_settings(filename, seed='TESTTESTTEST')
+                    settings.fill_engine = fill_engine
+                    resolve_settings(settings)
+                    worlds = build_world_graphs(settings)
+                    try:
+                        place_items(worlds)
+                    except ShuffleError as e:
+                        placements.append(type(e))
+                        continue
+                    placements.append({(location.world.id, location.name): (location.item.world.id, location.item.name)
+                                       for world in worlds for location in world.get_filled_locations()})
+                self.assertEqual(placements[0], placements[1])
+
+    def test_fill_candidates(self):
+        # The fill candidates must answer like Location.can_fill, for either engine's search.
+        worlds = fill_worlds('plentiful.sav')
+        locations = [location for world in worlds for location in world.get_locations()]
+        items = list({location.item.name: location.item for location in locations if location.item and location.item.world}.values())[:20]
+        for search in (Search.max_explore([world.state for world in worlds]), IncrementalSearch([world.state for world in worlds], locations)):
+            search.collect_locations()
+            candidates = FillCandidates()
+            candidates.update(search)
+            for item in items:
+                for location in locations:
+                    self.assertEqual(candidates.can_fill(location, item), location.can_fill(search.state_list[location.world.id], item),
+                                     f'{item.name} at {location.name}')
+
+    def test_fill_backtracking(self):
+        # The first item placed can go to either location, but the second only to one of them.
+        # When the first is placed where the second had to go, it must be taken back rather than failing.
+        worlds = fill_worlds('plentiful.sav')
+        open_spot, narrow_spot = worlds[0].get_location('KF Midos Top Left Chest'), worlds[0].get_location('KF Midos Top Right Chest')
+        # fill_restrictive only places items the search can collect, so take two of those from elsewhere.
+        sources = [location for location in worlds[0].get_filled_locations()
+                   if location.item.advancement and not location.locked and not location.internal
+                   and location not in (open_spot, narrow_spot)][:2]
+        first, second = (location.item for location in sources)
+        for location in (open_spot, narrow_spot, *sources):
+            if location.item is not None:
+                location.item.location = None
+                location.item = None
+        open_spot.item_rule = lambda location, item: True
+        narrow_spot.item_rule = lambda location, item: item is first
+        failures = 0
+        for seed in range(20):
+            for backtracks in (0, 20):
+                random.seed(seed)
+                try:
+                    fill_restrictive(worlds, Search.max_explore([world.state for world in worlds]), [open_spot, narrow_spot], [second, first], backtracks=backtracks)
+                except FillError:
+                    self.assertEqual(backtracks, 0)
+                    failures += 1
+                else:
+                    self.assertIs(open_spot.item, second)
+                    self.assertIs(narrow_spot.item, first)
+                for location in (open_spot, narrow_spot):
+                    if location.item is not None:
+                        location.item.location = None
+                        location.item = None
+        self.assertGreater(failures, 0)
+
+    def test_priority_fill(self):
+        # Maps and compasses shuffled anywhere are priority items, placed by fill_restrictive_fast where their item rules allow.
+        worlds = fill_worlds('nightforest.sav')
+        placed = [location for world in worlds for location in world.get_filled_locations() if location.item.map or location.item.compass]
+        self.assertTrue(placed)
+        for location in placed:
+            self.assertTrue(location.item.priority)
+            self.assertTrue(location.can_fill_fast(location.item), location.name)
+
+    def test_incremental_search(self):
+        # Removing and restoring single items must agree with exploring from scratch.
+        for filename in graph_test_files:
+            with self.subTest(filename=filename):
+                worlds = shared_fill_worlds(filename)
+                incremental = IncrementalSearch([world.state for world in worlds])
+                search = Search([world.state for world in worlds])
+                for location in sample_locations(incremental.item_locations):
+                    with removed_item(location):
+                        self.assertEqual(search.can_beat_game(), incremental.can_beat_game(), location.name)
+                self.assertTrue(incremental.can_beat_game())
+
+    def test_incremental_search_graph_changes(self):
+        # Changed access rules and reconnected entrances must be picked up, and copies must carry on exploring.
+        for filename in graph_test_files:
+            with self.subTest(filename=filename):
+                worlds = shared_fill_worlds(filename)
+                incremental = IncrementalSearch([world.state for world in worlds])
+                self.assertTrue(incremental.can_beat_game())
+                root_exits = [exit for world in worlds for exit in world.get_region('Root').exits]
+                with GraphJournal() as journal:
+                    for exit in root_exits:
+                        journal.set_access_rule(exit, lambda state, **kwargs: False)
+                    self.assertFalse(incremental.can_beat_game())
+                self.assertTrue(incremental.can_beat_game())
+                with GraphJournal() as journal:
+                    for exit in root_exits:
+                        journal.disconnect(exit)
+                    self.assertFalse(incremental.can_beat_game())
+                self.assertTrue(incremental.can_beat_game())
+
+                for location in incremental.item_locations:
+                    with removed_item(location):
+                        search = None if incremental.can_beat_game() else incremental.copy()
+                    if search is not None:
+                        search.collect(location.item)
+                        search.collect_locations()
+                        self.assertTrue(search.can_beat_game(scan_for_items=False), location.name)
+                        break
+                else:
+                    self.fail('No location is required')
+
+    def test_win_support(self):
+        # Removing any item the win support says wasn't relied on must leave the game beatable.
+        # There is no support when the win went through a rule querying the search, as on entrance.sav,
+        # but the other files must have one.
+        supported = []
+        for filename in graph_test_files:
+            with self.subTest(filename=filename):
+                worlds = shared_fill_worlds(filename)
+                incremental = IncrementalSearch([world.state for world in worlds])
+                search = Search([world.state for world in worlds])
+                support = incremental.win_support()
+                if support is None:
+                    continue
+                supported.append(filename)
+                self.assertLessEqual(support, incremental.item_locations)
+                for location in sample_locations(incremental.item_locations - support):
+                    with removed_item(location):
+                        self.assertTrue(search.can_beat_game(), location.name)
+        self.assertTrue(supported)
+
+    def test_sphere_log(self):
+        # Searches started from the sphere log must match searches explored from scratch.
+        for filename in graph_test_files:
+            with self.subTest(filename=filename):
+                worlds = shared_fill_worlds(filename)
+                sphere_log = SphereLog(worlds)
+                search = Search([world.state for world in worlds])
+                search.collect_pseudo_starting_items()
+                for index, sphere in enumerate(sphere_log.spheres):
+                    start = sphere_log.search_at(index)
+                    self.assertEqual([list(state.solv_items) for state in start.state_list],
+                                     [list(state.solv_items) for state in search.state_list])
+                    collected = list(search.iter_reachable_locations(sphere_log.item_locations))
+                    self.assertEqual(set(collected), set(sphere))
+                    for location in collected:
+                        search.collect(location.item)
+                max_search = Search.max_explore([world.state for world in worlds])
+                for world in worlds:
+                    for location in world.get_locations():
+                        self.assertEqual(max_search.spot_access(location), sphere_log.max_search.spot_access(location), location.name)
+
+    def test_rewindable_search(self):
+        # Checkpoints must give back the caches the search had, and unvisiting the spheres in reverse must undo them.
+        for filename in graph_test_files:
+            with self.subTest(filename=filename):
+                worlds = shared_fill_worlds(filename)
+                search = RewindableSearch([world.state for world in worlds])
+                item_locations = search.progression_locations()
+                spheres = []
+                caches = []
+                while True:
+                    search.checkpoint()
+                    caches.append(search.copy()._cache)
+                    sphere = list(search.iter_reachable_locations(item_locations))
+                    if not sphere:
+                        break
+                    spheres.append(sphere)
+                    for location in sphere:
+                        search.collect(location.item)
+                for index, cache in enumerate(caches):
+                    self.assertEqual(search.cache_at(index), cache)
+                for index in reversed(range(len(spheres))):
+                    for location in spheres[index]:
+                        search.uncollect(location.item)
+                        search.unvisit(location)
+                    # The regions are the ones the sphere was found in, without its visits.
+                    cache = search.copy()._cache
+                    self.assertEqual(cache.visited_locations, caches[index].visited_locations)
+                    self.assertEqual(cache.adult_regions, caches[index + 1].adult_regions)
+                    self.assertEqual(cache.child_regions, caches[index + 1].child_regions)
+                search.reset()
+                self.assertEqual(search.copy()._cache, caches[0])
+
+    def test_rule_index(self):
+        # Skipping rules that read no changed items must find the same spheres as retrying everything.
+        for filename in graph_test_files:
+            with self.subTest(filename=filename):
+                worlds = shared_fill_worlds(filename)
+                spheres = []
+                for indexed in (False, True):
+                    for world in worlds:
+                        # Each pass builds the index anew; emptying its spots makes the search retry every rule.
+                        world._rule_dependents = None
+                        world.get_rule_dependents()
+                        if not indexed:
+                            world._indexed_spots.clear()
+                    search = Search([world.state for world in worlds])
+                    item_locations = search.progression_locations()
+                    found = []
+                    while True:
+                        sphere = set(search.iter_reachable_locations(item_locations))
+                        if not sphere:
+                            break
+                        for location in sphere:
+                            search.collect(location.item)
+                        found.append(sphere)
+                    spheres.append(found)
+                self.assertTrue(any(world._indexed_spots for world in worlds))
+                self.assertEqual(spheres[0], spheres[1])
+
+    def test_any_age_rules(self):
+        # Sharing results of age independent rules between ages must find the same regions as evaluating every age.
+        for filename in graph_test_files:
+            with self.subTest(filename=filename):
+                worlds = shared_fill_worlds(filename)
+                rules = {spot.access_rule for world in worlds for region in world.regions
+                         for spot in (*region.exits, *region.locations) if getattr(spot.access_rule, 'any_age', False)}
+                self.assertTrue(rules)
+                results = []
+                for shared in (True, False):
+                    for rule in rules:
+                        rule.any_age = shared
+                    search = Search.max_explore([world.state for world in worlds])
+                    results.append((search._cache.child_regions, search._cache.adult_regions, search._cache.visited_locations))
+                for rule in rules:
+                    rule.any_age = True
+                self.assertEqual(results[0], results[1])
+
+    def test_playthrough_restores_worlds(self):
+        # The playthrough reduces the worlds in place and must leave every item and entrance as it found them.
+        for filename in graph_test_files:
+            with self.subTest(filename=filename):
+                worlds = shared_fill_worlds(filename)
+                items = {location: location.item for world in worlds for location in world.get_locations()}
+                entrances = {region: list(region.entrances) for world in worlds for region in world.regions}
+                spoiler = Spoiler(worlds)
+                spoiler.create_playthrough()
+                self.assertTrue(spoiler.playthrough)
+                self.assertEqual(items, {location: location.item for world in worlds for location in world.get_locations()})
+                self.assertEqual(entrances, {region: list(region.entrances) for world in worlds for region in world.regions})
+
+
+class TestRuleParser(unittest.TestCase):
+    def test_rule_cache(self):
+        # Worlds built with cached rules must get the same rules as worlds that parsed everything.
+        for filename in graph_test_files:
+            with self.subTest(filename=filename):
+                rules = []
+                for cached in (False, True):
+                    if not cached:
+                        rule_ast_cache.clear()
+                    settings = load_settings(filename, seed='TESTTESTTEST')
+                    resolve_settings(settings)
+                    worlds = build_world_graphs(settings)
+                    # Only the rules compiled by the parser are cached; rules added by Rules.py are made per world.
+                    rules.append({(world.id, spot.name): [rule for rule in spot_rules(spot) if hasattr(rule, 'any_age')]
+                                  for world in worlds for region in world.regions for spot in (*region.exits, *region.locations)})
+                self.assertTrue(rule_ast_cache)
+                self.assertEqual(rules[0].keys(), rules[1].keys())
+                for spot, spot_rule_list in rules[0].items():
+                    self.assertEqual(len(spot_rule_list), len(rules[1][spot]), spot)
+                    for rule, cached_rule in zip(spot_rule_list, rules[1][spot]):
+                        self.assertIs(rule, cached_rule, spot)
+
+    def test_batch_seed_rules(self):
+        # A batch worker must send back the rules it transformed, so the logic cache can be saved with them.
+        rule_ast_cache.clear()
+        settings = load_settings('plentiful.sav', seed='TESTTESTTEST')
+        entry, rules = generate_batch_seed(settings, keep_rules=True)
+        self.assertTrue(entry['success'], entry.get('error'))
+        self.assertTrue(rules)
+        self.assertEqual(rules.keys(), rule_ast_cache.keys())
+
+
+class TestCrc(unittest.TestCase):
+    def test_implementations_match(self):
+        # The bulk implementations must agree with the word at a time loop.
+        rng = random.Random('TESTTESTTEST')
+        implementations = [crc.calculate_crc_array]
+        if crc.numpy is not None:
+            implementations.append(crc.calculate_crc_numpy)
+        for fill in ('random', 'zero', 'ones'):
+            with self.subTest(fill=fill):
+                if fill == 'random':
+                    m1 = bytes(rng.getrandbits(8) for _ in range(0x100000))
+                else:
+                    m1 = (b'\x00' if fill == 'zero' else b'\xFF') * 0x100000
+                m2 = bytes(rng.getrandbits(8) for _ in range(0x100))
+                expected = crc.calculate_crc_loop(m1, m2)
+                for implementation in implementations:
+                    self.assertEqual(expected, implementation(m1, m2), implementation.__name__)
+
+
+class TestRom(unittest.TestCase):
+    def test_changed_ranges(self):
+        # Ranges must cover exactly the written addresses, merged into sorted disjoint ranges.
+        rng = random.Random('TESTTESTTEST')
+        changed_ranges = ChangedRanges()
+        written = set()
+        for _ in range(2000):
+            start = rng.randrange(0, 0x2000)
+            end = start + rng.choice((1, 1, 2, 4, rng.randrange(1, 0x40)))
+            changed_ranges.add(start, end)
+            written.update(range(start, end))
+        covered = set()
+        previous_end = -1
+        for start, end in changed_ranges:
+            self.assertLess(previous_end, start)
+            covered.update(range(start, end))
+            previous_end = end
+        self.assertEqual(written, covered)
+        for address in range(0x2100):
+            self.assertEqual(address in written, address in changed_ranges)
+
+    def test_restore(self):
+        # Restoring only puts back the written ranges, which must leave the whole rom as the original.
+        rng = random.Random('TESTTESTTEST')
+        rom = Rom()
+        rom.buffer = bytearray(rng.getrandbits(8) for _ in range(0x10000))
+        rom.original = rom.copy()
+        for _ in range(3):
+            for _ in range(200):
+                address = rng.randrange(0, 0xFF00)
+                rom.write_bytes(address, rom.buffer[address + 0x40:address + 0x40 + rng.randrange(1, 0x40)])
+                rom.write_int32(rng.randrange(0, 0xFFFC), rng.getrandbits(32))
+            rom.restore()
+            expected = rom.original.copy()
+            expected.write_version_bytes()
+            self.assertEqual(rom.buffer, expected.buffer)
+            self.assertEqual(list(rom.changed_ranges), list(expected.changed_ranges))
+
+    def test_dma_index(self):
+        # Lookups must match scanning the table, through updates, direct writes and restores.
+        rng = random.Random('TESTTESTTEST')
+        rom = Rom()
+        rom.buffer = bytearray(0x400000)
+        entries = 0x40
+        table = [(0, 0x1060), (0x1060, DMADATA_START), (DMADATA_START, DMADATA_START + entries * 0x10)]
+        table += [(0x10000 + i * 0x8000, 0x10000 + i * 0x8000 + rng.randrange(0x10, 0x8000)) for i in range(entries - 3 - 10)]
+        table += [(0, 0)] * 10
+        for index, (start, end) in enumerate(table):
+            rom.write_int32s(DMADATA_START + index * 0x10, [start, end, start, 0])
+        rom.original = rom.copy()
+
+        def scan_by_key(key):
+            for dma_entry in rom.dma:
+                if (key is None and dma_entry.as_tuple() == (0, 0, 0)) or dma_entry.start == key:
+                    return dma_entry.index
+
+        def scan_free_space(size):
+            files = sorted(dma_entry.as_tuple() for dma_entry in rom.dma)
+            free_space = []
+            for i in range(len(files)):
+                end_current = ((files[i][1] + 0x0F) >> 4) << 4
+                start_next = ((files[i + 1][0] + 0x0F) >> 4) << 4 if i + 1 < len(files) else len(rom.buffer)
+                if end_current < start_next:
+                    free_space.append((start_next - end_current, end_current))
+            free_space.sort()
+            if size is None:
+                return free_space[-1][1]
+            return next((start for gap, start in free_space if gap >= size), None)
+
+        for step in range(300):
+            action = rng.randrange(3)
+            if action == 0:
+                start = rng.randrange(0x200000, 0x3F0000) & ~0xF
+                key = rom.dma[rng.randrange(3, entries)].start
+                if rng.random() < 0.5 and scan_by_key(None) is not None:
+                    key = None
+                rom.update_dmadata_record_by_key(key, start, start + rng.randrange(0x10, 0x4000))
+            elif action == 1:
+                index = rng.randrange(3, entries)
+                rom.write_int32(DMADATA_START + index * 0x10 + rng.choice((0, 4)), rng.randrange(0, 0x400000))
+            elif step % 10 == 0:
+                rom.restore()
+            for key in [None, 0, 0x1060, DMADATA_START, rom.dma[rng.randrange(3, entries)].start, rng.randrange(0, 0x400000)]:
+                expected = scan_by_key(key)
+                if expected is None:
+                    self.assertRaises(Exception, rom.dma.get_dmadata_record_by_key, key)
+                else:
+                    self.assertEqual(rom.dma.get_dmadata_record_by_key(key).index, expected)
+            self.assertEqual(rom.dma.end_of_data(), ((max(dma_entry.end for dma_entry in rom.dma) + 0x0F) >> 4) << 4)
+            for size in [None, rng.randrange(0x10, 0x40000)]:
+                expected = scan_free_space(size)
+                if expected is None:
+                    self.assertRaises(Exception, rom.dma.free_space, size)
+                else:
+                    self.assertEqual(rom.dma.free_space(size), expected)
+
+    def test_map_rom(self):
+        # Only full size decompressed roms are mapped, and the mapping can't be written to.
+        rom_file = os.path.join(output_dir, 'map_rom_test.z64')
+        with open(rom_file, 'wb') as stream:
+            stream.truncate(0x4000000)
+            stream.seek(0x10)
+            stream.write(bytes(DECOMPRESSED_CRC))
+        mapped = Rom.map_rom(rom_file)
+        self.assertIsNotNone(mapped)
+        self.assertEqual(len(mapped), 0x4000000)
+        self.assertEqual(list(mapped[0x10:0x18]), DECOMPRESSED_CRC)
+        self.assertTrue(mapped.readonly)
+        mapped.release()
+
+        with open(rom_file, 'r+b') as stream:
+            stream.truncate(0x2000000)
+        self.assertIsNone(Rom.map_rom(rom_file))
+        os.remove(rom_file)
+
+    def test_patch_block_round_trip(self):
+        # Blocks must decode back to their data, with keys matching their bytes and long sections split up.
+        rng = random.Random('TESTTESTTEST')
+        rom = Rom()
+        rom.buffer = bytearray(rng.choice((0, 1, 2, 3)) for _ in range(0x400))
+        rom.original = rom
+        xor_range = (0x100, 0x2FF)
+        for data in (bytearray(rng.choice((0, 1, 2, 3, 0xFF)) for _ in range(0x12000)),
+                     bytearray(0x20000) + bytearray([1]),
+                     bytearray([2]) * 0xFFFF):
+            xor_address = rng.randint(*xor_range)
+            patch_data = BigStream(bytearray())
+            write_block(XorKeyStream(rom, xor_address, xor_range), 0x1000, data, patch_data)
+
+            patch_data.seek_address(0)
+            keys = XorKeyStream(rom, xor_address, xor_range)
+            decoded = bytearray()
+            self.assertEqual(patch_data.read_int32(), 0x1000)
+            while True:
+                block_size = patch_data.read_int16()
+                section = patch_data.read_bytes(length=block_size)
+                decoded += bytes(b and b ^ keys.next() for b in section)
+                if patch_data.eof():
+                    break
+                self.assertEqual(patch_data.read_byte(), 0xFF)
+                keys.skip(patch_data.read_byte())
+            self.assertEqual(decoded, data)
+
+    def test_rom_layer(self):
+        # A captured layer must recreate the same rom changes on a fresh copy of the rom.
+        rng = random.Random('TESTTESTTEST')
+        base = bytearray(rng.getrandbits(8) for _ in range(0x10000))
+        rom = Rom()
+        rom.buffer = bytearray(base)
+        for _ in range(200):
+            address = rng.randrange(0, 0xFF00)
+            rom.write_bytes(address, bytes(rng.getrandbits(8) for _ in range(rng.randrange(1, 0x40))))
+        rom.changed_dma[3] = (-1, 0x1000, 0x200)
+        rom.force_patch.append(0x3E)
+        layer = pickle.loads(pickle.dumps(RomLayer.capture(rom)))
+
+        patched = Rom()
+        patched.buffer = bytearray(base)
+        layer.apply(patched)
+        self.assertEqual(patched.buffer, rom.buffer)
+        self.assertEqual(list(patched.changed_ranges), list(rom.changed_ranges))
+        self.assertEqual(patched.changed_dma, rom.changed_dma)
+        self.assertEqual(patched.force_patch, rom.force_patch)
+
+    def test_static_base_key(self):
+        # The key must follow the original rom, not what was written since, and cover the modules the base is written with.
+        rom = Rom()
+        rom.buffer = bytearray(random.Random('TESTTESTTEST').randbytes(0x10000))
+        rom.original = rom.copy()
+        key = static_base_key(rom)
+        rom.write_bytes(0x100, b'\xFF' * 0x10)
+        self.assertEqual(static_base_key(rom), key)
+        rom.original.buffer = bytearray(rom.original.buffer)
+        rom.original.buffer[0x100] ^= 0xFF
+        self.assertNotEqual(static_base_key(rom), key)
+        sources = {os.path.basename(source) for source in static_base_sources()}
+        self.assertLessEqual({'Patches.py', 'Rom.py', 'MQ.py', 'texture_util.py', 'ntype.py'}, sources)
+
+
 class TestValidSpoilers(unittest.TestCase):
 
     # Normalizes spoiler dict for single world or multiple worlds
@@ -822,6 +1448,18 @@ class TestValidSpoilers(unittest.TestCase):
                     self.verify_playthrough(spoiler)
                     self.verify_disables(spoiler)
 
+    def test_artifact_cache(self):
+        # A seed reused from the artifact cache must output the same logs without generating it again.
+        artifact_cache = os.path.join(output_dir, 'artifact_cache')
+        shutil.rmtree(artifact_cache, ignore_errors=True)
+        logs = []
+        for cached in (False, True):
+            settings = load_settings('plentiful.sav', seed='TESTTESTTEST')
+            self.assertEqual(isinstance(main(settings, artifact_cache=artifact_cache), GenerationArtifacts), cached)
+            with open('%s_Spoiler.json' % settings.output_file) as f:
+                logs.append(f.read())
+        self.assertEqual(logs[0], logs[1])
+
     # remove this to run the fuzzer
     @unittest.skip("generally slow and failures can be ignored")
     def test_fuzzer(self):
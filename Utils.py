@@ -73,6 +73,20 @@ def read_logic_file(file_path: str):
                         "                                   ^^\n")
 
 
+# Parsed logic files by path, with the modification time they were read at.
+logic_file_cache: dict[str, tuple[float, Any]] = {}
+
+
+# Like read_logic_file, but each file is only parsed again once it changes.
+# The result is shared by every caller, so it must not be modified.
+def read_logic_file_cached(file_path: str) -> Any:
+    mtime = os.path.getmtime(file_path)
+    cached = logic_file_cache.get(file_path)
+    if cached is None or cached[0] != mtime:
+        cached = logic_file_cache[file_path] = (mtime, read_logic_file(file_path))
+    return cached[1]
+
+
 def open_file(filename: str) -> None:
     if sys.platform == 'win32':
         os.startfile(filename)
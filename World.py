@@ -1,5 +1,6 @@
 from __future__ import annotations
 import copy
+import itertools
 import json
 import logging
 import os
@@ -19,17 +20,30 @@ from LocationList import business_scrubs, location_groups
 from OcarinaSongs import generate_song_list, Song
 from Plandomizer import WorldDistribution, InvalidFileException
 from Region import Region, TimeOfDay
-from RuleParser import Rule_AST_Transformer
+from RuleParser import Rule_AST_Transformer, logic_fingerprint, spot_reads
 from Settings import Settings
 from SettingsList import SettingInfos, get_settings_from_section
 from Spoiler import Spoiler
 from State import State
-from Utils import data_path, read_logic_file
+from Utils import data_path, read_logic_file_cached
 
 
 class World:
+    # Source of graph_version values, unique across every world.
+    graph_versions: Iterator[int] = itertools.count()
+    # Changes whenever an access rule of any world changes. Copies of a world share its regions,
+    # so a rule change can't be pinned to the one world whose index it affects.
+    rule_versions: Iterator[int] = itertools.count()
+    rules_version: int = next(rule_versions)
+    # Changes whenever an entrance of any world is connected or disconnected, for the same reason.
+    connection_versions: Iterator[int] = itertools.count()
+    connections_version: int = next(connection_versions)
+
     def __init__(self, world_id: int, settings: Settings, resolve_randomized_settings: bool = True) -> None:
         self.id: int = world_id
+        # Changes whenever an entrance connection, item placement or access rule in this world changes,
+        # so results computed from the graph can be cached against it.
+        self.graph_version: int = next(World.graph_versions)
         self.dungeons: list[Dungeon] = []
         self.regions: list[Region] = []
         self.itempool: list[Item] = []
@@ -37,6 +51,9 @@ class World:
         self._entrance_cache: dict[str, Entrance] = {}
         self._region_cache: dict[str, Region] = {}
         self._location_cache: dict[str, Location] = {}
+        self._rule_dependents: Optional[dict[int, tuple[set[Entrance], set[Location]]]] = None
+        self._indexed_spots: set[Entrance | Location] = set()
+        self._indexed_version: Optional[int] = None
         self.shop_prices: dict[str, int] = {}
         self.scrub_prices: dict[int, int] = {}
         self.maximum_wallets: int = 0
@@ -559,8 +576,10 @@ class World:
             self.settings.silver_rupee_pouches = self.silver_rupee_puzzles()
 
     def load_regions_from_json(self, file_path: str) -> list[tuple[Entrance, str]]:
-        region_json = read_logic_file(file_path)
+        region_json = read_logic_file_cached(file_path)
         savewarps_to_connect = []
+        # Worlds with the same fingerprint transform every rule the same way, so they can share the results.
+        self.parser.fingerprint = logic_fingerprint(self)
 
         for region in region_json:
             new_region = Region(self, region['region_name'])
@@ -622,6 +641,7 @@ class World:
                 # the replaced entrance may not exist yet so we connect it after all region files have been read
                 savewarps_to_connect.append((new_exit, region['savewarp']))
             self.regions.append(new_region)
+        self.parser.fingerprint = None
         return savewarps_to_connect
 
     def create_dungeons(self) -> list[tuple[Entrance, str]]:
@@ -1112,6 +1132,9 @@ class World:
             + (['Ganons Castle Shadow Trial', 'Ganons Castle Water Trial'] if self.dungeon_mq['Ganons Castle'] else ['Ganons Castle Spirit Trial', 'Ganons Castle Light Trial', 'Ganons Castle Forest Trial'])
         )
 
+    def graph_changed(self) -> None:
+        self.graph_version = next(World.graph_versions)
+
     def find_items(self, item: str) -> list[Location]:
         return [location for location in self.get_locations() if location.item is not None and location.item.name == item]
 
@@ -1154,6 +1177,37 @@ class World:
     def get_shuffled_entrances(self, type=None, only_primary=False) -> list[Entrance]:
         return [entrance for entrance in self.get_shufflable_entrances(type=type, only_primary=only_primary) if entrance.shuffled]
 
+    # Access rules read state, so searches skipping spots by the rule index must know when they change.
+    def rule_changed(self) -> None:
+        self.graph_changed()
+        World.rules_version = next(World.rule_versions)
+
+    # Searches that keep up with item placements by themselves start over when entrances are reconnected.
+    def connection_changed(self) -> None:
+        self.graph_changed()
+        World.connections_version = next(World.connection_versions)
+
+    # Maps each solver id to the entrances and locations whose access rules read it.
+    # Built on first use, and again after any access rule changes.
+    def get_rule_dependents(self) -> dict[int, tuple[set[Entrance], set[Location]]]:
+        if self._rule_dependents is None or self._indexed_version != World.rules_version:
+            self._rule_dependents = defaultdict(lambda: (set(), set()))
+            self._indexed_spots = set()
+            self._indexed_version = World.rules_version
+            for region in self.regions:
+                for spot in (*region.exits, *region.locations):
+                    reads = spot_reads(spot)
+                    if reads is None:
+                        continue
+                    self._indexed_spots.add(spot)
+                    for item_id in reads:
+                        self._rule_dependents[item_id][isinstance(spot, Location)].add(spot)
+        return self._rule_dependents
+
+    # Whether the index is up to date and knows every solver id the spot's access rule reads.
+    def is_rule_indexed(self, spot: Entrance | Location) -> bool:
+        return self._indexed_version == World.rules_version and spot in self._indexed_spots
+
     def region_has_shortcuts(self, region_name: str) -> bool:
         region = self.get_region(region_name)
         dungeon_name = HintArea.at(region).dungeon_name
@@ -1,38 +1,144 @@
+from __future__ import annotations
+import functools
 import itertools
+import operator
+import sys
+from array import array
 
 from ntype import uint32, BigStream
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
-def calculate_crc(data: BigStream) -> bytearray:
-    t1 = t2 = t3 = t4 = t5 = t6 = 0xDF26F436
+CRC_SEED: int = 0xDF26F436
+U32: int = 0xFFFFFFFF
 
-    u32 = 0xFFFFFFFF
 
+def calculate_crc(data: BigStream) -> bytearray:
     m1 = data.read_bytes(0x1000, 0x100000)
-    words = map(uint32.value, zip(m1[0::4], m1[1::4], m1[2::4], m1[3::4]))
-
     m2 = data.read_bytes(0x750, 0x100)
+    if numpy is not None:
+        return calculate_crc_numpy(m1, m2)
+    return calculate_crc_array(m1, m2)
+
+
+# The checksum is a handful of sums and xors over the big endian words, plus t2,
+# which depends on its own previous value and has to be computed one word at a time.
+# Everything else is computed in bulk, so the loop only does the t2 step.
+def calculate_crc_array(m1: bytes | bytearray, m2: bytes | bytearray) -> bytearray:
+    words = array('I', m1)
+    words2 = array('I', m2)
+    if sys.byteorder == 'little':
+        words.byteswap()
+        words2.byteswap()
+
+    # t6 is the running sum, and t4 counts the times it overflowed.
+    total = CRC_SEED + sum(words)
+    t6 = total & U32
+    t4 = CRC_SEED + (total >> 32)
+    t3 = functools.reduce(operator.xor, words, CRC_SEED)
+    t1 = CRC_SEED + sum(map(operator.xor, words, itertools.cycle(words2)))
+
+    t2 = t5 = CRC_SEED
+    running_sums = itertools.accumulate(words, initial=CRC_SEED)
+    next(running_sums)
+    for d, running_sum in zip(words, running_sums):
+        shift = d & 0x1F
+        r = ((d << shift) | (d >> (32 - shift))) & U32
+        t5 += r
+        if t2 > d:
+            t2 ^= r
+        else:
+            t2 ^= (running_sum & U32) ^ d
+
+    crc0 = (t6 ^ t4 ^ t3) & U32
+    crc1 = (t5 ^ t2 ^ t1) & U32
+    return uint32.bytes(crc0) + uint32.bytes(crc1)
+
+
+# Same as calculate_crc_array, with the rotations, running sums and the
+# values t2 can be xored with computed as arrays.
+def calculate_crc_numpy(m1: bytes | bytearray, m2: bytes | bytearray) -> bytearray:
+    words = numpy.frombuffer(m1, dtype='>u4').astype(numpy.uint64)
+    words2 = numpy.resize(numpy.frombuffer(m2, dtype='>u4').astype(numpy.uint64), words.shape)
+
+    # 0x40000 words of at most 32 bits each can't overflow 64 bits.
+    running_sums = numpy.cumsum(words) + CRC_SEED
+    total = int(running_sums[-1])
+    t6 = total & U32
+    t4 = CRC_SEED + (total >> 32)
+    t3 = CRC_SEED ^ int(numpy.bitwise_xor.reduce(words))
+    t1 = CRC_SEED + int(numpy.sum(words ^ words2))
+
+    shifts = words & 0x1F
+    rotations = ((words << shifts) | (words >> (32 - shifts))) & U32
+    t5 = CRC_SEED + int(numpy.sum(rotations))
+
+    t2 = CRC_SEED
+    for d, r, x in zip(words.tolist(), rotations.tolist(), ((running_sums & U32) ^ words).tolist()):
+        if t2 > d:
+            t2 ^= r
+        else:
+            t2 ^= x
+
+    crc0 = (t6 ^ t4 ^ t3) & U32
+    crc1 = (t5 ^ t2 ^ t1) & U32
+    return uint32.bytes(crc0) + uint32.bytes(crc1)
+
+
+# The original word at a time implementation, kept as the reference for the ones above.
+def calculate_crc_loop(m1: bytes | bytearray, m2: bytes | bytearray) -> bytearray:
+    t1 = t2 = t3 = t4 = t5 = t6 = CRC_SEED
+
+    words = map(uint32.value, zip(m1[0::4], m1[1::4], m1[2::4], m1[3::4]))
     words2 = map(uint32.value, zip(m2[0::4], m2[1::4], m2[2::4], m2[3::4]))
 
     for d, d2 in zip(words, itertools.cycle(words2)):
         # keep t2 and t6 in u32 for comparisons; others can wait to be truncated
-        if ((t6 + d) & u32) < t6:
+        if ((t6 + d) & U32) < t6:
             t4 += 1
 
-        t6 = (t6+d) & u32
+        t6 = (t6+d) & U32
         t3 ^= d
         shift = d & 0x1F
         r = ((d << shift) | (d >> (32 - shift)))
         t5 += r
 
         if t2 > d:
-            t2 ^= r & u32
+            t2 ^= r & U32
         else:
             t2 ^= t6 ^ d
 
         t1 += d2 ^ d
 
-    crc0 = (t6 ^ t4 ^ t3) & u32
-    crc1 = (t5 ^ t2 ^ t1) & u32
+    crc0 = (t6 ^ t4 ^ t3) & U32
+    crc1 = (t5 ^ t2 ^ t1) & U32
 
     return uint32.bytes(crc0) + uint32.bytes(crc1)
+
+
+# Compares the implementations on a rom, or on random data if none is given:
+#   python crc.py [rom]
+if __name__ == '__main__':
+    import os
+    import timeit
+
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'rb') as stream:
+            rom_data = BigStream(bytearray(stream.read()))
+    else:
+        rom_data = BigStream(bytearray(os.urandom(0x101000)))
+    m1 = rom_data.read_bytes(0x1000, 0x100000)
+    m2 = rom_data.read_bytes(0x750, 0x100)
+
+    implementations = {'loop': calculate_crc_loop, 'array': calculate_crc_array}
+    if numpy is not None:
+        implementations['numpy'] = calculate_crc_numpy
+    expected = calculate_crc_loop(m1, m2)
+    for name, implementation in implementations.items():
+        if implementation(m1, m2) != expected:
+            raise Exception(f'{name} CRC does not match the reference')
+        seconds = min(timeit.repeat(lambda: implementation(m1, m2), number=1, repeat=5))
+        print(f'{name:>6}: {seconds * 1000:.1f} ms')
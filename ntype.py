@@ -216,9 +216,7 @@ class BigStream:
         self.append_bytes(struct.pack('>f', value))
 
     def append_bytes(self, values: Sequence[int]) -> None:
-        value: int
-        for value in values:
-            self.append_byte(value)
+        self.buffer.extend(values)
 
     def append_int16s(self, values: Sequence[int]) -> None:
         value: int